@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from config import settings
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPTransport:
+    """Shared async HTTP clients, one keep-alive connection pool per provider.
+
+    Provider clients call `client(name)` instead of opening a connection per
+    request. Pools negotiate HTTP/2 when `h2` is installed and use explicit
+    connect/read/write/pool timeouts. A pool is rebuilt if it was created on
+    a different event loop (its connections would be unusable).
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        write_timeout: float = 10.0,
+        pool_timeout: float = 5.0,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+    ):
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=write_timeout,
+            pool=pool_timeout,
+        )
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._clients: Dict[
+            str, Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]
+        ] = {}
+
+    def client(self, provider: str) -> httpx.AsyncClient:
+        """Pooled client for a provider (e.g. "replicate", "huggingface", "ibm")"""
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(provider)
+        if entry is not None and entry[1] is loop and not entry[0].is_closed:
+            return entry[0]
+
+        client = httpx.AsyncClient(
+            timeout=self.timeout, limits=self.limits, http2=HTTP2_AVAILABLE
+        )
+        self._clients[provider] = (client, loop)
+        logger.info(f"Opened HTTP pool for {provider} (http2={HTTP2_AVAILABLE})")
+        return client
+
+    async def close(self) -> None:
+        """Close every pool (called on shutdown)"""
+        clients, self._clients = self._clients, {}
+        for provider, (client, loop) in clients.items():
+            if loop is asyncio.get_running_loop():
+                await client.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get transport configuration and open pools"""
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "pools": sorted(self._clients),
+            "timeouts": {"connect": self.timeout.connect, "read": self.timeout.read},
+            "max_connections": self.limits.max_connections,
+        }
+
+
+# Global instance
+http_transport = HTTPTransport(
+    connect_timeout=settings.http_connect_timeout,
+    read_timeout=settings.http_read_timeout,
+    write_timeout=settings.http_write_timeout,
+    pool_timeout=settings.http_pool_timeout,
+    max_connections=settings.http_max_connections,
+    max_keepalive_connections=settings.http_max_keepalive_connections,
+    keepalive_expiry=settings.http_keepalive_expiry,
+)
@@ -1,255 +1,366 @@
-import requests
 import json
-from typing import Dict, List, Optional, Any
-from config import settings
 import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from ai_models.http_transport import http_transport
+from ai_models.sse import iter_sse_events
+from config import settings
+from services.bulkhead import ProviderOverloaded, bulkheads
+from services.circuit_breaker import CircuitOpenError, circuit_breakers
+from services.hoax_screening import (
+    ZERO_SHOT_LABELS,
+    ZERO_SHOT_MODEL,
+    zero_shot_prompt,
+    zero_shot_verdict,
+)
 
 logger = logging.getLogger(__name__)
 
+
 class HuggingFaceClient:
     """Client for interacting with Hugging Face models"""
-    
+
     def __init__(self):
         self.api_token = settings.huggingface_api_token
         self.headers = {
             "Authorization": f"Bearer {self.api_token}",
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
         }
         self.base_url = "https://api-inference.huggingface.co/models"
-    
-    async def query_model(self, model_name: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        self.sentiment_model = "nlptown/bert-base-multilingual-uncased-sentiment"
+
+    async def query_model(
+        self, model_name: str, payload: Dict[str, Any]
+    ) -> Dict[str, Any]:
         """Generic method to query any Hugging Face model"""
         url = f"{self.base_url}/{model_name}"
-        
+
+        bulkhead = bulkheads.get("huggingface")
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
+            async with bulkhead.slot(self.api_token), circuit_breakers.get(
+                f"huggingface:{model_name}"
+            ).guard():
+                response = await http_transport.client("huggingface").post(
+                    url, headers=self.headers, json=payload
+                )
+                bulkhead.note_response(response)
+                response.raise_for_status()
+                return response.json()
+        except httpx.HTTPError as e:
             logger.error(f"Error querying model {model_name}: {str(e)}")
             raise Exception(f"Failed to query model: {str(e)}")
-    
-    async def generate_chat_response(self, 
-                                   message: str, 
-                                   context: Optional[str] = None,
-                                   model: str = None) -> Dict[str, Any]:
+
+    async def generate_chat_response(
+        self, message: str, context: Optional[str] = None, model: str = None
+    ) -> Dict[str, Any]:
         """Generate chatbot response using language model"""
         model_name = model or settings.default_llm_model
-        
-        # Enhanced prompt for general-purpose AI assistant
-        system_prompt = """Anda adalah asisten AI yang cerdas dan ramah bernama Asisten Wira. 
-Anda dapat membantu dengan berbagai pertanyaan dan topik, tidak hanya terbatas pada bisnis UMKM.
 
-Kemampuan Anda:
-- Menjawab pertanyaan umum seperti ChatGPT atau Gemini
-- Memberikan informasi yang akurat dan up-to-date
-- Membantu dengan pertanyaan bisnis, teknologi, pendidikan, dan topik lainnya
-- Berkomunikasi dalam Bahasa Indonesia yang ramah dan profesional
-- Jika tidak tahu jawaban, akui dengan jujur dan berikan saran alternatif
+        full_prompt = self._build_chat_prompt(message, context)
 
-"""
-        
-        context_text = f"Konteks tambahan: {context}\n\n" if context else ""
-        
-        # Enhanced prompt format
-        full_prompt = f"{system_prompt}{context_text}Pengguna: {message}\n\nAsisten Wira:"
+        payload = self._build_chat_payload(full_prompt)
 
-        payload = {
-            "inputs": full_prompt,
-            "parameters": {
-                "max_new_tokens": 300,  # Increased for more detailed responses
-                "temperature": 0.8,     # Slightly higher for more creative responses
-                "do_sample": True,
-                "return_full_text": False,
-                "top_p": 0.9,
-                "repetition_penalty": 1.1
-            }
-        }
-        
         try:
             result = await self.query_model(model_name, payload)
-            
+
             if isinstance(result, list) and len(result) > 0:
                 response_text = result[0].get("generated_text", "").strip()
-                
+
                 # Clean up the response - remove the prompt part
                 if "Asisten Wira:" in response_text:
                     response_text = response_text.split("Asisten Wira:")[-1].strip()
                 elif "Jawaban:" in response_text:
                     response_text = response_text.split("Jawaban:")[-1].strip()
-                
+
                 # Remove any remaining prompt artifacts
                 response_text = response_text.replace(full_prompt, "").strip()
-                
+
                 # If response is too short, try with fallback model
-                if len(response_text) < 20 and model_name != settings.fallback_llm_model:
-                    logger.info(f"Response too short, trying fallback model: {settings.fallback_llm_model}")
-                    return await self.generate_chat_response(message, context, settings.fallback_llm_model)
-                
+                if (
+                    len(response_text) < 20
+                    and model_name != settings.fallback_llm_model
+                ):
+                    logger.info(
+                        f"Response too short, trying fallback model: {settings.fallback_llm_model}"
+                    )
+                    return await self.generate_chat_response(
+                        message, context, settings.fallback_llm_model
+                    )
+
                 return {
                     "response": response_text,
                     "confidence": 0.85,
                     "model_used": model_name,
-                    "is_general_response": True  # Indicates this is a general-purpose response
+                    "is_general_response": True,  # Indicates this is a general-purpose response
                 }
             else:
                 return {
                     "response": "Maaf, saya tidak dapat memproses pertanyaan Anda saat ini. Silakan coba lagi.",
                     "confidence": 0.0,
                     "model_used": model_name,
-                    "error": "No results returned"
+                    "error": "No results returned",
                 }
-                
+
+        except ProviderOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Error generating chat response: {str(e)}")
             # Try fallback model if available
             if model_name != settings.fallback_llm_model:
                 try:
-                    logger.info(f"Trying fallback model due to error: {settings.fallback_llm_model}")
-                    return await self.generate_chat_response(message, context, settings.fallback_llm_model)
+                    logger.info(
+                        f"Trying fallback model due to error: {settings.fallback_llm_model}"
+                    )
+                    return await self.generate_chat_response(
+                        message, context, settings.fallback_llm_model
+                    )
+                except (ProviderOverloaded, CircuitOpenError):
+                    raise
                 except Exception as fallback_error:
                     logger.error(f"Fallback model also failed: {str(fallback_error)}")
-            
+            if isinstance(e, CircuitOpenError):
+                raise  # every model's circuit is open: skip the provider, it did not fail now
+
             return {
                 "response": "Maaf, terjadi kesalahan sistem. Tim teknis kami sedang memperbaiki masalah ini.",
                 "confidence": 0.0,
                 "model_used": model_name,
-                "error": str(e)
+                "error": str(e),
             }
-    
+
+    def _build_chat_prompt(self, message: str, context: Optional[str] = None) -> str:
+        """Build the assistant prompt for a chat message"""
+        # Enhanced prompt for general-purpose AI assistant
+        system_prompt = """Anda adalah asisten AI yang cerdas dan ramah bernama Asisten Wira. 
+Anda dapat membantu dengan berbagai pertanyaan dan topik, tidak hanya terbatas pada bisnis UMKM.
+
+Kemampuan Anda:
+- Menjawab pertanyaan umum seperti ChatGPT atau Gemini
+- Memberikan informasi yang akurat dan up-to-date
+- Membantu dengan pertanyaan bisnis, teknologi, pendidikan, dan topik lainnya
+- Berkomunikasi dalam Bahasa Indonesia yang ramah dan profesional
+- Jika tidak tahu jawaban, akui dengan jujur dan berikan saran alternatif
+
+"""
+
+        context_text = f"Konteks tambahan: {context}\n\n" if context else ""
+
+        # Enhanced prompt format
+        full_prompt = (
+            f"{system_prompt}{context_text}Pengguna: {message}\n\nAsisten Wira:"
+        )
+        return full_prompt
+
+    def _build_chat_payload(
+        self, full_prompt: str, stream: bool = False
+    ) -> Dict[str, Any]:
+        """Build text-generation payload for a chat prompt"""
+        payload = {
+            "inputs": full_prompt,
+            "parameters": {
+                "max_new_tokens": 300,  # Increased for more detailed responses
+                "temperature": 0.8,  # Slightly higher for more creative responses
+                "do_sample": True,
+                "return_full_text": False,
+                "top_p": 0.9,
+                "repetition_penalty": 1.1,
+            },
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    async def stream_chat_response(
+        self, message: str, context: Optional[str] = None, model: str = None
+    ) -> AsyncIterator[str]:
+        """Stream chatbot response token by token (text-generation `stream` mode)"""
+        model_name = model or settings.default_llm_model
+        url = f"{self.base_url}/{model_name}"
+        payload = self._build_chat_payload(
+            self._build_chat_prompt(message, context), stream=True
+        )
+
+        client = http_transport.client("huggingface")
+        bulkhead = bulkheads.get("huggingface")
+        async with bulkhead.slot(self.api_token), circuit_breakers.get(
+            f"huggingface:{model_name}"
+        ).guard():
+            async with client.stream(
+                "POST", url, headers=self.headers, json=payload
+            ) as response:
+                bulkhead.note_response(response)
+                response.raise_for_status()
+                async for _, data in iter_sse_events(response):
+                    event = json.loads(data)
+                    if event.get("error"):
+                        raise Exception(
+                            f"Streaming error from {model_name}: {event['error']}"
+                        )
+                    token = event.get("token") or {}
+                    if token.get("text") and not token.get("special"):
+                        yield token["text"]
+
     async def detect_hoax(self, text: str) -> Dict[str, Any]:
         """Detect if text contains hoax/misinformation"""
         # For demonstration, we'll use a classification model
         # In practice, you'd use a specialized hoax detection model
-        
+
         payload = {
-            "inputs": f"Classify this text as hoax or not hoax: {text}",
-            "parameters": {
-                "candidate_labels": ["hoax", "not hoax", "misinformation", "factual"]
-            }
+            "inputs": zero_shot_prompt(text),
+            "parameters": {"candidate_labels": ZERO_SHOT_LABELS},
         }
-        
+
         try:
             # Using zero-shot classification for demonstration
-            model_name = "facebook/bart-large-mnli"
-            result = await self.query_model(model_name, payload)
-            
-            if "labels" in result and "scores" in result:
-                labels = result["labels"]
-                scores = result["scores"]
-                
-                # Check if "hoax" or "misinformation" has high confidence
-                hoax_score = 0.0
-                for i, label in enumerate(labels):
-                    if label.lower() in ["hoax", "misinformation"]:
-                        hoax_score = max(hoax_score, scores[i])
-                
-                is_hoax = hoax_score > 0.6
-                
-                return {
-                    "is_hoax": is_hoax,
-                    "confidence": hoax_score,
-                    "explanation": f"Analisis AI menunjukkan tingkat kepercayaan {hoax_score:.2%} bahwa teks ini mengandung misinformasi." if is_hoax else "Teks ini tampaknya tidak mengandung misinformasi berdasarkan analisis AI.",
-                    "details": {
-                        "labels": labels,
-                        "scores": scores
-                    }
-                }
-            else:
-                return {
-                    "is_hoax": False,
-                    "confidence": 0.5,
-                    "explanation": "Tidak dapat menganalisis teks secara menyeluruh. Silakan verifikasi secara manual.",
-                    "details": result
-                }
-                
+            result = await self.query_model(ZERO_SHOT_MODEL, payload)
+            return zero_shot_verdict(result)
+
+        except (ProviderOverloaded, CircuitOpenError):
+            raise
         except Exception as e:
             logger.error(f"Error in hoax detection: {str(e)}")
             return {
                 "is_hoax": False,
                 "confidence": 0.0,
                 "explanation": f"Terjadi kesalahan saat menganalisis: {str(e)}",
-                "error": str(e)
+                "error": str(e),
             }
-    
-    async def analyze_sentiment(self, text: str) -> Dict[str, Any]:
-        """Analyze sentiment of text"""
-        
+
+    async def detect_hoax_batch(self, texts: List[str]) -> Dict[str, Any]:
+        """Zero-shot hoax classification of several texts in one request"""
         payload = {
-            "inputs": text
+            "inputs": [zero_shot_prompt(text) for text in texts],
+            "parameters": {"candidate_labels": ZERO_SHOT_LABELS},
+            "options": {"wait_for_model": True},
         }
-        
+
         try:
-            # Use Indonesian sentiment analysis model if available
-            model_name = "nlptown/bert-base-multilingual-uncased-sentiment"
-            result = await self.query_model(model_name, payload)
-            
-            if isinstance(result, list) and len(result) > 0:
-                sentiment_data = result[0]
-                
-                # Map sentiment labels to Indonesian
-                sentiment_mapping = {
-                    "POSITIVE": "positive",
-                    "NEGATIVE": "negative", 
-                    "NEUTRAL": "neutral",
-                    "1 star": "negative",
-                    "2 stars": "negative",
-                    "3 stars": "neutral",
-                    "4 stars": "positive",
-                    "5 stars": "positive"
-                }
-                
-                if isinstance(sentiment_data, list):
-                    # Sort by score and get the highest
-                    sentiment_data.sort(key=lambda x: x.get("score", 0), reverse=True)
-                    top_sentiment = sentiment_data[0]
-                    
-                    original_label = top_sentiment.get("label", "NEUTRAL")
-                    sentiment = sentiment_mapping.get(original_label, "neutral")
-                    confidence = top_sentiment.get("score", 0.5)
-                    
-                else:
-                    sentiment = "neutral"
-                    confidence = 0.5
-                
-                # Generate emotion breakdown (simplified)
-                emotions = {
-                    "joy": 0.8 if sentiment == "positive" else 0.2,
-                    "trust": 0.7 if sentiment == "positive" else 0.3,
-                    "anticipation": 0.4,
-                    "surprise": 0.2,
-                    "fear": 0.1 if sentiment == "positive" else 0.6,
-                    "sadness": 0.1 if sentiment == "positive" else 0.7,
-                    "disgust": 0.1 if sentiment == "positive" else 0.5,
-                    "anger": 0.1 if sentiment == "positive" else 0.6
-                }
-                
+            result = await self.query_model(ZERO_SHOT_MODEL, payload)
+            if isinstance(result, dict):
+                result = [result]
+            if not isinstance(result, list) or len(result) != len(texts):
                 return {
-                    "sentiment": sentiment,
-                    "confidence": confidence,
-                    "emotions": emotions,
-                    "raw_result": result
+                    "error": f"Expected {len(texts)} results, got {len(result) if isinstance(result, list) else type(result).__name__}"
                 }
+            return {"results": [zero_shot_verdict(item) for item in result]}
+        except (ProviderOverloaded, CircuitOpenError):
+            raise
+        except Exception as e:
+            logger.error(f"Error in batch hoax detection: {str(e)}")
+            return {"error": str(e)}
+
+    async def analyze_sentiment(self, text: str) -> Dict[str, Any]:
+        """Analyze sentiment of text"""
+
+        payload = {"inputs": text}
+
+        try:
+            # Use Indonesian sentiment analysis model if available
+            result = await self.query_model(self.sentiment_model, payload)
+
+            if isinstance(result, list) and len(result) > 0:
+                return {**self._parse_sentiment(result[0]), "raw_result": result}
             else:
                 return {
                     "sentiment": "neutral",
                     "confidence": 0.5,
                     "emotions": {
-                        "joy": 0.4, "trust": 0.4, "anticipation": 0.4,
-                        "surprise": 0.2, "fear": 0.3, "sadness": 0.3,
-                        "disgust": 0.2, "anger": 0.2
+                        "joy": 0.4,
+                        "trust": 0.4,
+                        "anticipation": 0.4,
+                        "surprise": 0.2,
+                        "fear": 0.3,
+                        "sadness": 0.3,
+                        "disgust": 0.2,
+                        "anger": 0.2,
                     },
-                    "raw_result": result
+                    "raw_result": result,
                 }
-                
+
+        except (ProviderOverloaded, CircuitOpenError):
+            raise
         except Exception as e:
             logger.error(f"Error in sentiment analysis: {str(e)}")
             return {
                 "sentiment": "neutral",
                 "confidence": 0.0,
                 "emotions": {},
-                "error": str(e)
+                "error": str(e),
             }
 
+    async def analyze_sentiment_batch(self, texts: List[str]) -> Dict[str, Any]:
+        """Analyze sentiment of several texts in one request (the API accepts a list of inputs)"""
+        payload = {"inputs": texts, "options": {"wait_for_model": True}}
+
+        try:
+            result = await self.query_model(self.sentiment_model, payload)
+            if not isinstance(result, list) or len(result) != len(texts):
+                return {
+                    "error": f"Expected {len(texts)} results, got {len(result) if isinstance(result, list) else type(result).__name__}"
+                }
+            return {"results": [self._parse_sentiment(item) for item in result]}
+        except (ProviderOverloaded, CircuitOpenError):
+            raise
+        except Exception as e:
+            logger.error(f"Error in batch sentiment analysis: {str(e)}")
+            return {"error": str(e)}
+
+    def _parse_sentiment(self, sentiment_data: Any) -> Dict[str, Any]:
+        """Map one input's label scores to sentiment, confidence and emotions"""
+        # Map sentiment labels to Indonesian
+        sentiment_mapping = {
+            "POSITIVE": "positive",
+            "NEGATIVE": "negative",
+            "NEUTRAL": "neutral",
+            "1 star": "negative",
+            "2 stars": "negative",
+            "3 stars": "neutral",
+            "4 stars": "positive",
+            "5 stars": "positive",
+        }
+
+        if isinstance(sentiment_data, dict):
+            sentiment_data = [sentiment_data]
+        if isinstance(sentiment_data, list) and sentiment_data:
+            # Highest score wins
+            top_sentiment = max(sentiment_data, key=lambda x: x.get("score", 0))
+
+            original_label = top_sentiment.get("label", "NEUTRAL")
+            sentiment = sentiment_mapping.get(original_label, "neutral")
+            confidence = top_sentiment.get("score", 0.5)
+
+        else:
+            sentiment = "neutral"
+            confidence = 0.5
+
+        # Generate emotion breakdown (simplified)
+        emotions = {
+            "joy": 0.8 if sentiment == "positive" else 0.2,
+            "trust": 0.7 if sentiment == "positive" else 0.3,
+            "anticipation": 0.4,
+            "surprise": 0.2,
+            "fear": 0.1 if sentiment == "positive" else 0.6,
+            "sadness": 0.1 if sentiment == "positive" else 0.7,
+            "disgust": 0.1 if sentiment == "positive" else 0.5,
+            "anger": 0.1 if sentiment == "positive" else 0.6,
+        }
+
+        return {"sentiment": sentiment, "confidence": confidence, "emotions": emotions}
+
+    async def generate_embeddings(
+        self, texts: List[str], model: str = None
+    ) -> List[List[float]]:
+        """Generate sentence embeddings (feature-extraction) for a batch of texts"""
+        model_name = model or settings.embedding_model
+        payload = {"inputs": texts, "options": {"wait_for_model": True}}
+
+        result = await self.query_model(model_name, payload)
+        if not isinstance(result, list) or len(result) != len(texts):
+            raise Exception(f"Unexpected embedding response from {model_name}")
+        return result
+
+
 # Global instance
 huggingface_client = HuggingFaceClient()
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from ai_models.http_transport import http_transport
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class IAMTokenManager:
+    """Cached IBM Cloud IAM bearer token.
+
+    The token is stored together with its expiry (`expires_in`). Callers get
+    the cached token until `refresh_margin` seconds before it expires; from
+    then on a background task has usually replaced it already. Concurrent
+    callers that need a new token share one IAM request (single flight).
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        iam_url: str = "https://iam.cloud.ibm.com/identity/token",
+        refresh_margin: float = 300.0,
+    ):
+        self.api_key = api_key
+        self.iam_url = iam_url
+        self.refresh_margin = refresh_margin
+
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._inflight: Optional[asyncio.Task] = None
+        self._refresher: Optional[asyncio.Task] = None
+
+        self.stats = {
+            "refreshes": 0,
+            "background_refreshes": 0,
+            "coalesced": 0,
+            "unauthorized_retries": 0,
+            "failures": 0,
+        }
+
+    async def get_token(self) -> str:
+        """Current access token, fetched only if missing or about to expire"""
+        if self._token and time.time() < self._expires_at - self.refresh_margin:
+            return self._token
+        if self._token and time.time() < self._expires_at:
+            # Still valid: refresh behind the caller's back
+            self._start_refresh()
+            return self._token
+        return await self.refresh()
+
+    async def refresh(self) -> str:
+        """Fetch a new token; concurrent callers await the same request"""
+        if self._inflight is not None and not self._inflight.done():
+            self.stats["coalesced"] += 1
+        else:
+            self._start_refresh()
+        return await asyncio.shield(self._inflight)
+
+    def invalidate(self, token: Optional[str] = None) -> None:
+        """Drop the cached token (e.g. after a 401), unless it was already replaced"""
+        if token is None or token == self._token:
+            self._token = None
+            self._expires_at = 0.0
+
+    async def request(
+        self, client: httpx.AsyncClient, method: str, url: str, **kwargs
+    ) -> httpx.Response:
+        """Send an authorized request, retrying once with a fresh token on 401"""
+        headers = dict(kwargs.pop("headers", None) or {})
+        token = await self.get_token()
+        headers["Authorization"] = f"Bearer {token}"
+        response = await client.request(method, url, headers=headers, **kwargs)
+
+        if response.status_code == 401:
+            self.stats["unauthorized_retries"] += 1
+            self.invalidate(token)
+            headers["Authorization"] = f"Bearer {await self.refresh()}"
+            response = await client.request(method, url, headers=headers, **kwargs)
+        return response
+
+    def _start_refresh(self) -> None:
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.get_running_loop().create_task(self._fetch())
+            self._inflight.add_done_callback(self._refresh_done)
+
+    def _refresh_done(self, task: asyncio.Task) -> None:
+        # Background refreshes have no caller awaiting them, so every failure is logged and counted here
+        if task.cancelled() or task.exception() is None:
+            return
+        self.stats["failures"] += 1
+        logger.error(f"Error getting IBM access token: {str(task.exception())}")
+
+    async def _fetch(self) -> str:
+        if not self.api_key:
+            raise Exception("IBM API key not configured")
+
+        data = {
+            "grant_type": "urn:iam:params:oauth:grant-type:apikey",
+            "apikey": self.api_key,
+        }
+        try:
+            response = await http_transport.client("ibm_iam").post(
+                self.iam_url,
+                headers={
+                    "Content-Type": "application/x-www-form-urlencoded",
+                    "Accept": "application/json",
+                },
+                data=data,
+            )
+            response.raise_for_status()
+            token_data = response.json()
+        except httpx.HTTPError as e:
+            raise Exception(f"Failed to authenticate with IBM: {str(e)}")
+
+        self._token = token_data["access_token"]
+        if token_data.get("expiration"):
+            self._expires_at = float(token_data["expiration"])
+        else:
+            self._expires_at = time.time() + float(token_data.get("expires_in", 3600))
+        self.stats["refreshes"] += 1
+        self._schedule_background_refresh()
+        return self._token
+
+    def _schedule_background_refresh(self) -> None:
+        if self._refresher is not None and not self._refresher.done():
+            self._refresher.cancel()
+        self._refresher = asyncio.get_running_loop().create_task(
+            self._refresh_before_expiry()
+        )
+
+    async def _refresh_before_expiry(self) -> None:
+        await asyncio.sleep(
+            max(self._expires_at - self.refresh_margin - time.time(), 1.0)
+        )
+        self.stats["background_refreshes"] += 1
+        try:
+            self._refresher = None  # the new fetch schedules the next one
+            await self.refresh()
+        except Exception:
+            # Logged and counted by _refresh_done; the cached token stays usable
+            # until it expires and callers retry then
+            pass
+
+    async def stop(self) -> None:
+        """Cancel the background refresh (called on shutdown)"""
+        for task in (self._refresher, self._inflight):
+            if task is not None and not task.done():
+                task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get token statistics"""
+        return {
+            **self.stats,
+            "has_token": self._token is not None,
+            "expires_in": (
+                round(self._expires_at - time.time()) if self._token else None
+            ),
+        }
+
+
+# Global instance
+ibm_token_manager = IAMTokenManager(
+    settings.ibm_orchestrate_api_key, refresh_margin=settings.ibm_token_refresh_margin
+)
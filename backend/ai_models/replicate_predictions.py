@@ -0,0 +1,374 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from ai_models.http_transport import http_transport
+from config import settings
+from services.bulkhead import ProviderOverloaded, bulkheads
+from services.circuit_breaker import CircuitOpenError, circuit_breakers
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed", "canceled")
+
+# Time left after the "Prefer: wait" window for the creation response to arrive
+SYNC_WAIT_MARGIN = 5.0
+
+
+def output_text(output: Any) -> str:
+    """Replicate returns text output as a list of tokens or a single string"""
+    if output is None:
+        return ""
+    if isinstance(output, list):
+        return "".join(str(part) for part in output).strip()
+    return str(output).strip()
+
+
+class _PendingPrediction:
+    __slots__ = ("id", "get_url", "future", "interval", "next_poll_at")
+
+    def __init__(
+        self,
+        prediction_id: str,
+        get_url: str,
+        future: asyncio.Future,
+        first_poll_delay: float,
+        interval: float,
+    ):
+        self.id = prediction_id
+        self.get_url = get_url
+        self.future = future
+        self.interval = interval
+        self.next_poll_at = time.monotonic() + first_poll_delay
+
+
+class ReplicatePredictionManager:
+    """Runs Replicate predictions with as little dead latency as possible.
+
+    1. Predictions are created with `Prefer: wait`, so most finish within
+       the creation request. The wait stays well below the caller's
+       per-attempt timeout (`call_timeout`), so the creation response, and
+       with it the prediction id needed to poll or cancel, always arrives.
+    2. Unfinished ones are registered as pending futures. If a public webhook
+       URL is configured, Replicate's completion callback resolves them.
+    3. A single poller task checks every pending prediction with per-item
+       adaptive backoff, as a safety net and as the only mechanism without a
+       webhook.
+
+    Webhooks are only used with a signing secret; unsigned callbacks are
+    rejected.
+    """
+
+    def __init__(
+        self,
+        api_token: str,
+        base_url: str = "https://api.replicate.com/v1",
+        sync_wait: int = 30,
+        call_timeout: Optional[float] = None,
+        webhook_url: str = "",
+        webhook_secret: str = "",
+        poll_initial_interval: float = 0.25,
+        poll_max_interval: float = 5.0,
+        poll_backoff: float = 1.5,
+        max_wait: float = 120.0,
+    ):
+        self.api_token = api_token
+        self.base_url = base_url
+        if call_timeout is not None and sync_wait > call_timeout - SYNC_WAIT_MARGIN:
+            sync_wait = int(call_timeout - SYNC_WAIT_MARGIN)
+            logger.warning(
+                f"Replicate sync wait lowered to {sync_wait}s to fit the {call_timeout}s provider call timeout"
+            )
+        self.sync_wait = max(1, min(sync_wait, 60))  # Replicate accepts 1-60 seconds
+        if webhook_url and not webhook_secret:
+            logger.error(
+                "Replicate webhook URL configured without a signing secret; webhooks disabled, using polling"
+            )
+            webhook_url = ""
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.poll_initial_interval = poll_initial_interval
+        self.poll_max_interval = poll_max_interval
+        self.poll_backoff = poll_backoff
+        self.max_wait = max_wait
+
+        self._pending: Dict[str, _PendingPrediction] = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.stats = {
+            "created": 0,
+            "completed_sync": 0,
+            "completed_webhook": 0,
+            "completed_polling": 0,
+            "polls": 0,
+            "timeouts": 0,
+        }
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Token {self.api_token}",
+            "Content-Type": "application/json",
+        }
+
+    async def run(
+        self, model: str, input_data: Dict[str, Any], max_wait: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Run a prediction to completion.
+
+        `model` is either "owner/name:version" (or a bare version id) or an
+        official model name "owner/name", which goes through the models
+        endpoint. Returns {"success", "output", "metrics"} or {"success": False, "error"};
+        raises ProviderOverloaded or CircuitOpenError if the call is refused locally.
+        """
+        if not self.api_token:
+            return {"success": False, "error": "Replicate API token not configured"}
+
+        breaker = circuit_breakers.get(f"replicate:{model.split(':', 1)[0]}")
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {breaker.name}")
+
+        try:
+            # The slot is held until the prediction finishes, so it bounds predictions in flight
+            async with bulkheads.get("replicate").slot(self.api_token):
+                result = await self._run(model, input_data, max_wait or self.max_wait)
+        except ProviderOverloaded:
+            breaker.release()
+            raise
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        if result["success"]:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        return result
+
+    async def _run(
+        self, model: str, input_data: Dict[str, Any], max_wait: float
+    ) -> Dict[str, Any]:
+        deadline = time.monotonic() + max_wait
+
+        try:
+            prediction = await self._create(model, input_data)
+        except httpx.HTTPError as e:
+            logger.error(f"Error creating Replicate prediction: {str(e)}")
+            return {"success": False, "error": f"Failed to run model: {str(e)}"}
+
+        self.stats["created"] += 1
+        if prediction.get("status") in TERMINAL_STATUSES:
+            self.stats["completed_sync"] += 1
+            return self._result(prediction)
+
+        future = asyncio.get_running_loop().create_future()
+        # With a webhook, polling is only a late safety net
+        first_poll_delay = (
+            self.poll_max_interval if self.webhook_url else self.poll_initial_interval
+        )
+        pending = _PendingPrediction(
+            prediction["id"],
+            prediction.get("urls", {}).get("get")
+            or f"{self.base_url}/predictions/{prediction['id']}",
+            future,
+            first_poll_delay,
+            self.poll_initial_interval,
+        )
+        self._register(pending)
+
+        try:
+            prediction = await asyncio.wait_for(
+                asyncio.shield(future), max(deadline - time.monotonic(), 0.1)
+            )
+            return self._result(prediction)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            await self._cancel(prediction)
+            return {"success": False, "error": "Prediction timed out"}
+        except asyncio.CancelledError:
+            # The caller gave up (e.g. per-provider timeout); stop paying for the prediction
+            asyncio.get_running_loop().create_task(self._cancel(prediction))
+            raise
+        finally:
+            self._pending.pop(pending.id, None)
+
+    def prediction_request(
+        self, model: str, input_data: Dict[str, Any]
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Creation URL and body for a model reference (version id or official model name)"""
+        if ":" in model or "/" not in model:
+            return f"{self.base_url}/predictions", {
+                "version": model.split(":", 1)[-1],
+                "input": input_data,
+            }
+        return f"{self.base_url}/models/{model}/predictions", {"input": input_data}
+
+    async def _create(self, model: str, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        headers = {**self.headers, "Prefer": f"wait={self.sync_wait}"}
+        url, payload = self.prediction_request(model, input_data)
+        if self.webhook_url:
+            payload["webhook"] = self.webhook_url
+            payload["webhook_events_filter"] = ["completed"]
+
+        # Leave room for the server-side wait on top of the normal read timeout
+        timeout = httpx.Timeout(
+            http_transport.timeout.read + self.sync_wait,
+            connect=http_transport.timeout.connect,
+        )
+        response = await http_transport.client("replicate").post(
+            url, headers=headers, json=payload, timeout=timeout
+        )
+        bulkheads.get("replicate").note_response(response)
+        response.raise_for_status()
+        return response.json()
+
+    def _register(self, pending: _PendingPrediction) -> None:
+        self._pending[pending.id] = pending
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll_loop())
+
+    async def _poll_loop(self) -> None:
+        """Single task polling every pending prediction when it is due"""
+        while self._pending:
+            now = time.monotonic()
+            due = [
+                p
+                for p in self._pending.values()
+                if p.next_poll_at <= now and not p.future.done()
+            ]
+            if due:
+                await asyncio.gather(*(self._poll_one(p) for p in due))
+
+            live = [
+                p.next_poll_at for p in self._pending.values() if not p.future.done()
+            ]
+            if not live:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), max(min(live) - time.monotonic(), 0.0)
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll_one(self, pending: _PendingPrediction) -> None:
+        self.stats["polls"] += 1
+        try:
+            response = await http_transport.client("replicate").get(
+                pending.get_url, headers=self.headers
+            )
+            response.raise_for_status()
+            prediction = response.json()
+            if prediction.get("status") in TERMINAL_STATUSES:
+                if not pending.future.done():
+                    self.stats["completed_polling"] += 1
+                    pending.future.set_result(prediction)
+                return
+        except httpx.HTTPError as e:
+            logger.warning(f"Error polling prediction {pending.id}: {str(e)}")
+
+        pending.interval = min(
+            pending.interval * self.poll_backoff, self.poll_max_interval
+        )
+        pending.next_poll_at = time.monotonic() + pending.interval
+
+    async def _cancel(self, prediction: Dict[str, Any]) -> None:
+        cancel_url = prediction.get("urls", {}).get("cancel")
+        if not cancel_url:
+            return
+        try:
+            await http_transport.client("replicate").post(
+                cancel_url, headers=self.headers
+            )
+        except httpx.HTTPError as e:
+            logger.warning(
+                f"Failed to cancel prediction {prediction.get('id')}: {str(e)}"
+            )
+
+    def handle_webhook(self, prediction: Dict[str, Any]) -> bool:
+        """Resolve a waiting prediction from a webhook payload; True if one was waiting"""
+        pending = self._pending.get(prediction.get("id"))
+        if (
+            pending is None
+            or pending.future.done()
+            or prediction.get("status") not in TERMINAL_STATUSES
+        ):
+            return False
+        self.stats["completed_webhook"] += 1
+        pending.future.set_result(prediction)
+        return True
+
+    def verify_webhook(
+        self, headers: Dict[str, str], body: bytes, tolerance: float = 300.0
+    ) -> bool:
+        """Check Replicate's webhook signature (webhook-id/-timestamp/-signature headers)"""
+        if not self.webhook_secret:
+            return False  # webhooks are disabled without a secret
+
+        webhook_id = headers.get("webhook-id")
+        timestamp = headers.get("webhook-timestamp")
+        signatures = headers.get("webhook-signature")
+        if not webhook_id or not timestamp or not signatures:
+            return False
+        try:
+            if abs(time.time() - int(timestamp)) > tolerance:
+                return False
+        except ValueError:
+            return False
+
+        secret = base64.b64decode(self.webhook_secret.split("_", 1)[-1])
+        signed = f"{webhook_id}.{timestamp}.".encode("utf-8") + body
+        expected = base64.b64encode(
+            hmac.new(secret, signed, hashlib.sha256).digest()
+        ).decode("utf-8")
+        return any(
+            hmac.compare_digest(expected, signature.split(",", 1)[-1])
+            for signature in signatures.split()
+        )
+
+    def _result(self, prediction: Dict[str, Any]) -> Dict[str, Any]:
+        if prediction.get("status") == "succeeded":
+            return {
+                "success": True,
+                "output": prediction.get("output"),
+                "metrics": prediction.get("metrics", {}),
+            }
+        return {
+            "success": False,
+            "error": prediction.get("error")
+            or f"Prediction {prediction.get('status', 'failed')}",
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get prediction statistics"""
+        return {
+            **self.stats,
+            "pending": len(self._pending),
+            "webhook": bool(self.webhook_url),
+        }
+
+
+# Global instance
+replicate_predictions = ReplicatePredictionManager(
+    settings.replicate_api_token,
+    sync_wait=settings.replicate_sync_wait,
+    call_timeout=settings.provider_call_timeout,
+    webhook_url=settings.replicate_webhook_url,
+    webhook_secret=settings.replicate_webhook_secret,
+    poll_initial_interval=settings.replicate_poll_initial_interval,
+    poll_max_interval=settings.replicate_poll_max_interval,
+    max_wait=settings.replicate_max_wait,
+)
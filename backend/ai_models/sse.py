@@ -0,0 +1,33 @@
+from typing import AsyncIterator, Tuple
+
+import httpx
+
+
+async def iter_sse_events(response: httpx.Response) -> AsyncIterator[Tuple[str, str]]:
+    """Parse a Server-Sent-Events response into (event, data) pairs"""
+    event = "message"
+    data_lines = []
+
+    async for line in response.aiter_lines():
+        if not line:
+            # Blank line terminates the current event
+            if data_lines:
+                yield event, "\n".join(data_lines)
+            event = "message"
+            data_lines = []
+            continue
+
+        if line.startswith(":"):
+            continue  # comment / keep-alive
+
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+
+        if field == "event":
+            event = value
+        elif field == "data":
+            data_lines.append(value)
+
+    if data_lines:
+        yield event, "\n".join(data_lines)
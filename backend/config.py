@@ -1,55 +1,235 @@
 import os
-from typing import List
+from typing import Dict, List
+
 from pydantic_settings import BaseSettings
 
+
 class Settings(BaseSettings):
     # Application Settings
     app_name: str = "Asisten Wira API"
     environment: str = "development"
     debug: bool = True
     port: int = 8000
-    
+
     # Supabase Configuration
     supabase_url: str = os.getenv("SUPABASE_URL", "your_supabase_url_here")
-    supabase_anon_key: str = os.getenv("SUPABASE_ANON_KEY", "your_supabase_anon_key_here")
-    supabase_service_role_key: str = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "your_supabase_service_role_key_here")
-    
+    supabase_anon_key: str = os.getenv(
+        "SUPABASE_ANON_KEY", "your_supabase_anon_key_here"
+    )
+    supabase_service_role_key: str = os.getenv(
+        "SUPABASE_SERVICE_ROLE_KEY", "your_supabase_service_role_key_here"
+    )
+
     # IBM Orchestrate Configuration
-    ibm_orchestrate_api_key: str = os.getenv("IBM_ORCHESTRATE_API_KEY", "your_ibm_orchestrate_api_key_here")
-    ibm_orchestrate_base_url: str = os.getenv("IBM_ORCHESTRATE_BASE_URL", "your_ibm_orchestrate_base_url_here")
-    
+    ibm_orchestrate_api_key: str = os.getenv(
+        "IBM_ORCHESTRATE_API_KEY", "your_ibm_orchestrate_api_key_here"
+    )  # IBM Cloud IAM API key, exchanged for bearer tokens
+    ibm_orchestrate_base_url: str = os.getenv(
+        "IBM_ORCHESTRATE_BASE_URL", "your_ibm_orchestrate_base_url_here"
+    )
+    ibm_token_refresh_margin: float = (
+        300.0  # refresh the IAM token this many seconds before expiry
+    )
+
     # Hugging Face Configuration
-    huggingface_api_token: str = os.getenv("HUGGINGFACE_API_TOKEN", "your_huggingface_api_token_here")
-    
+    huggingface_api_token: str = os.getenv(
+        "HUGGINGFACE_API_TOKEN", "your_huggingface_api_token_here"
+    )
+
     # Replicate Configuration
-    replicate_api_token: str = os.getenv("REPLICATE_API_TOKEN", "your_replicate_api_token_here")
-    
+    replicate_api_token: str = os.getenv(
+        "REPLICATE_API_TOKEN", "your_replicate_api_token_here"
+    )
+    replicate_sync_wait: int = (
+        10  # seconds to block in "Prefer: wait" prediction creation (max 60, kept below provider_call_timeout)
+    )
+    replicate_webhook_url: str = (
+        ""  # public URL of /webhooks/replicate; empty disables webhooks
+    )
+    replicate_webhook_secret: str = (
+        ""  # "whsec_..." signing secret, required for webhooks
+    )
+    replicate_poll_initial_interval: float = 0.25
+    replicate_poll_max_interval: float = 5.0
+    replicate_max_wait: float = 120.0
+
     # Security
-    jwt_secret_key: str = os.getenv("JWT_SECRET_KEY", "your-super-secret-jwt-key-change-this")
+    jwt_secret_key: str = os.getenv(
+        "JWT_SECRET_KEY", "your-super-secret-jwt-key-change-this"
+    )
     jwt_algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
-    
+
     # CORS
     cors_origins: List[str] = [
         "http://localhost:3000",
-        "https://asisten-wira.vercel.app"
+        "https://asisten-wira.vercel.app",
     ]
-    
+
     # File Upload
     max_upload_size: int = 10 * 1024 * 1024  # 10MB
     allowed_file_types: List[str] = ["pdf", "txt", "csv", "docx"]
-    
+    upload_spool_max_memory: int = (
+        1024 * 1024
+    )  # uploads beyond 1MB spool to a temp file
+    ingestion_batch_size: int = 64  # chunks per bulk insert / embedding batch
+    ingestion_max_concurrent_jobs: int = 2
+    ingestion_max_jobs: int = 500  # finished jobs kept for status polling
+
     # AI Models Configuration
-    default_llm_model: str = "openai/gpt-oss-20b"  # More generative model for general questions
+    default_llm_model: str = (
+        "openai/gpt-oss-20b"  # More generative model for general questions
+    )
     fallback_llm_model: str = "google/flan-t5-base"  # Fallback for specific tasks
     hoax_detection_model: str = "indobenchmark/indobert-base-p2"
     sentiment_analysis_model: str = "indobenchmark/indobert-base-p2"
-    
+
     # Additional models for different use cases
     general_chat_model: str = "openai/gpt-oss-20b"  # For general conversations
     business_chat_model: str = "google/flan-t5-base"  # For business-specific questions
-    
+
+    # Provider Routing (adaptive order by EWMA latency / rolling success rate)
+    router_ewma_alpha: float = 0.3
+    router_window: int = 50  # calls per provider in the rolling success rate
+    router_recovery_after: float = (
+        120.0  # seconds without samples before a provider is re-scored from its prior
+    )
+    router_prior_latency: float = (
+        2.0  # assumed seconds for the first provider before any data
+    )
+    provider_call_timeout: float = (
+        15.0  # per provider attempt, so a hung provider still leaves time to fall through
+    )
+
+    # Circuit Breakers (per provider and per provider:model)
+    circuit_failure_threshold: int = 5  # consecutive failures that open the circuit
+    circuit_recovery_timeout: float = 30.0  # seconds open before probing again
+    circuit_half_open_max_calls: int = 1  # concurrent probe calls while half-open
+    circuit_success_threshold: int = 1  # successful probes needed to close
+
+    # Provider Bulkheads (per-provider concurrency limit, queue and rate limit)
+    request_deadline: float = (
+        30.0  # provider calls that cannot start within this get a 503
+    )
+    provider_max_concurrency: int = 8  # calls in flight per provider
+    provider_max_queue: int = 32  # callers waiting per provider
+    provider_queue_timeout: float = 10.0  # longest wait for a slot outside a request
+    provider_rate_per_key: float = 0.0  # requests/second per API key (0 = unlimited)
+    provider_rate_burst: int = 10
+
+    # Hedged Chat Requests (start the next provider/model when the current one is slow)
+    chat_hedging_enabled: bool = False
+    hedge_percentile: float = (
+        90.0  # hedge after this percentile of the attempt's recent latency
+    )
+    hedge_min_samples: int = 20  # successful calls needed before the percentile is used
+    hedge_initial_delay: float = 8.0  # hedge delay while there are fewer samples
+    hedge_max_extra: int = 1  # extra attempts in flight at once
+    hedge_budget_ratio: float = 0.2  # at most this fraction of requests may hedge
+
+    # Provider HTTP Transport (shared keep-alive pools)
+    http_connect_timeout: float = 5.0
+    http_read_timeout: float = 60.0
+    http_write_timeout: float = 10.0
+    http_pool_timeout: float = 5.0  # wait for a free pooled connection
+    http_max_connections: int = 20  # per provider
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry: float = 30.0
+
+    # Chat Pipeline Deadlines (seconds per stage)
+    chat_knowledge_timeout: float = 3.0
+    chat_generation_timeout: float = 30.0
+    chat_analysis_timeout: float = 8.0
+
+    # Batch Analysis (/ai/*/batch endpoints)
+    batch_max_bytes: int = 10 * 1024 * 1024  # 10MB request body
+    batch_max_items: int = 10000
+    sentiment_batch_size: int = 16  # texts per provider request
+    hoax_batch_size: int = 8  # ambiguous messages per zero-shot request
+    batch_concurrency: int = 4  # micro-batches in flight per request
+    batch_fallback_concurrency: int = (
+        1  # single-text provider calls in flight per micro-batch when no provider takes the whole batch
+    )
+    batch_overload_retries: int = (
+        3  # waits for Retry-After before a micro-batch gives up
+    )
+
+    # Keyword Scans (hoax indicators, sentiment words, chat hoax triggers)
+    lexicon_dir: str = (
+        "data/lexicons"  # *.txt keyword lists, relative paths from the backend directory
+    )
+    keyword_negation_window: int = 2  # words before a keyword checked for a negation
+
+    # Local-First Classification (answer confident sentiment/hoax cases in-process)
+    local_classifier_enabled: bool = True
+    local_sentiment_model: str = (
+        "data/models/sentiment_linear.json"  # relative paths from the backend directory
+    )
+    local_hoax_model: str = "data/models/hoax_linear.json"
+    local_sentiment_threshold: float = (
+        0.85  # local answer when its probability reaches this, else remote
+    )
+    local_hoax_threshold: float = 0.9
+
+    # Conversation Logging (write-behind buffer)
+    conversation_log_queue_size: int = 10000
+    conversation_log_batch_size: int = 100
+    conversation_log_flush_interval: float = 2.0  # seconds
+    conversation_log_enqueue_timeout: float = 1.0  # seconds before writing directly
+
+    # Chatbot counters (total_conversations, knowledge_base_size)
+    counter_flush_interval: float = 5.0  # seconds
+
+    # Knowledge Base Cache
+    knowledge_cache_max_bytes: int = 64 * 1024 * 1024  # 64MB
+    knowledge_cache_ttl: float = 300.0  # seconds
+
+    # Chat Response Cache (exact repeats of a question to the same chatbot)
+    response_cache_backend: str = (
+        "memory"  # "memory" (per worker) or "sqlite" (shared by workers on the host)
+    )
+    response_cache_path: str = "data/response_cache.sqlite3"
+    response_cache_max_bytes: int = 32 * 1024 * 1024  # 32MB
+    response_cache_ttl: float = 3600.0  # seconds; 0 disables
+    response_cache_chatbot_ttls: Dict[str, float] = (
+        {}
+    )  # per-chatbot TTL overrides, e.g. {"<chatbot id>": 60}
+
+    # Semantic Answer Cache (rephrased questions to the same chatbot)
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = (
+        0.95  # cosine similarity between questions to reuse an answer (numbers, sizes and negations must also match)
+    )
+    semantic_cache_ttl: float = 3600.0  # seconds
+    semantic_cache_max_entries: int = 500  # answered questions kept per chatbot
+    semantic_cache_timeout: float = (
+        1.0  # seconds for the lookup (knowledge stamp + question embedding); a timeout counts as a miss
+    )
+
+    # Knowledge Retrieval
+    knowledge_retrieval_mode: str = "hybrid"  # "hybrid", "vector" or "lexical" (BM25)
+    knowledge_candidate_pool: int = 20  # candidates per retriever before fusion
+    knowledge_rrf_k: int = 60
+    knowledge_rerank_enabled: bool = True
+    knowledge_rerank_budget_ms: float = 5.0
+    embedding_backend: str = "local"  # "local" (feature hashing) or "huggingface"
+    embedding_model: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    embedding_dim: int = 256  # local embedder only
+    embedding_batch_size: int = 32
+    knowledge_index_max_chatbots: int = 256
+    knowledge_index_dir: str = (
+        "data/knowledge_indexes"  # memory-mapped index files; empty disables persistence
+    )
+    knowledge_chunk_tokens: int = 400  # target chunk size (approximate subword tokens)
+    knowledge_chunk_overlap: int = (
+        50  # tokens shared by consecutive chunks of a paragraph
+    )
+    knowledge_min_score: float = 0.05
+    chat_context_items: int = 3
+    chat_context_max_chars: int = 3000
+
     class Config:
         env_file = ".env"
 
+
 settings = Settings()
@@ -85,6 +85,8 @@ CREATE TABLE file_uploads (
     storage_path TEXT,
     processing_status TEXT DEFAULT 'pending' CHECK (processing_status IN ('pending', 'processing', 'completed', 'failed')),
     extracted_content TEXT,
+    chunks_created INTEGER DEFAULT 0,
+    error TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     processed_at TIMESTAMP WITH TIME ZONE
 );
@@ -179,6 +181,24 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
+-- Atomic counter increments (used by the backend counter aggregator)
+CREATE OR REPLACE FUNCTION increment_chatbot_counters(
+    p_chatbot_id UUID,
+    p_conversations INTEGER DEFAULT 0,
+    p_knowledge_items INTEGER DEFAULT 0
+)
+RETURNS VOID AS $$
+BEGIN
+    UPDATE chatbots
+    SET total_conversations = COALESCE(total_conversations, 0) + p_conversations,
+        knowledge_base_size = GREATEST(COALESCE(knowledge_base_size, 0) + p_knowledge_items, 0)
+    WHERE id = p_chatbot_id;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+REVOKE ALL ON FUNCTION increment_chatbot_counters(UUID, INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION increment_chatbot_counters(UUID, INTEGER, INTEGER) TO service_role;
+
 -- Create triggers for updated_at
 CREATE TRIGGER update_profiles_updated_at BEFORE UPDATE ON profiles 
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
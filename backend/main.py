@@ -1,22 +1,62 @@
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-import os
-from dotenv import load_dotenv
+import json
 import logging
+import os
+from typing import Any, Dict, List, Optional
+
 import uvicorn
+from dotenv import load_dotenv
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pydantic import BaseModel
+
+from config import settings
 from services.supabase_service import supabase_service
+
 # Use lightweight AI service for Railway deployment
 try:
     from services.ai_service_railway import AIServiceRailway
+
     ai_service = AIServiceRailway()
     print("Using lightweight AI service for Railway deployment")
 except ImportError:
     from services.ai_service import ai_service
+
     print("Using full AI service with local ML packages")
-from services.auth_service import get_current_user_id, get_current_user_info
+from ai_models.http_transport import http_transport
+from ai_models.ibm_token_manager import ibm_token_manager
+from ai_models.replicate_predictions import replicate_predictions
+from services.auth_service import (
+    get_current_user_id,
+    get_current_user_info,
+    get_verified_user_id,
+)
+from services.batch_analysis import (
+    BatchInputError,
+    BatchTooLarge,
+    analyze_batches,
+    ndjson_line,
+    parse_batch_items,
+    read_batch_body,
+    scan_hoaxes,
+)
+from services.bulkhead import ProviderOverloaded, begin_request
+from services.chat_pipeline import ChatPipeline
+from services.conversation_log_writer import conversation_log_writer
+from services.ingestion import (
+    UnsupportedFileType,
+    UploadTooLarge,
+    ingestion_manager,
+    receive_upload,
+)
+from services.knowledge_index import knowledge_index
+from services.response_cache import response_cache
+from services.semantic_cache import semantic_cache
+from services.single_flight import flight_key, single_flight
+
+# Staged chat pipeline (retrieval/generation alongside sentiment and hoax analysis)
+chat_pipeline = ChatPipeline(ai_service, supabase_service, conversation_log_writer)
 
 # Load environment variables
 load_dotenv()
@@ -25,7 +65,7 @@ load_dotenv()
 app = FastAPI(
     title="Asisten Wira API",
     description="AI Chatbot Builder API untuk UMKM Indonesia",
-    version="1.0.0"
+    version="1.0.0",
 )
 
 # Configure CORS
@@ -37,15 +77,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def provider_deadline(request: Request, call_next):
+    """Give provider calls made for this request a shared deadline"""
+    begin_request(settings.request_deadline)
+    return await call_next(request)
+
+
+@app.exception_handler(ProviderOverloaded)
+async def provider_overloaded_handler(request: Request, exc: ProviderOverloaded):
+    """Providers are saturated: ask the client to come back instead of queueing past the deadline"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Layanan AI sedang sibuk. Silakan coba lagi sebentar lagi."},
+        headers={"Retry-After": str(int(exc.retry_after + 0.999))},
+    )
+
+
 # Security
 security = HTTPBearer()
 
+
+async def get_chatbot_owner_id(
+    chatbot_id: str, user_id: str = Depends(get_verified_user_id)
+) -> str:
+    """Dependency: the verified user, if the path's chatbot belongs to them"""
+    if not await supabase_service.is_chatbot_owner(chatbot_id, user_id):
+        raise HTTPException(status_code=404, detail="Chatbot not found")
+    return user_id
+
+
 # Pydantic models
 class ChatbotCreate(BaseModel):
     name: str
     description: Optional[str] = None
     industry: Optional[str] = None
 
+
 class ChatbotResponse(BaseModel):
     id: str
     name: str
@@ -55,121 +124,151 @@ class ChatbotResponse(BaseModel):
     knowledge_base_size: int
     deployment_url: Optional[str]
 
+
 class KnowledgeBaseItem(BaseModel):
     content: str
     source: Optional[str] = None
     category: Optional[str] = None
 
+
 class ChatMessage(BaseModel):
     message: str
     chatbot_id: str
 
+
 class ChatResponse(BaseModel):
     response: str
     confidence: float
     sentiment: Optional[str] = None
     is_hoax_detected: Optional[bool] = None
 
+
 class HoaxAnalysis(BaseModel):
     text: str
     is_hoax: bool
     confidence: float
     explanation: str
 
+
 class SentimentAnalysis(BaseModel):
     text: str
     sentiment: str  # positive, negative, neutral
     confidence: float
     emotions: Dict[str, float]
 
+
 # Logging setup
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+@app.on_event("startup")
+async def startup_event():
+    """Start background writers"""
+    await conversation_log_writer.start()
+    await supabase_service.counters.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Drain background writers before the worker exits"""
+    await ingestion_manager.stop()
+    await conversation_log_writer.stop()
+    # Conversation flushes add counter deltas, so counters drain last
+    await supabase_service.counters.stop()
+    # Finish pending knowledge index writes
+    await knowledge_index.wait_for_background_tasks()
+    # Close provider connection pools
+    await ibm_token_manager.stop()
+    await http_transport.close()
+
+
 @app.get("/")
 async def root():
-    return {
-        "message": "Asisten Wira API",
-        "version": "1.0.0",
-        "status": "active"
-    }
+    return {"message": "Asisten Wira API", "version": "1.0.0", "status": "active"}
+
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "asisten-wira-api"}
 
+
 @app.get("/ai/status")
 async def get_ai_status():
     """Get AI services status and configuration"""
-    return ai_service.get_status()
+    return {
+        **ai_service.get_status(),
+        "single_flight": single_flight.get_stats(),
+        "response_cache": response_cache.get_stats(),
+        "semantic_cache": semantic_cache.get_stats(),
+    }
+
 
 # Authentication endpoints
 @app.post("/auth/register")
 async def register_user(
-    email: str, 
-    password: str, 
+    email: str,
+    password: str,
     full_name: str,
     business_name: Optional[str] = None,
-    industry: Optional[str] = None
+    industry: Optional[str] = None,
 ):
     """Register new user"""
     try:
         metadata = {
             "full_name": full_name,
             "business_name": business_name,
-            "industry": industry
+            "industry": industry,
         }
-        
+
         result = await supabase_service.create_user(email, password, metadata)
-        
+
         if result["success"]:
-            return {
-                "message": "User registered successfully",
-                "user": result["user"]
-            }
+            return {"message": "User registered successfully", "user": result["user"]}
         else:
             raise HTTPException(status_code=400, detail=result["error"])
-            
+
     except Exception as e:
         logger.error(f"Registration error: {str(e)}")
         raise HTTPException(status_code=400, detail="Registration failed")
 
+
 @app.post("/auth/login")
 async def login_user(email: str, password: str):
     """Authenticate user and return JWT token"""
     try:
         result = await supabase_service.authenticate_user(email, password)
-        
+
         if result["success"]:
             return {
                 "access_token": result["session"]["access_token"],
                 "token_type": "bearer",
                 "user": result["user"],
-                "expires_at": result["session"]["expires_at"]
+                "expires_at": result["session"]["expires_at"],
             }
         else:
             raise HTTPException(status_code=401, detail=result["error"])
-            
+
     except Exception as e:
         logger.error(f"Login error: {str(e)}")
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+
 # Chatbot management endpoints
 @app.post("/chatbots", response_model=ChatbotResponse)
 async def create_chatbot(
-    chatbot: ChatbotCreate,
-    user_id: str = Depends(get_current_user_id)
+    chatbot: ChatbotCreate, user_id: str = Depends(get_current_user_id)
 ):
     """Create a new chatbot"""
     try:
         chatbot_data = {
             "name": chatbot.name,
             "description": chatbot.description,
-            "industry": chatbot.industry
+            "industry": chatbot.industry,
         }
-        
+
         result = await supabase_service.create_chatbot(user_id, chatbot_data)
-        
+
         if result["success"]:
             data = result["data"]
             return ChatbotResponse(
@@ -179,18 +278,19 @@ async def create_chatbot(
                 industry=data["industry"],
                 created_at=data["created_at"],
                 knowledge_base_size=data["knowledge_base_size"],
-                deployment_url=data.get("deployment_url")
+                deployment_url=data.get("deployment_url"),
             )
         else:
             raise HTTPException(status_code=400, detail=result["error"])
-            
+
     except Exception as e:
         logger.error(f"Chatbot creation error: {str(e)}")
         raise HTTPException(status_code=400, detail="Failed to create chatbot")
 
+
 @app.get("/chatbots", response_model=List[ChatbotResponse])
 async def get_user_chatbots(
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
 ):
     """Get all chatbots for authenticated user"""
     try:
@@ -200,10 +300,10 @@ async def get_user_chatbots(
         logger.error(f"Error fetching chatbots: {str(e)}")
         raise HTTPException(status_code=400, detail="Failed to fetch chatbots")
 
+
 @app.get("/chatbots/{chatbot_id}", response_model=ChatbotResponse)
 async def get_chatbot(
-    chatbot_id: str,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    chatbot_id: str, credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
     """Get specific chatbot details"""
     try:
@@ -215,143 +315,254 @@ async def get_chatbot(
             industry="Retail",
             created_at="2024-01-01T00:00:00Z",
             knowledge_base_size=10,
-            deployment_url="https://example.com/chatbot/embed.js"
+            deployment_url="https://example.com/chatbot/embed.js",
         )
     except Exception as e:
         logger.error(f"Error fetching chatbot: {str(e)}")
         raise HTTPException(status_code=404, detail="Chatbot not found")
 
+
 # Knowledge base management
 @app.post("/chatbots/{chatbot_id}/knowledge")
 async def add_knowledge_base_item(
     chatbot_id: str,
     item: KnowledgeBaseItem,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    user_id: str = Depends(get_chatbot_owner_id),
 ):
     """Add item to chatbot knowledge base"""
     try:
-        # TODO: Implement knowledge base storage with vector embeddings
-        return {"message": "Knowledge base item added successfully"}
+        result = await supabase_service.add_knowledge_item(
+            chatbot_id, item.content, item.source, item.category
+        )
+
+        if not result["success"]:
+            raise HTTPException(status_code=400, detail=result["error"])
+
+        # Index the new item and persist the chatbot's index file
+        knowledge_index.schedule_refresh(chatbot_id)
+
+        return {
+            "message": "Knowledge base item added successfully",
+            "item": result["data"],
+        }
     except Exception as e:
         logger.error(f"Error adding knowledge base item: {str(e)}")
         raise HTTPException(status_code=400, detail="Failed to add knowledge base item")
 
-@app.post("/chatbots/{chatbot_id}/knowledge/upload")
+
+@app.post("/chatbots/{chatbot_id}/knowledge/upload", status_code=202)
 async def upload_knowledge_file(
-    chatbot_id: str,
-    file: UploadFile = File(...),
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    chatbot_id: str, request: Request, user_id: str = Depends(get_chatbot_owner_id)
 ):
-    """Upload file to chatbot knowledge base"""
+    """Upload file to chatbot knowledge base (multipart field "file"); processed in the background"""
     try:
-        # TODO: Implement file processing and knowledge extraction
-        content = await file.read()
+        upload = await receive_upload(request, settings.max_upload_size)
+        try:
+            job = await ingestion_manager.submit(chatbot_id, user_id, upload)
+        except Exception:
+            upload.file.close()
+            raise
+
         return {
-            "message": "File uploaded and processed successfully",
-            "filename": file.filename,
-            "size": len(content)
+            "message": "File uploaded, processing started",
+            "job_id": job.id,
+            "status": job.status,
+            "filename": upload.filename,
+            "size": upload.size,
+            "status_url": f"/chatbots/{chatbot_id}/knowledge/jobs/{job.id}",
         }
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnsupportedFileType as e:
+        raise HTTPException(status_code=415, detail=str(e))
     except Exception as e:
         logger.error(f"Error uploading file: {str(e)}")
         raise HTTPException(status_code=400, detail="Failed to upload file")
 
+
+@app.get("/chatbots/{chatbot_id}/knowledge/jobs/{job_id}")
+async def get_knowledge_upload_job(
+    chatbot_id: str, job_id: str, user_id: str = Depends(get_chatbot_owner_id)
+):
+    """Get the processing status of a knowledge file upload"""
+    job = await ingestion_manager.get_job(job_id)
+    if job is None or job.chatbot_id != chatbot_id:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job.to_dict()
+
+
 # Chat endpoints
 @app.post("/chat", response_model=ChatResponse)
 async def chat_with_bot(message: ChatMessage):
     """Send message to chatbot and get response"""
     try:
-        # Get chatbot context from knowledge base
-        knowledge_items = await supabase_service.get_knowledge_base(message.chatbot_id)
-        context = ""
-        if knowledge_items["success"] and knowledge_items["data"]:
-            # Use first few items as context (in production, use vector search)
-            context_items = knowledge_items["data"][:3]
-            context = "\n".join([item["content"] for item in context_items])
-        
-        # Generate AI response
-        ai_response = await ai_service.generate_chat_response(
-            message.message, 
-            context, 
-            message.chatbot_id
-        )
-        
-        # Analyze sentiment
-        sentiment_result = await ai_service.analyze_sentiment(message.message)
-        
-        # Check for hoax (if message contains links or suspicious claims)
-        hoax_result = None
-        if "http" in message.message.lower() or any(word in message.message.lower() for word in ["gratis", "menang", "jutaan"]):
-            hoax_result = await ai_service.detect_hoax(message.message)
-        
-        # Log conversation
-        conversation_metadata = {
-            "sentiment": sentiment_result.get("sentiment"),
-            "confidence": ai_response.get("confidence"),
-            "is_hoax_detected": hoax_result.get("is_hoax") if hoax_result else False
-        }
-        
-        await supabase_service.log_conversation(
-            message.chatbot_id,
-            message.message,
-            ai_response["response"],
-            conversation_metadata
-        )
-        
+        result = await chat_pipeline.run(message.message, message.chatbot_id)
+
         return ChatResponse(
-            response=ai_response["response"],
-            confidence=ai_response.get("confidence", 0.7),
-            sentiment=sentiment_result.get("sentiment"),
-            is_hoax_detected=hoax_result.get("is_hoax") if hoax_result else False
+            response=result["response"],
+            confidence=result["confidence"],
+            sentiment=result["sentiment"],
+            is_hoax_detected=result["is_hoax_detected"],
         )
-        
+
+    except ProviderOverloaded:
+        raise
     except Exception as e:
         logger.error(f"Chat error: {str(e)}")
         return ChatResponse(
             response="Maaf, terjadi kesalahan sistem. Silakan coba lagi.",
             confidence=0.0,
             sentiment="neutral",
-            is_hoax_detected=False
+            is_hoax_detected=False,
         )
 
+
+@app.post("/chat/stream")
+async def chat_with_bot_stream(message: ChatMessage):
+    """Send message to chatbot and stream the response as Server-Sent Events"""
+
+    async def event_stream():
+        try:
+            async for event in chat_pipeline.stream(
+                message.message, message.chatbot_id
+            ):
+                yield format_sse(event["event"], event["data"])
+        except Exception as e:
+            logger.error(f"Chat stream error: {str(e)}")
+            yield format_sse(
+                "error",
+                {"response": "Maaf, terjadi kesalahan sistem. Silakan coba lagi."},
+            )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Disable proxy buffering so tokens flush immediately
+        },
+    )
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 # AI Analysis endpoints
 @app.post("/ai/hoax-detection", response_model=HoaxAnalysis)
 async def detect_hoax(text: str):
     """Analyze text for hoax/misinformation"""
     try:
-        result = await ai_service.detect_hoax(text)
-        
+        result = await single_flight.do(
+            flight_key("hoax_detection", text), lambda: ai_service.detect_hoax(text)
+        )
+
         return HoaxAnalysis(
             text=text,
             is_hoax=result.get("is_hoax", False),
             confidence=result.get("confidence", 0.0),
-            explanation=result.get("explanation", "Tidak dapat menganalisis teks")
+            explanation=result.get("explanation", "Tidak dapat menganalisis teks"),
         )
+    except ProviderOverloaded:
+        raise
     except Exception as e:
         logger.error(f"Hoax detection error: {str(e)}")
         raise HTTPException(status_code=400, detail="Failed to analyze text for hoax")
 
+
+@app.post("/ai/hoax-detection/batch")
+async def detect_hoax_batch(request: Request):
+    """Scan many messages for hoaxes (JSON array, NDJSON or a WhatsApp chat export as text/plain),
+    streaming NDJSON verdicts in input order"""
+    try:
+        body = await read_batch_body(request, settings.batch_max_bytes)
+        items = parse_batch_items(
+            body, request.headers.get("content-type", ""), settings.batch_max_items
+        )
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except BatchInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def results():
+        async for result in scan_hoaxes(
+            items, ai_service.detect_hoax_batch, settings.hoax_batch_size
+        ):
+            yield ndjson_line(result)
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
 @app.post("/ai/sentiment-analysis", response_model=SentimentAnalysis)
 async def analyze_sentiment(text: str):
     """Analyze text sentiment"""
     try:
-        result = await ai_service.analyze_sentiment(text)
-        
+        result = await single_flight.do(
+            flight_key("sentiment_analysis", text),
+            lambda: ai_service.analyze_sentiment(text),
+        )
+
         return SentimentAnalysis(
             text=text,
             sentiment=result.get("sentiment", "neutral"),
             confidence=result.get("confidence", 0.0),
-            emotions=result.get("emotions", {})
+            emotions=result.get("emotions", {}),
         )
+    except ProviderOverloaded:
+        raise
     except Exception as e:
         logger.error(f"Sentiment analysis error: {str(e)}")
         raise HTTPException(status_code=400, detail="Failed to analyze sentiment")
 
+
+@app.post("/ai/sentiment-analysis/batch")
+async def analyze_sentiment_batch(request: Request):
+    """Analyze sentiment of many texts (JSON array or NDJSON body), streaming NDJSON results in input order"""
+    try:
+        body = await read_batch_body(request, settings.batch_max_bytes)
+        items = parse_batch_items(
+            body, request.headers.get("content-type", ""), settings.batch_max_items
+        )
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except BatchInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def results():
+        async for result in analyze_batches(
+            items, ai_service.analyze_sentiment_batch, settings.sentiment_batch_size
+        ):
+            yield ndjson_line(result)
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+# Provider webhooks
+@app.post("/webhooks/replicate")
+async def replicate_webhook(request: Request):
+    """Receive Replicate prediction completions and resume the waiting requests"""
+    body = await request.body()
+    if not replicate_predictions.verify_webhook(request.headers, body):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+    try:
+        prediction = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+
+    return {
+        "received": True,
+        "matched": replicate_predictions.handle_webhook(prediction),
+    }
+
+
 # Analytics endpoints
 @app.get("/chatbots/{chatbot_id}/analytics")
 async def get_chatbot_analytics(
     chatbot_id: str,
     days: int = 30,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
 ):
     """Get chatbot usage analytics"""
     try:
@@ -360,26 +571,18 @@ async def get_chatbot_analytics(
             "total_conversations": 150,
             "total_messages": 1250,
             "avg_response_time": 0.85,
-            "sentiment_distribution": {
-                "positive": 65,
-                "neutral": 25,
-                "negative": 10
-            },
+            "sentiment_distribution": {"positive": 65, "neutral": 25, "negative": 10},
             "top_intents": [
                 {"intent": "product_inquiry", "count": 45},
                 {"intent": "pricing", "count": 32},
-                {"intent": "support", "count": 28}
+                {"intent": "support", "count": 28},
             ],
-            "daily_stats": []  # TODO: Generate daily statistics
+            "daily_stats": [],  # TODO: Generate daily statistics
         }
     except Exception as e:
         logger.error(f"Analytics error: {str(e)}")
         raise HTTPException(status_code=400, detail="Failed to fetch analytics")
 
+
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True
-    )
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,106 +1,228 @@
+import asyncio
 import logging
+import time
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-from ai_models.replicate_client import ReplicateClient
 from ai_models.huggingface_client import HuggingFaceClient
 from ai_models.ibm_watsonx_client import IBMWatsonxClient
+from ai_models.replicate_client import ReplicateClient
 from config import settings
+from services.bulkhead import (
+    ProviderOverloaded,
+    bulkheads,
+    overload_scope,
+    raise_if_overloaded,
+)
+from services.circuit_breaker import CircuitOpenError, circuit_breakers
+from services.hedging import hedger
+from services.knowledge_index import knowledge_index
+from services.local_classifier import local_classifier
+from services.provider_router import ProviderRouter, is_configured
+from services.text_chunker import chunk_text
 
 logger = logging.getLogger(__name__)
 
+
 class AIService:
     """Unified AI service that can use either IBM Watsonx or Hugging Face"""
-    
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        
+
         # Initialize AI clients with new priority order
         # Primary: Replicate (with IBM Granite model)
         # Secondary: Hugging Face (OpenAI GPT-OSS-20B)
         # Fallback: IBM Orchestrate (only if needed)
-        
+
         try:
             self.primary_client = ReplicateClient()
             self.logger.info("Primary AI client (Replicate) initialized successfully")
         except Exception as e:
-            self.logger.error(f"Failed to initialize primary AI client (Replicate): {e}")
+            self.logger.error(
+                f"Failed to initialize primary AI client (Replicate): {e}"
+            )
             self.primary_client = None
-        
+
         try:
             self.secondary_client = HuggingFaceClient()
-            self.logger.info("Secondary AI client (Hugging Face) initialized successfully")
+            self.logger.info(
+                "Secondary AI client (Hugging Face) initialized successfully"
+            )
         except Exception as e:
-            self.logger.error(f"Failed to initialize secondary AI client (Hugging Face): {e}")
+            self.logger.error(
+                f"Failed to initialize secondary AI client (Hugging Face): {e}"
+            )
             self.secondary_client = None
-        
+
         try:
             self.fallback_client = IBMWatsonxClient()
-            self.logger.info("Fallback AI client (IBM Orchestrate) initialized successfully")
+            self.logger.info(
+                "Fallback AI client (IBM Orchestrate) initialized successfully"
+            )
         except Exception as e:
-            self.logger.error(f"Failed to initialize fallback AI client (IBM Orchestrate): {e}")
+            self.logger.error(
+                f"Failed to initialize fallback AI client (IBM Orchestrate): {e}"
+            )
             self.fallback_client = None
-    
+
+        # Providers are tried in the router's order (expected latency / success rate);
+        # the tiers only label responses and break ties before any data exists
+        self.clients = {
+            "replicate": self.primary_client,
+            "huggingface": self.secondary_client,
+            "ibm": self.fallback_client,
+        }
+        # Models behind chat answers (part of the response cache key)
+        self.chat_model_signature = "|".join(
+            [
+                self.primary_client.default_model if self.primary_client else "",
+                settings.default_llm_model,
+                "ibm-granite/granite-3.3-8b-instruct",
+            ]
+        )
+        self.tiers = {
+            "replicate": "primary",
+            "huggingface": "secondary",
+            "ibm": "fallback",
+        }
+        self.router = ProviderRouter(
+            alpha=settings.router_ewma_alpha,
+            window=settings.router_window,
+            recovery_after=settings.router_recovery_after,
+        )
+        self.router.register(
+            "replicate",
+            self.primary_client is not None
+            and is_configured(settings.replicate_api_token),
+            prior_latency=settings.router_prior_latency,
+            label="Replicate",
+        )
+        self.router.register(
+            "huggingface",
+            self.secondary_client is not None
+            and is_configured(settings.huggingface_api_token),
+            prior_latency=settings.router_prior_latency * 1.5,
+            label="Hugging Face",
+        )
+        self.router.register(
+            "ibm",
+            self.fallback_client is not None
+            and is_configured(
+                settings.ibm_orchestrate_api_key, settings.ibm_orchestrate_base_url
+            ),
+            prior_latency=settings.router_prior_latency * 2,
+            label="IBM Orchestrate",
+        )
+
     def _get_client_name(self, client) -> str:
         """Get human-readable client name"""
-        if client == IBMWatsonxClient:
+        if isinstance(client, IBMWatsonxClient):
             return "IBM Orchestrate"
-        elif client == ReplicateClient:
+        elif isinstance(client, ReplicateClient):
             return "Replicate"
-        elif client == HuggingFaceClient:
+        elif isinstance(client, HuggingFaceClient):
             return "Hugging Face"
         else:
             return "None"
-    
-    async def generate_chat_response(self, 
-                                   message: str, 
-                                   context: Optional[str] = None,
-                                   chatbot_id: Optional[str] = None) -> Dict[str, Any]:
-        """Generate chatbot response with new priority order: Replicate > Hugging Face > IBM"""
-        
+
+    def _is_good_chat_response(self, result: Dict[str, Any]) -> bool:
+        return not result.get("error") and len(result.get("response") or "") > 10
+
+    def _is_good_analysis(self, result: Dict[str, Any]) -> bool:
+        return bool(result) and not result.get("error")
+
+    async def _call_provider(
+        self, operation: str, name: str, call, is_good
+    ) -> Optional[Dict[str, Any]]:
+        """Run one provider call through its circuit breaker and record latency/outcome with the router; None if unusable"""
+        client = self.clients[name]
+        breaker = circuit_breakers.get(name)
+        if not breaker.allow():
+            logger.info(
+                f"Skipping {self._get_client_name(client)} for {operation}: circuit {breaker.state}"
+            )
+            return None
+
+        started = time.perf_counter()
         try:
-            # Try primary client first (Replicate with IBM Granite model)
-            if self.primary_client:
-                logger.info(f"Trying primary AI client: {self._get_client_name(self.primary_client)}")
-                result = await self.primary_client.generate_chat_response(message, context)
-                
-                # Check if response is good enough
-                if not result.get("error") and result.get("response") and len(result.get("response", "")) > 10:
-                    result["chatbot_id"] = chatbot_id
-                    result["timestamp"] = self._get_timestamp()
-                    result["ai_tier"] = "primary"
-                    result["ai_provider"] = self._get_client_name(self.primary_client)
-                    return result
-                else:
-                    logger.warning(f"Primary AI client response quality insufficient: {result.get('error', 'Response too short')}")
-            
-            # If primary fails or response quality is poor, try secondary client (Hugging Face)
-            if self.secondary_client:
-                logger.info(f"Trying secondary AI client: {self._get_client_name(self.secondary_client)}")
-                result = await self.secondary_client.generate_chat_response(message, context)
-                
-                if not result.get("error") and result.get("response") and len(result.get("response", "")) > 10:
-                    result["chatbot_id"] = chatbot_id
-                    result["timestamp"] = self._get_timestamp()
-                    result["ai_tier"] = "secondary"
-                    result["ai_provider"] = self._get_client_name(self.secondary_client)
-                    return result
-                else:
-                    logger.warning(f"Secondary AI client response quality insufficient: {result.get('error', 'Response too short')}")
-            
-            # If both fail, try fallback client (IBM Orchestrate) - only as last resort
-            if self.fallback_client:
-                logger.info(f"Trying fallback AI client (IBM Orchestrate) as last resort: {self._get_client_name(self.fallback_client)}")
-                result = await self.fallback_client.generate_chat_response(message, context)
-                
-                if not result.get("error") and result.get("response") and len(result.get("response", "")) > 10:
-                    result["chatbot_id"] = chatbot_id
-                    result["timestamp"] = self._get_timestamp()
-                    result["ai_tier"] = "fallback"
-                    result["ai_provider"] = self._get_client_name(self.fallback_client)
-                    return result
-            
-            # If all clients fail, return a helpful error message
+            result = await asyncio.wait_for(
+                call(client), settings.provider_call_timeout
+            )
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except (ProviderOverloaded, CircuitOpenError) as e:
+            # Refused locally (bulkhead or every model's circuit), says nothing about the provider's health
+            breaker.release()
+            logger.warning(
+                f"Skipping {self._get_client_name(client)} for {operation}: {e}"
+            )
+            return None
+        except Exception as e:
+            breaker.record_failure()
+            self.router.record(operation, name, time.perf_counter() - started, False)
+            reason = (
+                f"timed out after {settings.provider_call_timeout}s"
+                if isinstance(e, asyncio.TimeoutError)
+                else f"failed: {e}"
+            )
+            logger.warning(
+                f"{self.tiers[name].capitalize()} {operation} ({self._get_client_name(client)}) {reason}"
+            )
+            return None
+
+        if result and result.get("error"):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        good = is_good(result)
+        self.router.record(operation, name, time.perf_counter() - started, good)
+        if not good:
+            logger.warning(
+                f"{self.tiers[name].capitalize()} {operation} ({self._get_client_name(client)}) response insufficient: {result.get('error', 'Response too short')}"
+            )
+            return None
+        return result
+
+    @overload_scope
+    async def generate_chat_response(
+        self,
+        message: str,
+        context: Optional[str] = None,
+        chatbot_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Generate chatbot response, trying providers in the router's current order"""
+
+        try:
+            # Fallback chain in router order; with hedging enabled a slow provider
+            # gets the next one started alongside it and the first good answer wins
+            winner = await hedger.run(
+                [
+                    (
+                        name,
+                        lambda name=name: self._call_provider(
+                            "chat",
+                            name,
+                            lambda client: client.generate_chat_response(
+                                message, context
+                            ),
+                            self._is_good_chat_response,
+                        ),
+                    )
+                    for name in self.router.order("chat")
+                ]
+            )
+            if winner is not None:
+                name, result = winner
+                result["chatbot_id"] = chatbot_id
+                result["timestamp"] = self._get_timestamp()
+                result["ai_tier"] = self.tiers[name]
+                result["ai_provider"] = self._get_client_name(self.clients[name])
+                return result
+
+            # If all clients fail, return a helpful error message (or 503 if providers refused for overload)
+            raise_if_overloaded()
             logger.error("All AI clients failed to generate response")
             return {
                 "response": "Maaf, saya sedang mengalami kesulitan teknis. Silakan coba lagi dalam beberapa saat atau hubungi tim support kami.",
@@ -109,9 +231,11 @@ class AIService:
                 "chatbot_id": chatbot_id,
                 "timestamp": self._get_timestamp(),
                 "ai_tier": "none",
-                "ai_provider": "none"
+                "ai_provider": "none",
             }
-            
+
+        except ProviderOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Error in chat response generation: {str(e)}")
             return {
@@ -121,50 +245,124 @@ class AIService:
                 "chatbot_id": chatbot_id,
                 "timestamp": self._get_timestamp(),
                 "ai_tier": "error",
-                "ai_provider": "error"
+                "ai_provider": "error",
             }
-    
+
+    async def stream_chat_response(
+        self,
+        message: str,
+        context: Optional[str] = None,
+        chatbot_id: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream chatbot response as token events followed by a final "done" event.
+
+        Replicate and Hugging Face stream natively; if neither can stream, the
+        regular fallback chain runs and its answer is sent as a single chunk.
+        """
+        for name in self.router.order("chat", ["replicate", "huggingface"]):
+            client = self.clients[name]
+            tier = self.tiers[name]
+            if not hasattr(client, "stream_chat_response"):
+                continue
+            breaker = circuit_breakers.get(name)
+            if not breaker.allow():
+                logger.info(
+                    f"Skipping {self._get_client_name(client)} stream: circuit {breaker.state}"
+                )
+                continue
+
+            parts: List[str] = []
+            error = None
+            started = time.perf_counter()
+            try:
+                logger.info(
+                    f"Streaming from {tier} AI client: {self._get_client_name(client)}"
+                )
+                async for token in client.stream_chat_response(message, context):
+                    parts.append(token)
+                    yield {"type": "token", "text": token}
+            except (ProviderOverloaded, CircuitOpenError) as e:
+                # Refused before the request was sent, says nothing about the provider's health
+                breaker.release()
+                logger.warning(f"Skipping {self._get_client_name(client)} stream: {e}")
+                continue
+            except Exception as e:
+                breaker.record_failure()
+                if not parts:
+                    self.router.record(
+                        "chat", name, time.perf_counter() - started, False
+                    )
+                    logger.warning(
+                        f"{tier.capitalize()} AI client streaming failed: {e}"
+                    )
+                    continue
+                # Tokens were already delivered, finish with what we have
+                logger.error(f"{tier.capitalize()} AI client stream interrupted: {e}")
+                error = str(e)
+            except BaseException:
+                # Client disconnected or the generator was closed early
+                breaker.release()
+                raise
+            else:
+                breaker.record_success()
+
+            response_text = "".join(parts).strip()
+            self.router.record(
+                "chat",
+                name,
+                time.perf_counter() - started,
+                bool(response_text) and not error,
+            )
+            if response_text:
+                yield {
+                    "type": "done",
+                    "response": response_text,
+                    "confidence": 0.85 if not error else 0.5,
+                    "error": error,
+                    "chatbot_id": chatbot_id,
+                    "timestamp": self._get_timestamp(),
+                    "ai_tier": tier,
+                    "ai_provider": self._get_client_name(client),
+                }
+                return
+
+        # No streaming provider answered, fall back to a single chunk
+        result = await self.generate_chat_response(message, context, chatbot_id)
+        yield {"type": "token", "text": result["response"]}
+        yield {"type": "done", **result}
+
     async def detect_hoax(self, text: str) -> Dict[str, Any]:
-        """Detect hoax with new priority order: Replicate > Hugging Face > IBM"""
-        
+        """Detect hoax locally when the local classifier is confident, else remotely"""
+        local = local_classifier.hoax(text)
+        if local is not None:
+            return local
+        return await self._detect_hoax_remote(text)
+
+    @overload_scope
+    async def _detect_hoax_remote(self, text: str) -> Dict[str, Any]:
+        """Detect hoax, trying providers in the router's current order"""
+
         try:
-            # Try primary client first (Replicate)
-            if self.primary_client and hasattr(self.primary_client, 'detect_hoax'):
-                logger.info(f"Trying primary hoax detection: {self._get_client_name(self.primary_client)}")
-                try:
-                    result = await self.primary_client.detect_hoax(text)
-                    if result and not result.get("error"):
-                        result["ai_tier"] = "primary"
-                        result["ai_provider"] = self._get_client_name(self.primary_client)
-                        return result
-                except Exception as e:
-                    logger.warning(f"Primary hoax detection failed: {e}")
-            
-            # Try secondary client (Hugging Face)
-            if self.secondary_client and hasattr(self.secondary_client, 'detect_hoax'):
-                logger.info(f"Trying secondary hoax detection: {self._get_client_name(self.secondary_client)}")
-                try:
-                    result = await self.secondary_client.detect_hoax(text)
-                    if result and not result.get("error"):
-                        result["ai_tier"] = "secondary"
-                        result["ai_provider"] = self._get_client_name(self.secondary_client)
-                        return result
-                except Exception as e:
-                    logger.warning(f"Secondary hoax detection failed: {e}")
-            
-            # Try fallback client (IBM Orchestrate) - only as last resort
-            if self.fallback_client and hasattr(self.fallback_client, 'detect_hoax'):
-                logger.info(f"Trying fallback hoax detection (IBM Orchestrate): {self._get_client_name(self.fallback_client)}")
-                try:
-                    result = await self.fallback_client.detect_hoax(text)
-                    if result and not result.get("error"):
-                        result["ai_tier"] = "fallback"
-                        result["ai_provider"] = self._get_client_name(self.fallback_client)
-                        return result
-                except Exception as e:
-                    logger.warning(f"Fallback hoax detection failed: {e}")
-            
+            for name in self.router.order("hoax_detection"):
+                client = self.clients[name]
+                if not hasattr(client, "detect_hoax"):
+                    continue
+                logger.info(
+                    f"Trying {self.tiers[name]} hoax detection: {self._get_client_name(client)}"
+                )
+                result = await self._call_provider(
+                    "hoax_detection",
+                    name,
+                    lambda client: client.detect_hoax(text),
+                    self._is_good_analysis,
+                )
+                if result is not None:
+                    result["ai_tier"] = self.tiers[name]
+                    result["ai_provider"] = self._get_client_name(client)
+                    return result
+
             # If all fail, return safe default
+            raise_if_overloaded()
             logger.warning("All hoax detection clients failed, returning safe default")
             return {
                 "is_hoax": False,
@@ -172,9 +370,11 @@ class AIService:
                 "reason": "AI service unavailable, defaulting to safe",
                 "ai_tier": "none",
                 "ai_provider": "none",
-                "error": "All clients failed"
+                "error": "All clients failed",
             }
-            
+
+        except ProviderOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Error in hoax detection: {str(e)}")
             return {
@@ -183,59 +383,52 @@ class AIService:
                 "reason": "Error occurred, defaulting to safe",
                 "ai_tier": "error",
                 "ai_provider": "error",
-                "error": str(e)
+                "error": str(e),
             }
-    
+
     async def analyze_sentiment(self, text: str) -> Dict[str, Any]:
-        """Analyze sentiment with new priority order: Replicate > Hugging Face > IBM"""
-        
+        """Analyze sentiment locally when the local classifier is confident, else remotely"""
+        local = local_classifier.sentiment(text)
+        if local is not None:
+            return local
+        return await self._analyze_sentiment_remote(text)
+
+    @overload_scope
+    async def _analyze_sentiment_remote(self, text: str) -> Dict[str, Any]:
+        """Analyze sentiment, trying providers in the router's current order"""
+
         try:
-            # Try primary client first (Replicate)
-            if self.primary_client and hasattr(self.primary_client, 'analyze_sentiment'):
-                logger.info(f"Trying primary sentiment analysis: {self._get_client_name(self.primary_client)}")
-                try:
-                    result = await self.primary_client.analyze_sentiment(text)
-                    if result and not result.get("error"):
-                        result["ai_tier"] = "primary"
-                        result["ai_provider"] = self._get_client_name(self.primary_client)
-                        return result
-                except Exception as e:
-                    logger.warning(f"Primary sentiment analysis failed: {e}")
-            
-            # Try secondary client (Hugging Face)
-            if self.secondary_client and hasattr(self.secondary_client, 'analyze_sentiment'):
-                logger.info(f"Trying secondary sentiment analysis: {self._get_client_name(self.secondary_client)}")
-                try:
-                    result = await self.secondary_client.analyze_sentiment(text)
-                    if result and not result.get("error"):
-                        result["ai_tier"] = "secondary"
-                        result["ai_provider"] = self._get_client_name(self.secondary_client)
-                        return result
-                except Exception as e:
-                    logger.warning(f"Secondary sentiment analysis failed: {e}")
-            
-            # Try fallback client (IBM Orchestrate) - only as last resort
-            if self.fallback_client and hasattr(self.fallback_client, 'analyze_sentiment'):
-                logger.info(f"Trying fallback sentiment analysis (IBM Orchestrate): {self._get_client_name(self.fallback_client)}")
-                try:
-                    result = await self.fallback_client.analyze_sentiment(text)
-                    if result and not result.get("error"):
-                        result["ai_tier"] = "fallback"
-                        result["ai_provider"] = self._get_client_name(self.fallback_client)
-                        return result
-                except Exception as e:
-                    logger.warning(f"Fallback sentiment analysis failed: {e}")
-            
+            for name in self.router.order("sentiment_analysis"):
+                client = self.clients[name]
+                if not hasattr(client, "analyze_sentiment"):
+                    continue
+                logger.info(
+                    f"Trying {self.tiers[name]} sentiment analysis: {self._get_client_name(client)}"
+                )
+                result = await self._call_provider(
+                    "sentiment_analysis",
+                    name,
+                    lambda client: client.analyze_sentiment(text),
+                    self._is_good_analysis,
+                )
+                if result is not None:
+                    result["ai_tier"] = self.tiers[name]
+                    result["ai_provider"] = self._get_client_name(client)
+                    return result
+
             # If all fail, return neutral sentiment
+            raise_if_overloaded()
             logger.warning("All sentiment analysis clients failed, returning neutral")
             return {
                 "sentiment": "neutral",
                 "confidence": 0.0,
                 "ai_tier": "none",
                 "ai_provider": "none",
-                "error": "All clients failed"
+                "error": "All clients failed",
             }
-            
+
+        except ProviderOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Error in sentiment analysis: {str(e)}")
             return {
@@ -243,98 +436,154 @@ class AIService:
                 "confidence": 0.0,
                 "ai_tier": "error",
                 "ai_provider": "error",
-                "error": str(e)
+                "error": str(e),
             }
-    
-    async def process_knowledge_base(self, 
-                                   content: str, 
-                                   source: Optional[str] = None) -> Dict[str, Any]:
+
+    @overload_scope
+    async def detect_hoax_batch(
+        self, texts: List[str]
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Zero-shot hoax verdicts for a micro-batch in one provider request; None if no provider answered"""
+        for name in self.router.order("hoax_batch"):
+            client = self.clients[name]
+            if not hasattr(client, "detect_hoax_batch"):
+                continue
+            logger.info(
+                f"Trying {self.tiers[name]} batch hoax detection ({len(texts)} texts): {self._get_client_name(client)}"
+            )
+            result = await self._call_provider(
+                "hoax_batch",
+                name,
+                lambda client: client.detect_hoax_batch(texts),
+                self._is_good_analysis,
+            )
+            if result is not None:
+                for item in result["results"]:
+                    item["ai_tier"] = self.tiers[name]
+                    item["ai_provider"] = self._get_client_name(client)
+                return result["results"]
+
+        raise_if_overloaded()
+        return None
+
+    async def analyze_sentiment_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Analyze sentiment of a micro-batch; texts the local classifier is confident about skip the providers"""
+        results = [local_classifier.sentiment(text) for text in texts]
+        remote = [index for index, result in enumerate(results) if result is None]
+        if remote:
+            remote_results = await self._analyze_sentiment_batch_remote(
+                [texts[index] for index in remote]
+            )
+            for index, result in zip(remote, remote_results):
+                results[index] = result
+        return results
+
+    @overload_scope
+    async def _analyze_sentiment_batch_remote(
+        self, texts: List[str]
+    ) -> List[Dict[str, Any]]:
+        """Analyze sentiment of a micro-batch, one provider request for the whole list when possible"""
+        for name in self.router.order("sentiment_batch"):
+            client = self.clients[name]
+            if not hasattr(client, "analyze_sentiment_batch"):
+                continue
+            logger.info(
+                f"Trying {self.tiers[name]} batch sentiment analysis ({len(texts)} texts): {self._get_client_name(client)}"
+            )
+            result = await self._call_provider(
+                "sentiment_batch",
+                name,
+                lambda client: client.analyze_sentiment_batch(texts),
+                self._is_good_analysis,
+            )
+            if result is not None:
+                for item in result["results"]:
+                    item["ai_tier"] = self.tiers[name]
+                    item["ai_provider"] = self._get_client_name(client)
+                return result["results"]
+
+        # No batch-capable provider answered: analyze the texts one by one, a few
+        # at a time so one batch request cannot take every provider slot
+        semaphore = asyncio.Semaphore(max(settings.batch_fallback_concurrency, 1))
+
+        async def analyze(text: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._analyze_sentiment_remote(text)
+
+        return list(await asyncio.gather(*(analyze(text) for text in texts)))
+
+    async def process_knowledge_base(
+        self, content: str, source: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Process and vectorize knowledge base content"""
-        
+
         try:
             # TODO: Implement proper knowledge base processing
             # This would typically involve:
             # 1. Text chunking
             # 2. Embedding generation
             # 3. Vector storage (e.g., Pinecone, Weaviate, or local FAISS)
-            
+
             # For now, return a simple processed result
             chunks = self._chunk_text(content)
-            
+
             return {
                 "status": "success",
                 "chunks_created": len(chunks),
                 "source": source,
                 "content_length": len(content),
-                "timestamp": self._get_timestamp()
+                "timestamp": self._get_timestamp(),
             }
-            
+
         except Exception as e:
             logger.error(f"Error processing knowledge base: {str(e)}")
             return {
                 "status": "error",
                 "error": str(e),
-                "timestamp": self._get_timestamp()
+                "timestamp": self._get_timestamp(),
             }
-    
-    async def search_knowledge_base(self, 
-                                  query: str, 
-                                  chatbot_id: str,
-                                  limit: int = 5) -> List[Dict[str, Any]]:
+
+    async def search_knowledge_base(
+        self, query: str, chatbot_id: str, limit: int = 5
+    ) -> List[Dict[str, Any]]:
         """Search knowledge base for relevant content"""
-        
+
         try:
-            # TODO: Implement proper vector search
-            # This would typically involve:
-            # 1. Query embedding generation
-            # 2. Vector similarity search
-            # 3. Ranking and filtering
-            
-            # For now, return mock results
-            return [
-                {
-                    "content": "Informasi produk yang relevan dengan pertanyaan Anda...",
-                    "source": "product_catalog.pdf",
-                    "confidence": 0.85,
-                    "chunk_id": "chunk_1"
-                }
-            ]
-            
+            return await knowledge_index.search(query, chatbot_id, limit)
+
         except Exception as e:
             logger.error(f"Error searching knowledge base: {str(e)}")
             return []
-    
-    def _chunk_text(self, text: str, chunk_size: int = 500) -> List[str]:
+
+    def _chunk_text(self, text: str) -> List[str]:
         """Split text into chunks for processing"""
-        words = text.split()
-        chunks = []
-        
-        for i in range(0, len(words), chunk_size):
-            chunk = " ".join(words[i:i + chunk_size])
-            chunks.append(chunk)
-        
-        return chunks
-    
+        return chunk_text(
+            text, settings.knowledge_chunk_tokens, settings.knowledge_chunk_overlap
+        )
+
     def _get_timestamp(self) -> str:
         """Get current timestamp"""
         return datetime.utcnow().isoformat()
-    
+
     def get_status(self) -> Dict[str, Any]:
         """Get AI service status with new priority order"""
         return {
             "primary_service": "Replicate (IBM Granite)",
             "secondary_service": "Hugging Face (OpenAI GPT-OSS-20B)",
             "fallback_service": "IBM Orchestrate",
-            "replicate_configured": self.primary_client is not None,
-            "huggingface_configured": self.secondary_client is not None,
-            "ibm_configured": self.fallback_client is not None,
-            "total_providers": sum([
-                self.primary_client is not None,
-                self.secondary_client is not None,
-                self.fallback_client is not None
-            ]),
-            "timestamp": self._get_timestamp()
+            "replicate_configured": self.router.is_available("replicate"),
+            "huggingface_configured": self.router.is_available("huggingface"),
+            "ibm_configured": self.router.is_available("ibm"),
+            "total_providers": len(self.router.order("chat")),
+            "provider_ranking": self.router.ranking(),
+            "unconfigured_providers": self.router.unconfigured(),
+            "circuit_breakers": circuit_breakers.get_status(),
+            "hedging": hedger.get_stats(),
+            "bulkheads": bulkheads.get_stats(),
+            "local_classifier": local_classifier.get_stats(),
+            "timestamp": self._get_timestamp(),
         }
 
+
 # Global AI service instance
 ai_service = AIService()
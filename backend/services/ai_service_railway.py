@@ -1,69 +1,171 @@
+import asyncio
+import json
 import logging
+import time
 from datetime import datetime
-from typing import Dict, Any, Optional, List
-import requests
-import json
+from typing import Any, AsyncIterator, Dict, List, Optional
 
+from ai_models.http_transport import http_transport
+from ai_models.ibm_token_manager import ibm_token_manager
+from ai_models.replicate_predictions import output_text, replicate_predictions
+from ai_models.sse import iter_sse_events
 from config import settings
+from services.bulkhead import (
+    ProviderOverloaded,
+    bulkheads,
+    overload_scope,
+    raise_if_overloaded,
+)
+from services.circuit_breaker import CircuitOpenError, circuit_breakers
+from services.hedging import hedger
+from services.hoax_screening import (
+    ZERO_SHOT_LABELS,
+    ZERO_SHOT_MODEL,
+    zero_shot_prompt,
+    zero_shot_verdict,
+)
+from services.knowledge_index import knowledge_index
+from services.local_classifier import local_classifier
+from services.provider_router import ProviderRouter, is_configured
 
 logger = logging.getLogger(__name__)
 
+
 class AIServiceRailway:
     """Lightweight AI service for Railway deployment - no local ML packages required"""
-    
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        
+
         # Initialize API clients for external AI services
         self.replicate_api_key = settings.replicate_api_token
         self.huggingface_api_key = settings.huggingface_api_token
         self.ibm_api_key = settings.ibm_orchestrate_api_key
         self.ibm_base_url = settings.ibm_orchestrate_base_url
-        
+
         # API endpoints
         self.replicate_url = "https://api.replicate.com/v1/predictions"
+        self.replicate_chat_model = "ibm-granite/granite-3.3-8b-instruct"
         self.huggingface_url = "https://api-inference.huggingface.co/models"
-        
+        # Models behind chat answers (part of the response cache key)
+        self.chat_model_signature = f"{self.replicate_chat_model}|openai/gpt-oss-20b|ibm-granite/granite-3.3-8b-instruct"
+
+        # Chat providers, tried in the router's order (expected latency / success rate)
+        self.chat_providers = {
+            "replicate": (
+                self._try_replicate_chat,
+                "primary",
+                "Replicate (IBM Granite)",
+            ),
+            "huggingface": (
+                self._try_huggingface_chat,
+                "secondary",
+                "Hugging Face (GPT-OSS-20B)",
+            ),
+            "ibm": (self._try_ibm_chat, "fallback", "IBM Orchestrate"),
+        }
+        self.router = ProviderRouter(
+            alpha=settings.router_ewma_alpha,
+            window=settings.router_window,
+            recovery_after=settings.router_recovery_after,
+        )
+        self.router.register(
+            "replicate",
+            is_configured(self.replicate_api_key),
+            prior_latency=settings.router_prior_latency,
+            label="Replicate (IBM Granite)",
+        )
+        self.router.register(
+            "huggingface",
+            is_configured(self.huggingface_api_key),
+            prior_latency=settings.router_prior_latency * 1.5,
+            label="Hugging Face (GPT-OSS-20B)",
+        )
+        self.router.register(
+            "ibm",
+            is_configured(self.ibm_api_key, self.ibm_base_url),
+            prior_latency=settings.router_prior_latency * 2,
+            label="IBM Orchestrate",
+        )
+
         self.logger.info("Lightweight AI service initialized for Railway deployment")
-    
-    async def generate_chat_response(self, 
-                                   message: str, 
-                                   context: Optional[str] = None,
-                                   chatbot_id: Optional[str] = None) -> Dict[str, Any]:
+
+    async def _call_provider(
+        self, operation: str, name: str, call
+    ) -> Optional[Dict[str, Any]]:
+        """Run one provider call through its circuit breaker and record latency/outcome with the router; None if unusable"""
+        breaker = circuit_breakers.get(name)
+        if not breaker.allow():
+            logger.info(f"Skipping {name} for {operation}: circuit {breaker.state}")
+            return None
+
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(call(), settings.provider_call_timeout)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except (ProviderOverloaded, CircuitOpenError) as e:
+            # Refused locally (bulkhead or the model's circuit), says nothing about the provider's health
+            breaker.release()
+            logger.warning(f"Skipping {name} for {operation}: {e}")
+            return None
+        except Exception as e:
+            result = {
+                "error": (
+                    f"timed out after {settings.provider_call_timeout}s"
+                    if isinstance(e, asyncio.TimeoutError)
+                    else str(e)
+                )
+            }
+
+        success = bool(result) and not result.get("error")
+        if success:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+            logger.warning(
+                f"{name} {operation} failed: {(result or {}).get('error', 'empty response')}"
+            )
+        self.router.record(operation, name, time.perf_counter() - started, success)
+        return result if success else None
+
+    @overload_scope
+    async def generate_chat_response(
+        self,
+        message: str,
+        context: Optional[str] = None,
+        chatbot_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
         """Generate chatbot response using external AI APIs"""
-        
+
         try:
-            # Try Replicate first (IBM Granite model)
-            if self.replicate_api_key:
-                result = await self._try_replicate_chat(message, context)
-                if result and not result.get("error"):
-                    result["chatbot_id"] = chatbot_id
-                    result["timestamp"] = self._get_timestamp()
-                    result["ai_tier"] = "primary"
-                    result["ai_provider"] = "Replicate (IBM Granite)"
-                    return result
-            
-            # Try Hugging Face as fallback
-            if self.huggingface_api_key:
-                result = await self._try_huggingface_chat(message, context)
-                if result and not result.get("error"):
-                    result["chatbot_id"] = chatbot_id
-                    result["timestamp"] = self._get_timestamp()
-                    result["ai_tier"] = "secondary"
-                    result["ai_provider"] = "Hugging Face (GPT-OSS-20B)"
-                    return result
-            
-            # Try IBM Orchestrate as last resort
-            if self.ibm_api_key and self.ibm_base_url:
-                result = await self._try_ibm_chat(message, context)
-                if result and not result.get("error"):
-                    result["chatbot_id"] = chatbot_id
-                    result["timestamp"] = self._get_timestamp()
-                    result["ai_tier"] = "fallback"
-                    result["ai_provider"] = "IBM Orchestrate"
-                    return result
-            
-            # If all fail, return helpful message
+            # Fallback chain in router order; with hedging enabled a slow provider
+            # gets the next one started alongside it and the first good answer wins
+            winner = await hedger.run(
+                [
+                    (
+                        name,
+                        lambda name=name: self._call_provider(
+                            "chat",
+                            name,
+                            lambda: self.chat_providers[name][0](message, context),
+                        ),
+                    )
+                    for name in self.router.order("chat")
+                ]
+            )
+            if winner is not None:
+                name, result = winner
+                _, tier, provider = self.chat_providers[name]
+                result["chatbot_id"] = chatbot_id
+                result["timestamp"] = self._get_timestamp()
+                result["ai_tier"] = tier
+                result["ai_provider"] = provider
+                return result
+
+            # If all fail, return helpful message (or 503 if providers refused for overload)
+            raise_if_overloaded()
             logger.error("All AI services failed to generate response")
             return {
                 "response": "Maaf, saya sedang mengalami kesulitan teknis. Silakan coba lagi dalam beberapa saat atau hubungi tim support kami.",
@@ -72,9 +174,11 @@ class AIServiceRailway:
                 "chatbot_id": chatbot_id,
                 "timestamp": self._get_timestamp(),
                 "ai_tier": "none",
-                "ai_provider": "none"
+                "ai_provider": "none",
             }
-            
+
+        except ProviderOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Error in chat response generation: {str(e)}")
             return {
@@ -84,139 +188,334 @@ class AIServiceRailway:
                 "chatbot_id": chatbot_id,
                 "timestamp": self._get_timestamp(),
                 "ai_tier": "error",
-                "ai_provider": "error"
+                "ai_provider": "error",
             }
-    
-    async def _try_replicate_chat(self, message: str, context: Optional[str] = None) -> Dict[str, Any]:
+
+    async def _try_replicate_chat(
+        self, message: str, context: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Try Replicate API for chat response"""
         try:
-            headers = {
-                "Authorization": f"Token {self.replicate_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # Use IBM Granite model via Replicate
-            payload = {
-                "version": "ibm-granite/granite-3.3-8b-instruct",
-                "input": {
+            # IBM Granite is an official model, run through the models endpoint
+            result = await replicate_predictions.run(
+                self.replicate_chat_model,
+                {
                     "prompt": f"Context: {context or 'General conversation'}\n\nUser: {message}\n\nAssistant:",
                     "max_new_tokens": 500,
-                    "temperature": 0.7
-                }
-            }
-            
-            response = requests.post(self.replicate_url, headers=headers, json=payload)
-            
-            if response.status_code == 201:
-                prediction_id = response.json().get("id")
-                # For simplicity, return immediate response (in production, you'd poll for completion)
-                return {
-                    "response": f"Response from Replicate (IBM Granite) - Prediction ID: {prediction_id}",
-                    "confidence": 0.8,
-                    "error": None
-                }
+                    "temperature": 0.7,
+                },
+            )
+
+            if result["success"]:
+                response_text = output_text(result["output"])
+                if response_text:
+                    return {"response": response_text, "confidence": 0.8, "error": None}
+                return {"error": "Empty response from Replicate"}
             else:
-                logger.warning(f"Replicate API error: {response.status_code} - {response.text}")
-                return {"error": f"Replicate API error: {response.status_code}"}
-                
+                logger.warning(f"Replicate API error: {result['error']}")
+                return {"error": f"Replicate API error: {result['error']}"}
+
+        except (ProviderOverloaded, CircuitOpenError):
+            raise
         except Exception as e:
             logger.error(f"Replicate chat error: {e}")
             return {"error": str(e)}
-    
-    async def _try_huggingface_chat(self, message: str, context: Optional[str] = None) -> Dict[str, Any]:
+
+    async def _try_huggingface_chat(
+        self, message: str, context: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Try Hugging Face API for chat response"""
         try:
             headers = {
                 "Authorization": f"Bearer {self.huggingface_api_key}",
-                "Content-Type": "application/json"
+                "Content-Type": "application/json",
             }
-            
+
             # Use OpenAI GPT-OSS-20B model
             model_url = f"{self.huggingface_url}/openai/gpt-oss-20b"
-            
+
             payload = {
                 "inputs": f"Context: {context or 'General conversation'}\n\nUser: {message}\n\nAssistant:",
                 "parameters": {
                     "max_new_tokens": 200,
                     "temperature": 0.7,
-                    "do_sample": True
-                }
+                    "do_sample": True,
+                },
             }
-            
-            response = requests.post(model_url, headers=headers, json=payload)
-            
+
+            bulkhead = bulkheads.get("huggingface")
+            async with bulkhead.slot(self.huggingface_api_key):
+                response = await http_transport.client("huggingface").post(
+                    model_url, headers=headers, json=payload
+                )
+            bulkhead.note_response(response)
+
             if response.status_code == 200:
                 result = response.json()
                 if isinstance(result, list) and len(result) > 0:
                     return {
-                        "response": result[0].get("generated_text", "No response generated"),
+                        "response": result[0].get(
+                            "generated_text", "No response generated"
+                        ),
                         "confidence": 0.8,
-                        "error": None
+                        "error": None,
                     }
                 else:
                     return {"error": "Invalid response format from Hugging Face"}
             else:
-                logger.warning(f"Hugging Face API error: {response.status_code} - {response.text}")
+                logger.warning(
+                    f"Hugging Face API error: {response.status_code} - {response.text}"
+                )
                 return {"error": f"Hugging Face API error: {response.status_code}"}
-                
+
+        except (ProviderOverloaded, CircuitOpenError):
+            raise
         except Exception as e:
             logger.error(f"Hugging Face chat error: {e}")
             return {"error": str(e)}
-    
-    async def _try_ibm_chat(self, message: str, context: Optional[str] = None) -> Dict[str, Any]:
+
+    async def _try_ibm_chat(
+        self, message: str, context: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Try IBM Orchestrate API for chat response"""
         try:
-            headers = {
-                "Authorization": f"Bearer {self.ibm_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # IBM Orchestrate API call
+            headers = {"Content-Type": "application/json"}
+
+            # IBM Orchestrate API call (IAM bearer token from the API key, cached)
             payload = {
                 "model": "ibm-granite/granite-3.3-8b-instruct",
                 "prompt": f"Context: {context or 'General conversation'}\n\nUser: {message}\n\nAssistant:",
                 "max_tokens": 500,
-                "temperature": 0.7
+                "temperature": 0.7,
             }
-            
-            response = requests.post(f"{self.ibm_base_url}/v1/text/generation", headers=headers, json=payload)
-            
+
+            bulkhead = bulkheads.get("ibm")
+            async with bulkhead.slot(self.ibm_api_key):
+                response = await ibm_token_manager.request(
+                    http_transport.client("ibm"),
+                    "POST",
+                    f"{self.ibm_base_url}/v1/text/generation",
+                    headers=headers,
+                    json=payload,
+                )
+            bulkhead.note_response(response)
+
             if response.status_code == 200:
                 result = response.json()
                 return {
-                    "response": result.get("results", [{}])[0].get("generated_text", "No response generated"),
+                    "response": result.get("results", [{}])[0].get(
+                        "generated_text", "No response generated"
+                    ),
                     "confidence": 0.8,
-                    "error": None
+                    "error": None,
                 }
             else:
-                logger.warning(f"IBM API error: {response.status_code} - {response.text}")
+                logger.warning(
+                    f"IBM API error: {response.status_code} - {response.text}"
+                )
                 return {"error": f"IBM API error: {response.status_code}"}
-                
+
+        except (ProviderOverloaded, CircuitOpenError):
+            raise
         except Exception as e:
             logger.error(f"IBM chat error: {e}")
             return {"error": str(e)}
-    
+
+    async def stream_chat_response(
+        self,
+        message: str,
+        context: Optional[str] = None,
+        chatbot_id: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream chatbot response as token events followed by a final "done" event"""
+        streamers = {
+            "replicate": self._stream_replicate_chat,
+            "huggingface": self._stream_huggingface_chat,
+        }
+
+        for name in self.router.order("chat", list(streamers)):
+            streamer = streamers[name]
+            _, tier, provider = self.chat_providers[name]
+            breaker = circuit_breakers.get(name)
+            if not breaker.allow():
+                logger.info(f"Skipping {provider} stream: circuit {breaker.state}")
+                continue
+            parts: List[str] = []
+            error = None
+            started = time.perf_counter()
+            try:
+                async for token in streamer(message, context):
+                    parts.append(token)
+                    yield {"type": "token", "text": token}
+            except (ProviderOverloaded, CircuitOpenError) as e:
+                # Refused before the request was sent, says nothing about the provider's health
+                breaker.release()
+                logger.warning(f"Skipping {provider} stream: {e}")
+                continue
+            except Exception as e:
+                breaker.record_failure()
+                if not parts:
+                    self.router.record(
+                        "chat", name, time.perf_counter() - started, False
+                    )
+                    logger.warning(f"{provider} streaming failed: {e}")
+                    continue
+                # Tokens were already delivered, finish with what we have
+                logger.error(f"{provider} stream interrupted: {e}")
+                error = str(e)
+            except BaseException:
+                # Client disconnected or the generator was closed early
+                breaker.release()
+                raise
+            else:
+                breaker.record_success()
+
+            response_text = "".join(parts).strip()
+            self.router.record(
+                "chat",
+                name,
+                time.perf_counter() - started,
+                bool(response_text) and not error,
+            )
+            if response_text:
+                yield {
+                    "type": "done",
+                    "response": response_text,
+                    "confidence": 0.8 if not error else 0.5,
+                    "error": error,
+                    "chatbot_id": chatbot_id,
+                    "timestamp": self._get_timestamp(),
+                    "ai_tier": tier,
+                    "ai_provider": provider,
+                }
+                return
+
+        # No streaming provider answered, fall back to a single chunk
+        result = await self.generate_chat_response(message, context, chatbot_id)
+        yield {"type": "token", "text": result["response"]}
+        yield {"type": "done", **result}
+
+    async def _stream_replicate_chat(
+        self, message: str, context: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream tokens from a Replicate prediction"""
+        headers = {
+            "Authorization": f"Token {self.replicate_api_key}",
+            "Content-Type": "application/json",
+        }
+
+        url, payload = replicate_predictions.prediction_request(
+            self.replicate_chat_model,
+            {
+                "prompt": f"Context: {context or 'General conversation'}\n\nUser: {message}\n\nAssistant:",
+                "max_new_tokens": 500,
+                "temperature": 0.7,
+            },
+        )
+        payload["stream"] = True
+
+        client = http_transport.client("replicate")
+        bulkhead = bulkheads.get("replicate")
+        async with bulkhead.slot(self.replicate_api_key):
+            response = await client.post(url, headers=headers, json=payload)
+            bulkhead.note_response(response)
+            response.raise_for_status()
+            stream_url = response.json().get("urls", {}).get("stream")
+            if not stream_url:
+                raise Exception("Replicate prediction does not support streaming")
+
+            stream_headers = {
+                **headers,
+                "Accept": "text/event-stream",
+                "Cache-Control": "no-store",
+            }
+            async with client.stream(
+                "GET", stream_url, headers=stream_headers
+            ) as stream:
+                stream.raise_for_status()
+                async for event, data in iter_sse_events(stream):
+                    if event == "output":
+                        yield data
+                    elif event == "error":
+                        raise Exception(f"Replicate stream error: {data}")
+                    elif event == "done":
+                        break
+
+    async def _stream_huggingface_chat(
+        self, message: str, context: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream tokens from Hugging Face text-generation"""
+        headers = {
+            "Authorization": f"Bearer {self.huggingface_api_key}",
+            "Content-Type": "application/json",
+        }
+
+        payload = {
+            "inputs": f"Context: {context or 'General conversation'}\n\nUser: {message}\n\nAssistant:",
+            "parameters": {
+                "max_new_tokens": 200,
+                "temperature": 0.7,
+                "do_sample": True,
+                "return_full_text": False,
+            },
+            "stream": True,
+        }
+
+        client = http_transport.client("huggingface")
+        bulkhead = bulkheads.get("huggingface")
+        async with bulkhead.slot(self.huggingface_api_key):
+            async with client.stream(
+                "POST",
+                f"{self.huggingface_url}/openai/gpt-oss-20b",
+                headers=headers,
+                json=payload,
+            ) as response:
+                bulkhead.note_response(response)
+                response.raise_for_status()
+                async for _, data in iter_sse_events(response):
+                    event = json.loads(data)
+                    if event.get("error"):
+                        raise Exception(f"Hugging Face stream error: {event['error']}")
+                    token = event.get("token") or {}
+                    if token.get("text") and not token.get("special"):
+                        yield token["text"]
+
     async def detect_hoax(self, text: str) -> Dict[str, Any]:
+        """Detect hoax locally when the local classifier is confident, else remotely"""
+        local = local_classifier.hoax(text)
+        if local is not None:
+            return local
+        return await self._detect_hoax_remote(text)
+
+    @overload_scope
+    async def _detect_hoax_remote(self, text: str) -> Dict[str, Any]:
         """Detect hoax using external AI APIs"""
         try:
             # Try Replicate first
-            if self.replicate_api_key:
-                result = await self._try_replicate_hoax(text)
-                if result and not result.get("error"):
+            if self.router.is_available("replicate"):
+                result = await self._call_provider(
+                    "hoax_detection",
+                    "replicate",
+                    lambda: self._try_replicate_hoax(text),
+                )
+                if result is not None:
                     result["ai_tier"] = "primary"
                     result["ai_provider"] = "Replicate"
                     return result
-            
+
             # Fallback to safe default
+            raise_if_overloaded()
             return {
                 "is_hoax": False,
                 "confidence": 0.0,
                 "reason": "AI service unavailable, defaulting to safe",
                 "ai_tier": "none",
                 "ai_provider": "none",
-                "error": "Service unavailable"
+                "error": "Service unavailable",
             }
-            
+
+        except ProviderOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Hoax detection error: {e}")
             return {
@@ -225,63 +524,130 @@ class AIServiceRailway:
                 "reason": "Error occurred, defaulting to safe",
                 "ai_tier": "error",
                 "ai_provider": "error",
-                "error": str(e)
+                "error": str(e),
             }
-    
-    async def _try_replicate_hoax(self, text: str) -> Dict[str, Any]:
-        """Try Replicate for hoax detection"""
+
+    @overload_scope
+    async def detect_hoax_batch(
+        self, texts: List[str]
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Zero-shot hoax verdicts for a micro-batch in one Hugging Face request; None if unavailable"""
+        if self.router.is_available("huggingface"):
+            result = await self._call_provider(
+                "hoax_batch",
+                "huggingface",
+                lambda: self._try_huggingface_hoax_batch(texts),
+            )
+            if result is not None:
+                for item in result["results"]:
+                    item["ai_tier"] = "primary"
+                    item["ai_provider"] = "Hugging Face"
+                return result["results"]
+
+        raise_if_overloaded()
+        return None
+
+    async def _try_huggingface_hoax_batch(self, texts: List[str]) -> Dict[str, Any]:
+        """Hugging Face zero-shot classification (bart-large-mnli) for a list of inputs"""
         try:
             headers = {
-                "Authorization": f"Token {self.replicate_api_key}",
-                "Content-Type": "application/json"
+                "Authorization": f"Bearer {self.huggingface_api_key}",
+                "Content-Type": "application/json",
             }
-            
+            model_url = f"{self.huggingface_url}/{ZERO_SHOT_MODEL}"
             payload = {
-                "version": "ibm-granite/granite-3.3-8b-instruct",
-                "input": {
+                "inputs": [zero_shot_prompt(text) for text in texts],
+                "parameters": {"candidate_labels": ZERO_SHOT_LABELS},
+                "options": {"wait_for_model": True},
+            }
+
+            bulkhead = bulkheads.get("huggingface")
+            async with bulkhead.slot(self.huggingface_api_key):
+                response = await http_transport.client("huggingface").post(
+                    model_url, headers=headers, json=payload
+                )
+            bulkhead.note_response(response)
+
+            if response.status_code != 200:
+                return {"error": f"Hugging Face API error: {response.status_code}"}
+            result = response.json()
+            if isinstance(result, dict):
+                result = [result]
+            if not isinstance(result, list) or len(result) != len(texts):
+                return {"error": "Invalid response format"}
+            return {"results": [zero_shot_verdict(item) for item in result]}
+
+        except (ProviderOverloaded, CircuitOpenError):
+            raise
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def _try_replicate_hoax(self, text: str) -> Dict[str, Any]:
+        """Try Replicate for hoax detection"""
+        try:
+            result = await replicate_predictions.run(
+                self.replicate_chat_model,
+                {
                     "prompt": f"Analyze this text for potential misinformation or hoax content: {text}\n\nIs this likely to be a hoax? Respond with 'Yes' or 'No' and explain why.",
                     "max_new_tokens": 200,
-                    "temperature": 0.3
-                }
-            }
-            
-            response = requests.post(self.replicate_url, headers=headers, json=payload)
-            
-            if response.status_code == 201:
-                prediction_id = response.json().get("id")
+                    "temperature": 0.3,
+                },
+            )
+
+            if result["success"]:
+                answer = output_text(result["output"])
+                verdict = answer.lower().lstrip(" *\"'")
+                decided = verdict.startswith(("yes", "ya", "no", "tidak"))
                 return {
-                    "is_hoax": False,  # Default safe
-                    "confidence": 0.5,
-                    "reason": f"Analysis in progress (ID: {prediction_id})",
-                    "error": None
+                    "is_hoax": verdict.startswith(("yes", "ya")),
+                    "confidence": 0.7 if decided else 0.5,
+                    "reason": answer[:500] or "No explanation returned",
+                    "error": None,
                 }
             else:
-                return {"error": f"Replicate API error: {response.status_code}"}
-                
+                return {"error": f"Replicate API error: {result['error']}"}
+
+        except (ProviderOverloaded, CircuitOpenError):
+            raise
         except Exception as e:
             return {"error": str(e)}
-    
+
     async def analyze_sentiment(self, text: str) -> Dict[str, Any]:
+        """Analyze sentiment locally when the local classifier is confident, else remotely"""
+        local = local_classifier.sentiment(text)
+        if local is not None:
+            return local
+        return await self._analyze_sentiment_remote(text)
+
+    @overload_scope
+    async def _analyze_sentiment_remote(self, text: str) -> Dict[str, Any]:
         """Analyze sentiment using external AI APIs"""
         try:
             # Try Hugging Face for sentiment analysis
-            if self.huggingface_api_key:
-                result = await self._try_huggingface_sentiment(text)
-                if result and not result.get("error"):
+            if self.router.is_available("huggingface"):
+                result = await self._call_provider(
+                    "sentiment_analysis",
+                    "huggingface",
+                    lambda: self._try_huggingface_sentiment(text),
+                )
+                if result is not None:
                     result["ai_tier"] = "primary"
                     result["ai_provider"] = "Hugging Face"
                     return result
-            
+
             # Fallback to neutral
+            raise_if_overloaded()
             return {
                 "sentiment": "neutral",
                 "confidence": 0.0,
                 "score": 0.0,
                 "ai_tier": "none",
                 "ai_provider": "none",
-                "error": "Service unavailable"
+                "error": "Service unavailable",
             }
-            
+
+        except ProviderOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Sentiment analysis error: {e}")
             return {
@@ -290,52 +656,165 @@ class AIServiceRailway:
                 "score": 0.0,
                 "ai_tier": "error",
                 "ai_provider": "error",
-                "error": str(e)
+                "error": str(e),
             }
-    
+
     async def _try_huggingface_sentiment(self, text: str) -> Dict[str, Any]:
         """Try Hugging Face for sentiment analysis"""
         try:
             headers = {
                 "Authorization": f"Bearer {self.huggingface_api_key}",
-                "Content-Type": "application/json"
+                "Content-Type": "application/json",
             }
-            
+
             # Use a sentiment analysis model
             model_url = f"{self.huggingface_url}/cardiffnlp/twitter-roberta-base-sentiment-latest"
-            
+
             payload = {"inputs": text}
-            
-            response = requests.post(model_url, headers=headers, json=payload)
-            
+
+            bulkhead = bulkheads.get("huggingface")
+            async with bulkhead.slot(self.huggingface_api_key):
+                response = await http_transport.client("huggingface").post(
+                    model_url, headers=headers, json=payload
+                )
+            bulkhead.note_response(response)
+
             if response.status_code == 200:
                 result = response.json()
                 if isinstance(result, list) and len(result) > 0:
-                    # Map sentiment scores
-                    scores = result[0]
-                    if "label" in scores:
-                        sentiment_map = {
-                            "LABEL_0": "negative",
-                            "LABEL_1": "neutral", 
-                            "LABEL_2": "positive"
-                        }
-                        sentiment = sentiment_map.get(scores["label"], "neutral")
-                        confidence = scores.get("score", 0.0)
-                        
-                        return {
-                            "sentiment": sentiment,
-                            "confidence": confidence,
-                            "score": confidence,
-                            "error": None
-                        }
-                
+                    parsed = self._parse_huggingface_sentiment(result[0])
+                    if parsed:
+                        return parsed
+
                 return {"error": "Invalid response format"}
             else:
                 return {"error": f"Hugging Face API error: {response.status_code}"}
-                
+
+        except (ProviderOverloaded, CircuitOpenError):
+            raise
+        except Exception as e:
+            return {"error": str(e)}
+
+    async def analyze_sentiment_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Analyze sentiment of a micro-batch; texts the local classifier is confident about skip the providers"""
+        results = [local_classifier.sentiment(text) for text in texts]
+        remote = [index for index, result in enumerate(results) if result is None]
+        if remote:
+            remote_results = await self._analyze_sentiment_batch_remote(
+                [texts[index] for index in remote]
+            )
+            for index, result in zip(remote, remote_results):
+                results[index] = result
+        return results
+
+    @overload_scope
+    async def _analyze_sentiment_batch_remote(
+        self, texts: List[str]
+    ) -> List[Dict[str, Any]]:
+        """Analyze sentiment of a micro-batch with one Hugging Face request for the whole list"""
+        if self.router.is_available("huggingface"):
+            result = await self._call_provider(
+                "sentiment_batch",
+                "huggingface",
+                lambda: self._try_huggingface_sentiment_batch(texts),
+            )
+            if result is not None:
+                for item in result["results"]:
+                    item["ai_tier"] = "primary"
+                    item["ai_provider"] = "Hugging Face"
+                return result["results"]
+
+        raise_if_overloaded()
+        return [
+            {
+                "sentiment": "neutral",
+                "confidence": 0.0,
+                "score": 0.0,
+                "ai_tier": "none",
+                "ai_provider": "none",
+                "error": "Service unavailable",
+            }
+            for _ in texts
+        ]
+
+    async def _try_huggingface_sentiment_batch(
+        self, texts: List[str]
+    ) -> Dict[str, Any]:
+        """Hugging Face sentiment for a list of inputs (one result per input, in order)"""
+        try:
+            headers = {
+                "Authorization": f"Bearer {self.huggingface_api_key}",
+                "Content-Type": "application/json",
+            }
+            model_url = f"{self.huggingface_url}/cardiffnlp/twitter-roberta-base-sentiment-latest"
+            payload = {"inputs": texts, "options": {"wait_for_model": True}}
+
+            bulkhead = bulkheads.get("huggingface")
+            async with bulkhead.slot(self.huggingface_api_key):
+                response = await http_transport.client("huggingface").post(
+                    model_url, headers=headers, json=payload
+                )
+            bulkhead.note_response(response)
+
+            if response.status_code != 200:
+                return {"error": f"Hugging Face API error: {response.status_code}"}
+            result = response.json()
+            if not isinstance(result, list) or len(result) != len(texts):
+                return {"error": "Invalid response format"}
+
+            results = []
+            for scores in result:
+                results.append(
+                    self._parse_huggingface_sentiment(scores)
+                    or {
+                        "sentiment": "neutral",
+                        "confidence": 0.0,
+                        "score": 0.0,
+                        "error": "Invalid response format",
+                    }
+                )
+            return {"results": results}
+
+        except (ProviderOverloaded, CircuitOpenError):
+            raise
         except Exception as e:
             return {"error": str(e)}
-    
+
+    def _parse_huggingface_sentiment(self, scores: Any) -> Optional[Dict[str, Any]]:
+        """Map one input's label scores to a sentiment result (None if unrecognized)"""
+        if isinstance(scores, list) and scores:
+            scores = max(scores, key=lambda item: item.get("score", 0.0))
+        if not isinstance(scores, dict) or "label" not in scores:
+            return None
+
+        sentiment_map = {
+            "LABEL_0": "negative",
+            "LABEL_1": "neutral",
+            "LABEL_2": "positive",
+            "negative": "negative",
+            "neutral": "neutral",
+            "positive": "positive",
+        }
+        sentiment = sentiment_map.get(scores["label"], "neutral")
+        confidence = scores.get("score", 0.0)
+
+        return {
+            "sentiment": sentiment,
+            "confidence": confidence,
+            "score": confidence,
+            "error": None,
+        }
+
+    async def search_knowledge_base(
+        self, query: str, chatbot_id: str, limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """Search knowledge base for relevant content (in-process index, no provider call)"""
+        try:
+            return await knowledge_index.search(query, chatbot_id, limit)
+        except Exception as e:
+            logger.error(f"Error searching knowledge base: {e}")
+            return []
+
     def get_status(self) -> Dict[str, Any]:
         """Get AI service status"""
         return {
@@ -344,18 +823,35 @@ class AIServiceRailway:
             "version": "1.0.0",
             "deployment": "railway-lightweight",
             "ai_providers": {
-                "primary": "Replicate (IBM Granite)" if self.replicate_api_key else "Not configured",
-                "secondary": "Hugging Face (GPT-OSS-20B)" if self.huggingface_api_key else "Not configured",
-                "fallback": "IBM Orchestrate" if self.ibm_api_key else "Not configured"
+                "primary": (
+                    "Replicate (IBM Granite)"
+                    if self.router.is_available("replicate")
+                    else "Not configured"
+                ),
+                "secondary": (
+                    "Hugging Face (GPT-OSS-20B)"
+                    if self.router.is_available("huggingface")
+                    else "Not configured"
+                ),
+                "fallback": (
+                    "IBM Orchestrate"
+                    if self.router.is_available("ibm")
+                    else "Not configured"
+                ),
             },
+            "provider_ranking": self.router.ranking(),
+            "circuit_breakers": circuit_breakers.get_status(),
+            "hedging": hedger.get_stats(),
+            "bulkheads": bulkheads.get_stats(),
+            "local_classifier": local_classifier.get_stats(),
             "features": {
                 "chat": True,
                 "hoax_detection": True,
-                "sentiment_analysis": True
+                "sentiment_analysis": True,
             },
-            "notes": "Lightweight version for Railway deployment - no local ML packages required"
+            "notes": "Lightweight version for Railway deployment - no local ML packages required",
         }
-    
+
     def _get_timestamp(self) -> str:
         """Get current timestamp"""
         return datetime.now().isoformat()
@@ -0,0 +1,340 @@
+import asyncio
+import json
+import logging
+import re
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from services.bulkhead import ProviderOverloaded, begin_request
+from services.hoax_screening import screen_hoax
+from services.single_flight import normalize_input
+
+logger = logging.getLogger(__name__)
+
+# (caller's id or None, text)
+BatchItem = Tuple[Optional[Any], str]
+
+# Message header of a WhatsApp chat export, Android ("31/12/23 21.41 - Budi: ...")
+# and iOS ("[31/12/23 21.41.05] Budi: ...") styles
+_WHATSAPP_HEADER_RE = re.compile(
+    r"^\u200e?\[?(?P<timestamp>\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4},?\s+\d{1,2}[.:]\d{2}(?:[.:]\d{2})?(?:\s?[AaPp]\.?[Mm]\.?)?)\]?\s*(?:-\s*)?(?P<rest>.*)$"
+)
+_WHATSAPP_SENDER_RE = re.compile(r"^(?P<sender>[^:]{1,100}?):\s(?P<text>.*)$")
+_WHATSAPP_PLACEHOLDERS = {
+    "<media omitted>",
+    "<media tidak disertakan>",
+    "this message was deleted",
+    "pesan ini telah dihapus",
+    "you deleted this message",
+    "anda menghapus pesan ini",
+    "null",
+}
+
+
+class BatchInputError(Exception):
+    """The request body is not a usable batch"""
+
+
+class BatchTooLarge(BatchInputError):
+    """The request body exceeds the batch size limits"""
+
+
+async def read_batch_body(request, max_bytes: int) -> bytes:
+    """Read the request body, refusing it once it grows past `max_bytes`"""
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise BatchTooLarge(f"Batch body exceeds {max_bytes} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def _item(raw: Any, position: str) -> BatchItem:
+    if isinstance(raw, str):
+        item_id, text = None, raw
+    elif isinstance(raw, dict) and isinstance(raw.get("text"), str):
+        item_id, text = raw.get("id"), raw["text"]
+    else:
+        raise BatchInputError(
+            f'{position}: expected a string or an object with a "text" string'
+        )
+    if not text.strip():
+        raise BatchInputError(f"{position}: text is empty")
+    return item_id, text
+
+
+def parse_whatsapp_export(text: str) -> List[BatchItem]:
+    """Messages of a WhatsApp chat export (.txt), with {"timestamp", "sender"} as id.
+
+    Lines without a header continue the previous message; system notices and
+    media/deleted placeholders are skipped.
+    """
+    messages: List[Tuple[Dict[str, str], List[str]]] = []
+    current: Optional[List[str]] = None
+    for line in text.splitlines():
+        header = _WHATSAPP_HEADER_RE.match(line)
+        if header is None:
+            if current is not None:
+                current.append(line)
+            continue
+        message = _WHATSAPP_SENDER_RE.match(header.group("rest"))
+        if message is None:
+            # System notice ("Budi joined using this group's invite link")
+            current = None
+            continue
+        current = [message.group("text")]
+        messages.append(
+            (
+                {
+                    "timestamp": header.group("timestamp"),
+                    "sender": message.group("sender").strip("\u200e "),
+                },
+                current,
+            )
+        )
+
+    items = []
+    for item_id, lines in messages:
+        body = "\n".join(lines).replace("\u200e", "").strip()
+        if body and body.lower() not in _WHATSAPP_PLACEHOLDERS:
+            items.append((item_id, body))
+    return items
+
+
+def parse_batch_items(
+    body: bytes, content_type: str, max_items: int
+) -> List[BatchItem]:
+    """Items from a JSON array, an NDJSON body (one JSON value per line) or,
+    for text/plain, a WhatsApp chat export.
+
+    Each JSON item is either a string or an object with a "text" string and
+    an optional "id" that is echoed back with its result.
+    """
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise BatchInputError("Batch body is not valid UTF-8")
+
+    if content_type.startswith("text/plain"):
+        items = parse_whatsapp_export(text)
+        if not items:
+            raise BatchInputError("No WhatsApp messages found")
+        if len(items) > max_items:
+            raise BatchTooLarge(
+                f"Batch has {len(items)} items, the limit is {max_items}"
+            )
+        return items
+
+    if (
+        "ndjson" in content_type
+        or "jsonl" in content_type
+        or not text.lstrip().startswith("[")
+    ):
+        raws = []
+        for number, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                raws.append((json.loads(line), f"line {number}"))
+            except json.JSONDecodeError as e:
+                raise BatchInputError(f"line {number}: {e.msg}")
+    else:
+        try:
+            values = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise BatchInputError(f"Invalid JSON: {e.msg}")
+        raws = [(value, f"item {index}") for index, value in enumerate(values)]
+
+    if not raws:
+        raise BatchInputError("Batch is empty")
+    if len(raws) > max_items:
+        raise BatchTooLarge(f"Batch has {len(raws)} items, the limit is {max_items}")
+    return [_item(raw, position) for raw, position in raws]
+
+
+def micro_batches(items: List[Any], size: int) -> List[List[Any]]:
+    """Split items into consecutive provider-sized batches"""
+    size = max(size, 1)
+    return [items[start : start + size] for start in range(0, len(items), size)]
+
+
+async def iter_ordered(
+    batches: List[Any], run: Callable[[Any], Awaitable[Any]], concurrency: int
+) -> AsyncIterator[Any]:
+    """Run `run(batch)` with at most `concurrency` batches in flight, yielding results in input order"""
+    pending: "deque[asyncio.Future]" = deque()
+    try:
+        for batch in batches:
+            pending.append(asyncio.ensure_future(run(batch)))
+            if len(pending) >= max(concurrency, 1):
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        # The client went away or a batch failed: stop the rest
+        for task in pending:
+            task.cancel()
+
+
+async def run_with_backoff(
+    run: Callable[[Any], Awaitable[Any]], batch: Any, retries: int
+) -> Any:
+    """Run one micro-batch under its own provider deadline, waiting out overload refusals"""
+    for attempt in range(retries + 1):
+        begin_request(settings.request_deadline)
+        try:
+            return await run(batch)
+        except ProviderOverloaded as e:
+            if attempt == retries:
+                raise
+            logger.info(
+                f"Batch of {len(batch)} refused ({e}), retrying in {e.retry_after:.1f}s"
+            )
+            await asyncio.sleep(e.retry_after)
+
+
+async def analyze_batches(
+    items: List[BatchItem],
+    analyze: Callable[[List[str]], Awaitable[List[Dict[str, Any]]]],
+    batch_size: int,
+    concurrency: Optional[int] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Per-item results of `analyze(texts)` over micro-batches, in input order.
+
+    Each result carries the item's position ("index") and, when given, its
+    "id". A micro-batch that fails outright yields an error result for each
+    of its items instead of ending the stream.
+    """
+    indexed = list(enumerate(items))
+
+    async def run(batch: List[Tuple[int, BatchItem]]) -> List[Dict[str, Any]]:
+        texts = [text for _, (_, text) in batch]
+        try:
+            results = await run_with_backoff(
+                analyze, texts, settings.batch_overload_retries
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Batch analysis of {len(texts)} texts failed: {str(e)}")
+            results = [{"error": str(e)} for _ in texts]
+
+        rows = []
+        for (index, (item_id, _)), result in zip(batch, results):
+            row = {"index": index}
+            if item_id is not None:
+                row["id"] = item_id
+            row.update(
+                (key, value) for key, value in result.items() if key != "raw_result"
+            )
+            rows.append(row)
+        return rows
+
+    async for rows in iter_ordered(
+        micro_batches(indexed, batch_size),
+        run,
+        concurrency or settings.batch_concurrency,
+    ):
+        for row in rows:
+            yield row
+
+
+async def scan_hoaxes(
+    items: List[BatchItem],
+    detect_batch: Callable[[List[str]], Awaitable[Optional[List[Dict[str, Any]]]]],
+    batch_size: int,
+    concurrency: Optional[int] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Per-item hoax verdicts, in input order.
+
+    Identical messages (ignoring case and whitespace) are analyzed once and
+    repeats point at the first one via "duplicate_of". Every message gets
+    the local indicator screen; only ambiguous ones go to `detect_batch`
+    (zero-shot) in micro-batches, falling back to the local verdict when no
+    provider answers.
+    """
+    unique_texts: List[str] = []
+    first_item: List[int] = []
+    unique_of: List[int] = []
+    seen: Dict[str, int] = {}
+    for index, (_, text) in enumerate(items):
+        key = normalize_input(text)
+        unique = seen.get(key)
+        if unique is None:
+            unique = seen[key] = len(unique_texts)
+            unique_texts.append(text)
+            first_item.append(index)
+        unique_of.append(unique)
+
+    screenings = []
+    verdicts: List[Optional[Dict[str, Any]]] = []
+    ambiguous: List[int] = []
+    for unique, text in enumerate(unique_texts):
+        screening = screen_hoax(text)
+        is_ambiguous = screening.pop("ambiguous")
+        screening["source"] = "local"
+        screenings.append(screening)
+        verdicts.append(None if is_ambiguous else screening)
+        if is_ambiguous:
+            ambiguous.append(unique)
+
+    async def run(batch: List[int]) -> List[Tuple[int, Dict[str, Any]]]:
+        try:
+            results = await run_with_backoff(
+                detect_batch,
+                [unique_texts[unique] for unique in batch],
+                settings.batch_overload_retries,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Batch hoax detection of {len(batch)} texts failed: {str(e)}")
+            results = None
+        if results is None:
+            return [(unique, screenings[unique]) for unique in batch]
+        return [
+            (
+                unique,
+                {
+                    **result,
+                    "indicators": screenings[unique]["indicators"],
+                    "source": "zero-shot",
+                },
+            )
+            for unique, result in zip(batch, results)
+        ]
+
+    # Batches finish in first-occurrence order, so each one unblocks the next run of items
+    finished = iter_ordered(
+        micro_batches(ambiguous, batch_size),
+        run,
+        concurrency or settings.batch_concurrency,
+    )
+    next_index = 0
+    try:
+        while next_index < len(items):
+            unique = unique_of[next_index]
+            if verdicts[unique] is None:
+                for done, verdict in await finished.__anext__():
+                    verdicts[done] = verdict
+                continue
+
+            row = {"index": next_index}
+            item_id = items[next_index][0]
+            if item_id is not None:
+                row["id"] = item_id
+            row.update(verdicts[unique])
+            if first_item[unique] != next_index:
+                row["duplicate_of"] = first_item[unique]
+            yield row
+            next_index += 1
+    finally:
+        await finished.aclose()
+
+
+def ndjson_line(data: Dict[str, Any]) -> str:
+    """Format one NDJSON record"""
+    return json.dumps(data, ensure_ascii=False) + "\n"
@@ -0,0 +1,123 @@
+import math
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class BM25Index:
+    """Incremental inverted index scored with Okapi BM25.
+
+    Each term maps to two parallel growable int arrays (document ids, term
+    frequencies). Documents are appended with `add()`; scoring accumulates
+    every query term's postings into one score vector with NumPy.
+
+    An index loaded from disk keeps its postings in a read-only snapshot
+    (`base`); a term's arrays are copied into memory the first time a new
+    document mentions it.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.doc_lengths = array("i")
+        self._total_length = 0
+        self._base = None
+
+    @classmethod
+    def from_snapshot(
+        cls,
+        doc_lengths: np.ndarray,
+        total_length: int,
+        base,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> "BM25Index":
+        """Build an index over persisted arrays (see services.index_store)"""
+        index = cls(k1, b)
+        index.doc_lengths = doc_lengths
+        index._total_length = total_length
+        index._base = base
+        return index
+
+    @property
+    def total_length(self) -> int:
+        return self._total_length
+
+    def posting(self, term: str) -> Optional[Tuple]:
+        """(document ids, term frequencies) for a term, or None"""
+        posting = self.postings.get(term)
+        if posting is None and self._base is not None:
+            posting = self._base.get(term)
+        return posting
+
+    def terms(self) -> Iterable[str]:
+        if self._base is None:
+            return self.postings.keys()
+        return set(self.postings) | set(self._base.terms)
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, tokens: List[str]) -> int:
+        """Index a tokenized document; returns its document id"""
+        if not isinstance(self.doc_lengths, array):
+            self.doc_lengths = _to_array(self.doc_lengths)
+
+        doc_id = len(self.doc_lengths)
+        frequencies: Dict[str, int] = {}
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+
+        for term, frequency in frequencies.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                base = self._base.get(term) if self._base is not None else None
+                if base is not None:
+                    posting = (_to_array(base[0]), _to_array(base[1]))
+                else:
+                    posting = (array("i"), array("i"))
+                self.postings[term] = posting
+            posting[0].append(doc_id)
+            posting[1].append(frequency)
+
+        self.doc_lengths.append(len(tokens))
+        self._total_length += len(tokens)
+        return doc_id
+
+    def search(self, query_tokens: List[str], k: int) -> List[Tuple[int, float]]:
+        """Top-k (document id, BM25 score), best first; documents without any query term are skipped"""
+        n_docs = len(self.doc_lengths)
+        if n_docs == 0 or k <= 0:
+            return []
+
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.int32).astype(np.float32)
+        avg_length = self._total_length / n_docs or 1.0
+        length_norm = self.k1 * (1 - self.b + self.b * doc_lengths / avg_length)
+
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term in set(query_tokens):
+            posting = self.posting(term)
+            if posting is None:
+                continue
+            doc_ids = np.frombuffer(posting[0], dtype=np.int32)
+            tf = np.frombuffer(posting[1], dtype=np.int32).astype(np.float32)
+            df = len(doc_ids)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            scores[doc_ids] += idf * tf * (self.k1 + 1) / (tf + length_norm[doc_ids])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0:
+            return []
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        order = matched[np.argsort(-scores[matched])]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in order]
+
+
+def _to_array(values) -> array:
+    """Copy an int32 buffer into a growable array"""
+    copied = array("i")
+    copied.frombytes(np.ascontiguousarray(values, dtype=np.int32).tobytes())
+    return copied
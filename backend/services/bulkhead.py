@@ -0,0 +1,303 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Dict, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Per-request state shared with every task the request spawns (set by the HTTP middleware;
+# background work drops it, see `detached`)
+_request_state: ContextVar[Optional[Dict[str, Any]]] = ContextVar(
+    "provider_request_state", default=None
+)
+# Refusals of the AI operation in progress (see overload_scope)
+_operation_state: ContextVar[Optional[Dict[str, Any]]] = ContextVar(
+    "provider_operation_state", default=None
+)
+
+
+class ProviderOverloaded(Exception):
+    """A provider call was refused locally because it could not start before the deadline"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def begin_request(timeout: float) -> None:
+    """Start the provider deadline for the current request"""
+    _request_state.set({"deadline": time.monotonic() + timeout})
+
+
+async def detached(coroutine: Awaitable[Any]) -> Any:
+    """Run background work started during a request without the request's deadline or operation scope"""
+    _request_state.set(None)
+    _operation_state.set(None)
+    return await coroutine
+
+
+def time_remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline, None outside a request"""
+    state = _request_state.get()
+    if state is None:
+        return None
+    return state["deadline"] - time.monotonic()
+
+
+def overload_scope(operation):
+    """Decorate an async AI operation so `raise_if_overloaded` only sees its own refusals.
+
+    Concurrent operations of one request (generation next to sentiment and
+    hoax analysis) each get their own record; tasks an operation starts
+    share it. A nested operation's refusals also count for the outer one.
+    """
+
+    @functools.wraps(operation)
+    async def scoped(*args, **kwargs):
+        state = {"retry_after": None}
+        token = _operation_state.set(state)
+        try:
+            return await operation(*args, **kwargs)
+        finally:
+            _operation_state.reset(token)
+            outer = _operation_state.get()
+            if outer is not None and state["retry_after"] is not None:
+                outer["retry_after"] = max(
+                    outer["retry_after"] or 0.0, state["retry_after"]
+                )
+
+    return scoped
+
+
+def raise_if_overloaded() -> None:
+    """Raise ProviderOverloaded if a provider was refused for overload during the current operation"""
+    state = _operation_state.get()
+    if state is not None and state["retry_after"] is not None:
+        raise ProviderOverloaded("AI providers are overloaded", state["retry_after"])
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After header as seconds (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Request rate limit for one API key"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token; returns how long the caller must wait before using it"""
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class Bulkhead:
+    """Concurrency limit and bounded queue for one provider.
+
+    At most `max_concurrent` calls run at once and at most `max_queue` wait.
+    A call that cannot start before the request deadline (or `queue_timeout`
+    outside a request), because of the queue, the API key's token bucket or
+    a provider Retry-After cooldown, is refused immediately with
+    ProviderOverloaded instead of piling onto the provider.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int = 8,
+        max_queue: int = 32,
+        queue_timeout: float = 10.0,
+        rate_per_key: float = 0.0,
+        burst_per_key: int = 10,
+        alpha: float = 0.2,
+    ):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate_per_key = rate_per_key
+        self.burst_per_key = burst_per_key
+        self.alpha = alpha
+
+        self.active = 0
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._cooldown_until = 0.0
+        self._avg_hold: Optional[float] = None
+
+        self.stats = {"calls": 0, "queued": 0, "rejected": 0, "throttled": 0}
+
+    def _bucket(self, api_key: str) -> Optional[TokenBucket]:
+        if self.rate_per_key <= 0:
+            return None
+        key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(
+                self.rate_per_key, self.burst_per_key
+            )
+        return bucket
+
+    def estimated_queue_wait(self) -> float:
+        """Expected wait for a slot given the callers already running or queued"""
+        ahead = self.active + self.waiting - self.max_concurrent
+        if ahead < 0:
+            return 0.0
+        hold = self._avg_hold if self._avg_hold is not None else 1.0
+        return (ahead // self.max_concurrent + 1) * hold
+
+    def note_response(self, response) -> None:
+        """Honour Retry-After on 429/503 responses by pausing new calls"""
+        if response.status_code not in (429, 503):
+            return
+        delay = parse_retry_after(response.headers.get("Retry-After"))
+        if delay is None:
+            delay = 1.0 if response.status_code == 429 else 0.0
+        if delay > 0:
+            self.stats["throttled"] += 1
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+            logger.warning(f"{self.name} asked to back off for {delay:.1f}s")
+
+    def _reject(self, reason: str, retry_after: float) -> ProviderOverloaded:
+        self.stats["rejected"] += 1
+        retry_after = max(retry_after, 1.0)
+        state = _operation_state.get()
+        if state is not None:
+            state["retry_after"] = max(state["retry_after"] or 0.0, retry_after)
+        logger.warning(f"{self.name} overloaded: {reason}")
+        return ProviderOverloaded(f"{self.name} overloaded: {reason}", retry_after)
+
+    @asynccontextmanager
+    async def slot(self, api_key: str = ""):
+        """Hold one of the provider's concurrency slots for the duration of a call"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        remaining = time_remaining()
+        budget = (
+            self.queue_timeout
+            if remaining is None
+            else min(remaining, self.queue_timeout)
+        )
+        started = time.monotonic()
+
+        if self.active + self.waiting >= self.max_concurrent + self.max_queue:
+            raise self._reject("queue full", self.estimated_queue_wait())
+
+        bucket = self._bucket(api_key)
+        delay = max(self._cooldown_until - started, bucket.reserve() if bucket else 0.0)
+        expected = delay + self.estimated_queue_wait()
+        if expected > budget:
+            if bucket:
+                bucket.refund()
+            raise self._reject(
+                f"expected wait {expected:.1f}s exceeds deadline", expected
+            )
+
+        if self.active + self.waiting >= self.max_concurrent or delay > 0:
+            self.stats["queued"] += 1
+        self.waiting += 1
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await asyncio.wait_for(
+                self._semaphore.acquire(),
+                max(budget - (time.monotonic() - started), 0.0),
+            )
+        except asyncio.TimeoutError:
+            if bucket:
+                bucket.refund()  # never sent, so it does not count against the rate limit
+            raise self._reject(
+                "no free slot before deadline", self.estimated_queue_wait()
+            )
+        except asyncio.CancelledError:
+            if bucket:
+                bucket.refund()
+            raise
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.stats["calls"] += 1
+        acquired = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            hold = time.monotonic() - acquired
+            self._avg_hold = (
+                hold
+                if self._avg_hold is None
+                else self.alpha * hold + (1 - self.alpha) * self._avg_hold
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "cooldown": round(max(self._cooldown_until - time.monotonic(), 0.0), 1),
+        }
+
+
+class BulkheadRegistry:
+    """One bulkhead per provider, created on first use"""
+
+    def __init__(self, **options):
+        self.options = options
+        self._bulkheads: Dict[str, Bulkhead] = {}
+
+    def get(self, provider: str) -> Bulkhead:
+        bulkhead = self._bulkheads.get(provider)
+        if bulkhead is None:
+            bulkhead = self._bulkheads[provider] = Bulkhead(provider, **self.options)
+        return bulkhead
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get concurrency and queue statistics per provider"""
+        return {
+            name: bulkhead.get_stats()
+            for name, bulkhead in sorted(self._bulkheads.items())
+        }
+
+
+# Global instance
+bulkheads = BulkheadRegistry(
+    max_concurrent=settings.provider_max_concurrency,
+    max_queue=settings.provider_max_queue,
+    queue_timeout=settings.provider_queue_timeout,
+    rate_per_key=settings.provider_rate_per_key,
+    burst_per_key=settings.provider_rate_burst,
+)
@@ -0,0 +1,399 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Dict, NamedTuple, Optional, Tuple
+
+from config import settings
+from services.bulkhead import ProviderOverloaded
+from services.keyword_matcher import keyword_matcher
+from services.response_cache import response_cache
+from services.semantic_cache import semantic_cache
+from services.single_flight import flight_key, single_flight
+
+logger = logging.getLogger(__name__)
+
+
+class PreparedChat(NamedTuple):
+    """What /chat and /chat/stream know before generating an answer"""
+
+    version: Optional[
+        str
+    ]  # knowledge stamp the answer will be grounded on (None: unknown, skip the semantic cache)
+    context: str
+    cache_key: Optional[str]  # response cache key (None after a semantic cache hit)
+    cached: Optional[Dict[str, Any]]  # cached answer to reuse instead of generating
+
+
+class ChatPipeline:
+    """Staged /chat pipeline.
+
+    Knowledge lookup + response generation form one chain, while sentiment and
+    hoax analysis (which only need the user message) run next to it. Every stage
+    has its own deadline, so a slow provider degrades its own stage instead of
+    the whole request.
+    """
+
+    def __init__(self, ai_service, database_service, conversation_logger):
+        self.ai_service = ai_service
+        self.database_service = database_service
+        self.conversation_logger = conversation_logger
+
+    def should_check_hoax(self, message: str) -> bool:
+        """Check if message contains links or suspicious claims (data/lexicons/hoax_triggers.txt)"""
+        return "http" in message.lower() or bool(
+            keyword_matcher.find(message, ["hoax_triggers"])
+        )
+
+    async def run(self, message: str, chatbot_id: str) -> Dict[str, Any]:
+        """Run all stages for a chat message and log the conversation"""
+        timings: Dict[str, float] = {}
+
+        generation_task = asyncio.create_task(
+            self._retrieve_and_generate(message, chatbot_id, timings)
+        )
+        sentiment_task, hoax_task = self._start_analysis(message, timings)
+
+        try:
+            ai_response = await generation_task
+            sentiment_result, hoax_result = await self._finish_analysis(
+                sentiment_task, hoax_task
+            )
+        except BaseException:
+            self._cancel(generation_task, sentiment_task, hoax_task)
+            raise
+
+        result = self._build_result(ai_response, sentiment_result, hoax_result, timings)
+
+        await self.log(message, chatbot_id, result)
+
+        logger.info(f"Chat pipeline for {chatbot_id} finished: {timings}")
+        return result
+
+    async def stream(
+        self, message: str, chatbot_id: str
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Run the pipeline, yielding token events while the answer is generated.
+
+        Sentiment and hoax results are only known at the end, so they arrive in
+        a trailing "metadata" event followed by "done".
+        """
+        timings: Dict[str, float] = {}
+        sentiment_task, hoax_task = self._start_analysis(message, timings)
+
+        try:
+            prepared = await self._prepare(message, chatbot_id, timings)
+            ai_response = prepared.cached
+            if ai_response is not None:
+                yield {"event": "token", "data": {"text": ai_response["response"]}}
+            else:
+                started = time.perf_counter()
+                deadline = started + settings.chat_generation_timeout
+                stream = self.ai_service.stream_chat_response(
+                    message, prepared.context, chatbot_id
+                )
+                try:
+                    while True:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError()
+                        event = await asyncio.wait_for(
+                            stream.__anext__(), timeout=remaining
+                        )
+                        if event["type"] == "token":
+                            yield {"event": "token", "data": {"text": event["text"]}}
+                        elif event["type"] == "done":
+                            ai_response = event
+                            break
+                except StopAsyncIteration:
+                    pass
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        f"Chat stage 'generation' exceeded its {settings.chat_generation_timeout}s deadline"
+                    )
+                finally:
+                    await stream.aclose()
+                    timings["generation"] = round(
+                        (time.perf_counter() - started) * 1000, 1
+                    )
+                if ai_response:
+                    await self._store_response(
+                        message,
+                        chatbot_id,
+                        prepared,
+                        ai_response,
+                        timings["generation"] / 1000,
+                    )
+
+            if not ai_response:
+                ai_response = self._timed_out_response()
+                yield {"event": "token", "data": {"text": ai_response["response"]}}
+
+            sentiment_result, hoax_result = await self._finish_analysis(
+                sentiment_task, hoax_task
+            )
+        except BaseException:
+            self._cancel(sentiment_task, hoax_task)
+            raise
+
+        result = self._build_result(ai_response, sentiment_result, hoax_result, timings)
+        yield {
+            "event": "metadata",
+            "data": {
+                "confidence": result["confidence"],
+                "sentiment": result["sentiment"],
+                "is_hoax_detected": result["is_hoax_detected"],
+                "ai_provider": result["ai_provider"],
+            },
+        }
+
+        await self.log(message, chatbot_id, result)
+        yield {"event": "done", "data": {"response": result["response"]}}
+
+    async def retrieve_context(
+        self, message: str, chatbot_id: str, timings: Dict[str, float]
+    ) -> str:
+        """Knowledge stage: build prompt context from the most relevant chunks"""
+        context_items = await self._run_stage(
+            "knowledge",
+            self.ai_service.search_knowledge_base(
+                message, chatbot_id, settings.chat_context_items
+            ),
+            settings.chat_knowledge_timeout,
+            timings,
+        )
+        if not context_items:
+            return ""
+
+        # Best chunks first, stop once the prompt context budget is used up
+        parts = []
+        used = 0
+        for item in context_items:
+            if parts and used + len(item["content"]) > settings.chat_context_max_chars:
+                break
+            parts.append(item["content"])
+            used += len(item["content"])
+        return "\n".join(parts)
+
+    async def log(self, message: str, chatbot_id: str, result: Dict[str, Any]) -> None:
+        """Queue the finished exchange for write-behind logging"""
+        conversation_metadata = {
+            "sentiment": result.get("sentiment"),
+            "confidence": result.get("confidence"),
+            "is_hoax_detected": result.get("is_hoax_detected", False),
+        }
+
+        await self.conversation_logger.log_conversation(
+            chatbot_id, message, result["response"], conversation_metadata
+        )
+
+    def _start_analysis(
+        self, message: str, timings: Dict[str, float]
+    ) -> Tuple[asyncio.Task, Optional[asyncio.Task]]:
+        """Start sentiment (and, if triggered, hoax) analysis in the background"""
+        # Analysis only depends on the message, so identical messages share it across chatbots
+        sentiment_task = asyncio.create_task(
+            self._run_stage(
+                "sentiment",
+                single_flight.do(
+                    flight_key("sentiment_analysis", message),
+                    lambda: self.ai_service.analyze_sentiment(message),
+                ),
+                settings.chat_analysis_timeout,
+                timings,
+            )
+        )
+        hoax_task = None
+        if self.should_check_hoax(message):
+            hoax_task = asyncio.create_task(
+                self._run_stage(
+                    "hoax",
+                    single_flight.do(
+                        flight_key("hoax_detection", message),
+                        lambda: self.ai_service.detect_hoax(message),
+                    ),
+                    settings.chat_analysis_timeout,
+                    timings,
+                )
+            )
+        return sentiment_task, hoax_task
+
+    async def _finish_analysis(
+        self, sentiment_task: asyncio.Task, hoax_task: Optional[asyncio.Task]
+    ) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """Collect analysis results (stages already enforce their deadlines)"""
+        sentiment_result = await sentiment_task or {}
+        hoax_result = await hoax_task if hoax_task else None
+        return sentiment_result, hoax_result
+
+    def _build_result(
+        self,
+        ai_response: Dict[str, Any],
+        sentiment_result: Dict[str, Any],
+        hoax_result: Optional[Dict[str, Any]],
+        timings: Dict[str, float],
+    ) -> Dict[str, Any]:
+        """Combine stage outputs into the chat result"""
+        return {
+            "response": ai_response["response"],
+            "confidence": ai_response.get("confidence", 0.7),
+            "sentiment": sentiment_result.get("sentiment", "neutral"),
+            "is_hoax_detected": (
+                hoax_result.get("is_hoax", False) if hoax_result else False
+            ),
+            "ai_provider": ai_response.get("ai_provider"),
+            "stage_timings": timings,
+        }
+
+    def _cancel(self, *tasks: Optional[asyncio.Task]) -> None:
+        """Cancel stage tasks that are still running"""
+        for task in tasks:
+            if task and not task.done():
+                task.cancel()
+
+    async def _prepare(
+        self, message: str, chatbot_id: str, timings: Dict[str, float]
+    ) -> PreparedChat:
+        """Steps before generation: semantic cache, knowledge lookup, exact response cache"""
+        # A rephrasing of an answered question skips retrieval and generation.
+        # The lookup has its own deadline; a slow one counts as a miss.
+        version, cached = await self._run_stage(
+            "semantic_cache",
+            self._semantic_lookup(message, chatbot_id),
+            settings.semantic_cache_timeout,
+            timings,
+        ) or (None, None)
+        if cached is not None:
+            timings["generation"] = 0.0
+            return PreparedChat(version, "", None, cached)
+
+        context = await self.retrieve_context(message, chatbot_id, timings)
+
+        cache_key = self._cache_key(message, chatbot_id, context)
+        cached = await response_cache.get(chatbot_id, cache_key)
+        if cached is not None:
+            timings["generation"] = 0.0
+        return PreparedChat(version, context, cache_key, cached)
+
+    async def _retrieve_and_generate(
+        self, message: str, chatbot_id: str, timings: Dict[str, float]
+    ) -> Dict[str, Any]:
+        """Knowledge lookup followed by response generation"""
+        prepared = await self._prepare(message, chatbot_id, timings)
+        if prepared.cached is not None:
+            return prepared.cached
+
+        async def generate() -> Dict[str, Any]:
+            started = time.perf_counter()
+            response = await self.ai_service.generate_chat_response(
+                message, prepared.context, chatbot_id
+            )
+            await self._store_response(
+                message, chatbot_id, prepared, response, time.perf_counter() - started
+            )
+            return response
+
+        ai_response = await self._run_stage(
+            "generation",
+            # Identical questions to the same chatbot with the same context share one provider call
+            single_flight.do(
+                flight_key("chat", message, chatbot_id, prepared.context), generate
+            ),
+            settings.chat_generation_timeout,
+            timings,
+            # Providers refused the generation itself for overload: let the endpoint answer 503
+            raise_overloaded=True,
+        )
+        return ai_response or self._timed_out_response()
+
+    def _timed_out_response(self) -> Dict[str, Any]:
+        return {
+            "response": "Maaf, saya membutuhkan waktu terlalu lama untuk menjawab. Silakan coba lagi.",
+            "confidence": 0.0,
+            "error": "Generation stage timed out",
+        }
+
+    def _cache_key(self, message: str, chatbot_id: str, context: str) -> str:
+        return response_cache.key(
+            chatbot_id,
+            message,
+            context,
+            getattr(self.ai_service, "chat_model_signature", ""),
+        )
+
+    async def _knowledge_version(self, chatbot_id: str) -> Optional[str]:
+        """Knowledge stamp shared by all workers (local write stamp when the database has none)"""
+        get_knowledge_stamp = getattr(
+            self.database_service, "get_knowledge_stamp", None
+        )
+        if get_knowledge_stamp:
+            return await get_knowledge_stamp(chatbot_id)
+        knowledge_cache = getattr(self.database_service, "knowledge_cache", None)
+        return str(knowledge_cache.version(chatbot_id) if knowledge_cache else 0)
+
+    async def _semantic_lookup(
+        self, message: str, chatbot_id: str
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        if not semantic_cache.enabled:
+            return None, None
+        version = await self._knowledge_version(chatbot_id)
+        if version is None:
+            return None, None
+        return version, await semantic_cache.lookup(chatbot_id, message, version)
+
+    async def _store_response(
+        self,
+        message: str,
+        chatbot_id: str,
+        prepared: PreparedChat,
+        ai_response: Dict[str, Any],
+        latency: float,
+    ) -> None:
+        """Cache a successful answer (fallback and error messages are never cached)"""
+        if ai_response.get("error") or not ai_response.get("confidence"):
+            return
+        cached = {
+            "response": ai_response["response"],
+            "confidence": ai_response["confidence"],
+            "ai_provider": ai_response.get("ai_provider"),
+            "ai_tier": ai_response.get("ai_tier"),
+            "cache_hit": True,
+        }
+        await response_cache.put(chatbot_id, prepared.cache_key, cached)
+        # An answer grounded on knowledge that changed meanwhile is not reused for rephrasings
+        if (
+            prepared.version is not None
+            and prepared.version == await self._knowledge_version(chatbot_id)
+        ):
+            await semantic_cache.store(
+                chatbot_id, message, cached, latency, prepared.version
+            )
+
+    async def _run_stage(
+        self,
+        name: str,
+        awaitable: Awaitable[Any],
+        timeout: float,
+        timings: Dict[str, float],
+        raise_overloaded: bool = False,
+    ) -> Optional[Any]:
+        """Await a stage under its deadline; returns None on timeout or error.
+
+        With `raise_overloaded`, ProviderOverloaded from the stage's own
+        provider calls is re-raised instead.
+        """
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(awaitable, timeout=timeout)
+        except ProviderOverloaded as e:
+            if raise_overloaded:
+                raise
+            logger.warning(f"Chat stage '{name}' refused: {str(e)}")
+            return None
+        except asyncio.TimeoutError:
+            logger.warning(f"Chat stage '{name}' exceeded its {timeout}s deadline")
+            return None
+        except Exception as e:
+            logger.error(f"Chat stage '{name}' failed: {str(e)}")
+            return None
+        finally:
+            timings[name] = round((time.perf_counter() - started) * 1000, 1)
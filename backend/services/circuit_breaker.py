@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider/model whose breaker is open"""
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one provider or model.
+
+    `failure_threshold` consecutive failures open the circuit. While open,
+    calls are rejected immediately. After `recovery_timeout` seconds, up to
+    `half_open_max_calls` probe calls at a time are let through.
+    `success_threshold` successful probes close the circuit again, and a
+    failed probe re-opens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        success_threshold: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.success_threshold = success_threshold
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go through now (reserves a probe slot when half-open)"""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.recovery_timeout:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+            logger.info(f"Circuit {self.name} half-open, probing")
+
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight >= self.half_open_max_calls:
+                self.rejected += 1
+                return False
+            self._probes_in_flight += 1
+        return True
+
+    def record_success(self) -> None:
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+            self._probe_successes += 1
+            if self._probe_successes >= self.success_threshold:
+                self.state = CLOSED
+                logger.info(f"Circuit {self.name} closed")
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+            self._trip()
+        elif (
+            self.state == CLOSED and self.consecutive_failures >= self.failure_threshold
+        ):
+            self._trip()
+
+    def release(self) -> None:
+        """Give back a probe slot without a verdict (e.g. the call was cancelled)"""
+        if self.state == HALF_OPEN:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    def _trip(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.trips += 1
+        logger.warning(
+            f"Circuit {self.name} opened after {self.consecutive_failures} consecutive failures"
+        )
+
+    @asynccontextmanager
+    async def guard(self):
+        """Run a block as one call through the breaker; raises CircuitOpenError if rejected"""
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit open for {self.name}")
+        try:
+            yield
+        except (asyncio.CancelledError, GeneratorExit):
+            self.release()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        else:
+            self.record_success()
+
+    def get_status(self) -> Dict[str, Any]:
+        status = {
+            "state": self.state,
+            "trips": self.trips,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected,
+        }
+        if self.state == OPEN:
+            status["retry_in"] = round(
+                max(self.recovery_timeout - (time.monotonic() - self._opened_at), 0.0),
+                1,
+            )
+        return status
+
+
+class CircuitBreakerRegistry:
+    """Breakers created on first use, keyed by provider ("replicate") or provider:model"""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        success_threshold: int = 1,
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.success_threshold = success_threshold
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=self.failure_threshold,
+                recovery_timeout=self.recovery_timeout,
+                half_open_max_calls=self.half_open_max_calls,
+                success_threshold=self.success_threshold,
+            )
+        return breaker
+
+    def is_open(self, name: str) -> bool:
+        breaker = self._breakers.get(name)
+        return breaker is not None and breaker.state == OPEN
+
+    def get_status(self) -> Dict[str, Any]:
+        """States and trip counts of every breaker"""
+        return {
+            name: breaker.get_status()
+            for name, breaker in sorted(self._breakers.items())
+        }
+
+
+# Global instance
+circuit_breakers = CircuitBreakerRegistry(
+    failure_threshold=settings.circuit_failure_threshold,
+    recovery_timeout=settings.circuit_recovery_timeout,
+    half_open_max_calls=settings.circuit_half_open_max_calls,
+    success_threshold=settings.circuit_success_threshold,
+)
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from services.supabase_service import supabase_service
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationLogWriter:
+    """Write-behind buffer for conversation logging.
+
+    Rows are queued in memory and flushed as bulk inserts once a batch fills
+    up or the flush interval passes. The queue is bounded: when it is full,
+    callers wait (backpressure) and, after `enqueue_timeout`, write the row
+    directly instead of dropping it.
+    """
+
+    def __init__(
+        self,
+        database_service,
+        max_queue_size: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 2.0,
+        enqueue_timeout: float = 1.0,
+    ):
+        self.database_service = database_service
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.stats = {
+            "enqueued": 0,
+            "flushed": 0,
+            "batches": 0,
+            "failed": 0,
+            "direct_writes": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def start(self) -> None:
+        """Start the background flusher (call from app startup)"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._stopping = False
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Conversation log writer started (batch={self.batch_size}, interval={self.flush_interval}s)"
+        )
+
+    async def stop(self) -> None:
+        """Flush everything still buffered and stop the flusher (call from app shutdown)"""
+        if not self.running:
+            return
+        self._stopping = True
+        await self._worker
+        self._worker = None
+        logger.info(f"Conversation log writer stopped: {self.stats}")
+
+    async def log_conversation(
+        self,
+        chatbot_id: str,
+        user_message: str,
+        bot_response: str,
+        metadata: Dict[str, Any] = None,
+    ) -> None:
+        """Queue a conversation for logging"""
+        row = self.database_service.build_conversation_row(
+            chatbot_id, user_message, bot_response, metadata
+        )
+
+        if not self.running or self._stopping:
+            await self._write_direct(row)
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.put(row), timeout=self.enqueue_timeout)
+            self.stats["enqueued"] += 1
+        except asyncio.TimeoutError:
+            logger.warning("Conversation log queue is full, writing row directly")
+            await self._write_direct(row)
+
+    async def _write_direct(self, row: Dict[str, Any]) -> None:
+        """Fallback path when the buffer is unavailable or saturated"""
+        self.stats["direct_writes"] += 1
+        await self._flush([row])
+
+    async def _run(self) -> None:
+        """Collect rows into batches until asked to stop, then drain"""
+        while True:
+            batch = await self._collect_batch()
+            if batch:
+                await self._flush(batch)
+            elif self._stopping and self._queue.empty():
+                return
+
+    async def _collect_batch(self) -> List[Dict[str, Any]]:
+        """Wait for the first row, then fill the batch until size or time trigger"""
+        batch: List[Dict[str, Any]] = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            if self._stopping:
+                # Draining: take whatever is left without waiting
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                break
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                # Short poll so a shutdown request is noticed quickly
+                batch.append(
+                    await asyncio.wait_for(
+                        self._queue.get(), timeout=min(remaining, 0.5)
+                    )
+                )
+            except asyncio.TimeoutError:
+                continue
+
+        return batch
+
+    async def _flush(self, rows: List[Dict[str, Any]]) -> None:
+        """Bulk insert a batch, retrying once before giving up"""
+        for attempt in range(2):
+            result = await self.database_service.log_conversations_bulk(rows)
+            if result.get("success"):
+                self.stats["flushed"] += len(rows)
+                self.stats["batches"] += 1
+                return
+            if attempt == 0:
+                await asyncio.sleep(0.5)
+
+        self.stats["failed"] += len(rows)
+        logger.error(
+            f"Dropping {len(rows)} conversation rows after failed bulk insert: {result.get('error')}"
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get buffer statistics"""
+        return {
+            **self.stats,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            "running": self.running,
+        }
+
+
+# Global instance
+conversation_log_writer = ConversationLogWriter(
+    supabase_service,
+    max_queue_size=settings.conversation_log_queue_size,
+    batch_size=settings.conversation_log_batch_size,
+    flush_interval=settings.conversation_log_flush_interval,
+    enqueue_timeout=settings.conversation_log_enqueue_timeout,
+)
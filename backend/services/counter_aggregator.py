@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CounterAggregator:
+    """Accumulates per-chatbot counter deltas in memory and flushes them periodically.
+
+    `add()` is a dict update, so hot paths never wait on the database. Each
+    flush applies one atomic increment per chatbot through the database
+    service; deltas that fail to apply are merged back and retried next time.
+    """
+
+    COUNTERS = ("total_conversations", "knowledge_base_size")
+
+    def __init__(self, database_service, flush_interval: float = 5.0):
+        self.database_service = database_service
+        self.flush_interval = flush_interval
+
+        self._pending: Dict[str, Dict[str, int]] = {}
+        self._worker: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None  # created on the running loop
+
+        self.stats = {
+            "increments": 0,
+            "flushes": 0,
+            "rows_updated": 0,
+            "failed_flushes": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def add(self, chatbot_id: str, counter: str, amount: int = 1) -> None:
+        """Record a counter delta for a chatbot"""
+        if counter not in self.COUNTERS:
+            raise ValueError(f"Unknown chatbot counter: {counter}")
+        self._merge(chatbot_id, {counter: amount})
+        self.stats["increments"] += 1
+
+    def _merge(self, chatbot_id: str, deltas: Dict[str, int]) -> None:
+        pending = self._pending.setdefault(chatbot_id, {})
+        for counter, amount in deltas.items():
+            pending[counter] = pending.get(counter, 0) + amount
+
+    def pending(self, chatbot_id: str, counter: str) -> int:
+        """Delta not yet written to the database (for read-your-writes views)"""
+        return self._pending.get(chatbot_id, {}).get(counter, 0)
+
+    async def start(self) -> None:
+        """Start periodic flushing (call from app startup)"""
+        if self.running:
+            return
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop periodic flushing and write out remaining deltas (call from app shutdown)"""
+        if self.running:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        await self.flush()
+        logger.info(f"Counter aggregator stopped: {self.stats}")
+
+    async def flush(self) -> None:
+        """Apply all accumulated deltas"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+
+            for chatbot_id, deltas in pending.items():
+                deltas = {
+                    counter: amount for counter, amount in deltas.items() if amount
+                }
+                if not deltas:
+                    continue
+                result = await self.database_service.apply_counter_deltas(
+                    chatbot_id, deltas
+                )
+                if result.get("success"):
+                    self.stats["rows_updated"] += 1
+                else:
+                    # Keep the delta for the next flush instead of losing it
+                    self.stats["failed_flushes"] += 1
+                    self._merge(chatbot_id, deltas)
+
+            self.stats["flushes"] += 1
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing chatbot counters: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get aggregator statistics"""
+        return {
+            **self.stats,
+            "pending_chatbots": len(self._pending),
+            "running": self.running,
+        }
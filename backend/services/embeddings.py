@@ -0,0 +1,114 @@
+import logging
+import re
+import zlib
+from typing import List
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize rows in place so dot product equals cosine similarity"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+class HashingEmbedder:
+    """Local feature-hashing embedder.
+
+    Words and character trigrams are hashed (stable CRC32) into a fixed number
+    of signed buckets. Needs no model download or provider call, so queries
+    embed in microseconds; the trigrams make it tolerant of Indonesian affixes
+    ("harga" / "harganya").
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        features = []
+        for word in _WORD_RE.findall(text.lower()):
+            features.append(word)
+            padded = f"<{word}>"
+            if len(padded) > 4:
+                features.extend(f"#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if not features:
+                continue
+            hashes = np.fromiter(
+                (zlib.crc32(f.encode("utf-8")) for f in features),
+                dtype=np.uint32,
+                count=len(features),
+            )
+            buckets = (hashes % self.dim).astype(np.intp)
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            # Character trigrams count half as much as whole words
+            weights = np.fromiter(
+                (0.5 if f[0] == "#" else 1.0 for f in features),
+                dtype=np.float32,
+                count=len(features),
+            )
+            np.add.at(matrix[row], buckets, signs * weights)
+        # Sublinear term frequency so repeated words do not dominate
+        matrix = (np.sign(matrix) * np.log1p(np.abs(matrix))).astype(np.float32)
+        return normalize_rows(matrix)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed a batch of texts into a (len(texts), dim) float32 matrix"""
+        return self.embed_sync(texts)
+
+
+class HuggingFaceEmbedder:
+    """Sentence embeddings from the Hugging Face feature-extraction API"""
+
+    def __init__(self, model: str, batch_size: int = 32):
+        from ai_models.huggingface_client import huggingface_client
+
+        self.client = huggingface_client
+        self.model = model
+        self.batch_size = batch_size
+        self.name = f"hf:{model}"
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed a batch of texts, split into provider-sized requests"""
+        vectors: List[List[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(
+                await self.client.generate_embeddings(
+                    texts[i : i + self.batch_size], self.model
+                )
+            )
+        return normalize_rows(
+            np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+        )
+
+
+def create_embedder():
+    """Create the embedder selected by `settings.embedding_backend`"""
+    if settings.embedding_backend == "huggingface":
+        try:
+            return HuggingFaceEmbedder(
+                settings.embedding_model, settings.embedding_batch_size
+            )
+        except Exception as e:
+            logger.error(
+                f"Failed to initialize Hugging Face embedder, using local hashing: {e}"
+            )
+    return HashingEmbedder(settings.embedding_dim)
+
+
+# Global instance
+embedder = create_embedder()
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+Attempt = Tuple[str, Callable[[], Awaitable[Any]]]
+
+
+class Hedger:
+    """Runs a fallback chain of attempts, optionally hedging slow ones.
+
+    Attempts are started in order. A failed attempt (exception or a result
+    rejected by `is_good`) starts the next one straight away. With hedging
+    enabled, if the running attempt has not answered within the `percentile`
+    of its recent successful latencies, the next attempt is started
+    alongside it. The first good result wins and the others are cancelled.
+    Extra requests are bounded by `max_extra` concurrent hedges and by
+    `budget_ratio`, the fraction of runs that may hedge at all.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        percentile: float = 90.0,
+        window: int = 100,
+        min_samples: int = 20,
+        initial_delay: float = 8.0,
+        min_delay: float = 0.05,
+        max_extra: int = 1,
+        budget_ratio: float = 0.2,
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_extra = max_extra
+        self.budget_ratio = budget_ratio
+
+        self._latencies: Dict[str, Deque[float]] = {}
+        self.stats = {
+            "runs": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "cancelled": 0,
+            "budget_exhausted": 0,
+        }
+
+    def record(self, key: str, latency: float) -> None:
+        samples = self._latencies.get(key)
+        if samples is None:
+            samples = self._latencies[key] = deque(maxlen=self.window)
+        samples.append(latency)
+
+    def delay(self, key: str) -> float:
+        """Seconds to wait on `key` before hedging: the configured percentile of its recent latency"""
+        samples = self._latencies.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return self.initial_delay
+        ordered = sorted(samples)
+        index = min(int(len(ordered) * self.percentile / 100.0), len(ordered) - 1)
+        return max(ordered[index], self.min_delay)
+
+    def _may_hedge(self) -> bool:
+        if self.stats["hedged"] < self.budget_ratio * self.stats["runs"] + 1:
+            return True
+        self.stats["budget_exhausted"] += 1
+        return False
+
+    async def run(
+        self,
+        attempts: Sequence[Attempt],
+        is_good: Callable[[Any], bool] = lambda result: result is not None,
+    ) -> Optional[Tuple[str, Any]]:
+        """(key, result) of the first good attempt, or None if all of them failed"""
+        self.stats["runs"] += 1
+        queue: List[Attempt] = list(attempts)
+        pending: Dict[asyncio.Task, Tuple[str, float]] = {}
+        hedge_tasks = set()
+        latest: Optional[Tuple[str, float]] = None
+
+        def launch(hedge: bool = False) -> Tuple[str, float]:
+            key, factory = queue.pop(0)
+            started = time.perf_counter()
+            task = asyncio.ensure_future(factory())
+            pending[task] = (key, started)
+            if hedge:
+                hedge_tasks.add(task)
+            return key, started
+
+        try:
+            if queue:
+                latest = launch()
+            while pending:
+                timeout = None
+                if self.enabled and queue and len(pending) <= self.max_extra:
+                    timeout = max(
+                        self.delay(latest[0]) - (time.perf_counter() - latest[1]), 0.0
+                    )
+
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if self._may_hedge():
+                        logger.info(
+                            f"Hedging {latest[0]} after {time.perf_counter() - latest[1]:.2f}s with {queue[0][0]}"
+                        )
+                        self.stats["hedged"] += 1
+                        latest = launch(hedge=True)
+                        continue
+                    # Out of budget: keep waiting on what is running, fall back only on failure
+                    done, _ = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+
+                for task in done:
+                    key, started = pending.pop(task)
+                    result = None
+                    if not task.cancelled():
+                        if task.exception() is not None:
+                            logger.warning(f"Attempt {key} failed: {task.exception()}")
+                        else:
+                            result = task.result()
+                    if is_good(result):
+                        self.record(key, time.perf_counter() - started)
+                        if task in hedge_tasks:
+                            self.stats["hedge_wins"] += 1
+                        return key, result
+                    if queue:
+                        latest = launch()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+            self.stats["cancelled"] += len(pending)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hedging statistics and current hedge delays"""
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "delays": {
+                key: round(self.delay(key), 3) for key in sorted(self._latencies)
+            },
+        }
+
+
+# Global instance
+hedger = Hedger(
+    enabled=settings.chat_hedging_enabled,
+    percentile=settings.hedge_percentile,
+    min_samples=settings.hedge_min_samples,
+    initial_delay=settings.hedge_initial_delay,
+    max_extra=settings.hedge_max_extra,
+    budget_ratio=settings.hedge_budget_ratio,
+)
@@ -0,0 +1,81 @@
+import re
+from typing import Any, Dict, List
+
+from services.keyword_matcher import keyword_matcher
+
+# Zero-shot classification setup (facebook/bart-large-mnli)
+ZERO_SHOT_MODEL = "facebook/bart-large-mnli"
+ZERO_SHOT_LABELS = ["hoax", "not hoax", "misinformation", "factual"]
+ZERO_SHOT_THRESHOLD = 0.6
+
+_LINK_RE = re.compile(r"https?://|www\.", re.IGNORECASE)
+
+
+def screen_hoax(text: str) -> Dict[str, Any]:
+    """Cheap local hoax check by indicator phrases (data/lexicons/hoax_indicators.txt).
+
+    Two or more indicators are a confident hoax verdict and none (without a
+    link) a confident clean one; a single indicator or a link makes the
+    message "ambiguous", worth a model call. Negated indicators ("bukan
+    hadiah") do not count.
+    """
+    detected_indicators = keyword_matcher.phrases(text, "hoax_indicators")
+
+    if len(detected_indicators) >= 2:
+        is_hoax = True
+        confidence = min(0.95, 0.6 + (len(detected_indicators) * 0.1))
+        explanation = f"Terdeteksi indikator hoax: {', '.join(detected_indicators)}"
+    elif len(detected_indicators) == 1:
+        is_hoax = True
+        confidence = 0.7
+        explanation = f"Terdeteksi indikator mencurigakan: {detected_indicators[0]}"
+    else:
+        is_hoax = False
+        confidence = 0.8
+        explanation = "Tidak terdeteksi indikator hoax"
+
+    return {
+        "is_hoax": is_hoax,
+        "confidence": confidence,
+        "explanation": explanation,
+        "indicators": detected_indicators,
+        "ambiguous": len(detected_indicators) == 1
+        or (not detected_indicators and bool(_LINK_RE.search(text))),
+    }
+
+
+def zero_shot_prompt(text: str) -> str:
+    return f"Classify this text as hoax or not hoax: {text}"
+
+
+def zero_shot_verdict(result: Any) -> Dict[str, Any]:
+    """Hoax verdict from one zero-shot classification result ({"labels", "scores"})"""
+    if not isinstance(result, dict) or "labels" not in result or "scores" not in result:
+        return {
+            "is_hoax": False,
+            "confidence": 0.5,
+            "explanation": "Tidak dapat menganalisis teks secara menyeluruh. Silakan verifikasi secara manual.",
+            "details": result,
+        }
+
+    labels: List[str] = result["labels"]
+    scores: List[float] = result["scores"]
+
+    # Check if "hoax" or "misinformation" has high confidence
+    hoax_score = 0.0
+    for i, label in enumerate(labels):
+        if label.lower() in ["hoax", "misinformation"]:
+            hoax_score = max(hoax_score, scores[i])
+
+    is_hoax = hoax_score > ZERO_SHOT_THRESHOLD
+
+    return {
+        "is_hoax": is_hoax,
+        "confidence": hoax_score,
+        "explanation": (
+            f"Analisis AI menunjukkan tingkat kepercayaan {hoax_score:.2%} bahwa teks ini mengandung misinformasi."
+            if is_hoax
+            else "Teks ini tampaknya tidak mengandung misinformasi berdasarkan analisis AI."
+        ),
+        "details": {"labels": labels, "scores": scores},
+    }
@@ -0,0 +1,293 @@
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# File layout (little-endian):
+#   magic (8 bytes) | format version (uint32) | header length (uint32)
+#   header: UTF-8 JSON with index metadata and a section directory
+#   sections, each aligned to 64 bytes, offsets relative to the data start:
+#     embeddings       float32 [n_chunks, dim]
+#     doc_lengths      int32   [n_chunks]
+#     chunk_offsets    int64   [n_chunks + 1]  into chunk_blob
+#     chunk_blob       UTF-8 JSON chunk records, back to back
+#     term_blob        UTF-8 terms, sorted, newline separated
+#     posting_offsets  int64   [n_terms + 1]   into posting_ids / posting_tfs
+#     posting_ids      int32   document ids per term
+#     posting_tfs      int32   term frequencies per term
+#     item_ids         UTF-8 knowledge item ids, newline separated
+MAGIC = b"AWKIDX\x00\x00"
+FORMAT_VERSION = 1
+_PRELUDE = struct.Struct("<8sII")
+_ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class PersistedChunks:
+    """Chunk records decoded on demand from a mapped blob.
+
+    Behaves like the list `ChatbotIndex.chunks` normally is; chunks appended
+    after loading are kept in memory.
+    """
+
+    def __init__(self, blob: memoryview, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+        self._persisted = len(offsets) - 1
+        self._appended: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return self._persisted + len(self._appended)
+
+    def __getitem__(self, position: int) -> Dict[str, Any]:
+        if position < 0:
+            position += len(self)
+        if position >= self._persisted:
+            return self._appended[position - self._persisted]
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return json.loads(bytes(self._blob[start:end]).decode("utf-8"))
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def append(self, chunk: Dict[str, Any]) -> None:
+        self._appended.append(chunk)
+
+    def extend(self, chunks: List[Dict[str, Any]]) -> None:
+        self._appended.extend(chunks)
+
+
+class PersistedPostings:
+    """Read-only BM25 postings backed by mapped arrays"""
+
+    def __init__(
+        self,
+        terms: List[str],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        frequencies: np.ndarray,
+    ):
+        self.terms = terms
+        self._positions = {term: i for i, term in enumerate(terms)}
+        self._offsets = offsets
+        self._doc_ids = doc_ids
+        self._frequencies = frequencies
+
+    def get(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        position = self._positions.get(term)
+        if position is None:
+            return None
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return self._doc_ids[start:end], self._frequencies[start:end]
+
+
+class IndexSnapshot:
+    """Contents of a persisted index file; arrays are views into the mapping"""
+
+    def __init__(
+        self,
+        header: Dict[str, Any],
+        embeddings: np.ndarray,
+        doc_lengths: np.ndarray,
+        postings: PersistedPostings,
+        chunks: PersistedChunks,
+        item_ids: Set[str],
+        mtime: float,
+    ):
+        self.embedder_name = header["embedder"]
+        self.dim = header["dim"]
+        self.total_length = header["total_length"]
+        self.embeddings = embeddings
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.chunks = chunks
+        self.item_ids = item_ids
+        self.mtime = mtime
+
+
+class KnowledgeIndexStore:
+    """Per-chatbot index files in a versioned binary format.
+
+    Files are opened with `mmap` so every worker process on the host shares
+    the same page-cache pages, and loading only parses the header, the term
+    list and the item ids; embeddings, postings and chunk texts are read in
+    place. Writes go to a temporary file that atomically replaces the old one.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def path(self, chatbot_id: str) -> str:
+        safe_id = re.sub(r"[^A-Za-z0-9_-]", "_", chatbot_id)
+        return os.path.join(self.directory, f"{safe_id}.idx")
+
+    def mtime(self, chatbot_id: str) -> Optional[float]:
+        """Modification time of the chatbot's file, or None if there is none"""
+        try:
+            return os.stat(self.path(chatbot_id)).st_mtime
+        except OSError:
+            return None
+
+    def save(self, chatbot_id: str, index) -> None:
+        """Write a ChatbotIndex to disk (blocking; run it off the event loop)"""
+        n_chunks = len(index.chunks)
+        dim = index.vectors.dim
+
+        chunk_blob = bytearray()
+        chunk_offsets = np.zeros(n_chunks + 1, dtype=np.int64)
+        for position in range(n_chunks):
+            chunk_blob += json.dumps(index.chunks[position], ensure_ascii=False).encode(
+                "utf-8"
+            )
+            chunk_offsets[position + 1] = len(chunk_blob)
+
+        terms = sorted(index.lexical.terms())
+        posting_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        posting_ids = []
+        posting_tfs = []
+        total = 0
+        for position, term in enumerate(terms):
+            doc_ids, frequencies = index.lexical.posting(term)
+            posting_ids.append(np.frombuffer(doc_ids, dtype=np.int32))
+            posting_tfs.append(np.frombuffer(frequencies, dtype=np.int32))
+            total += len(doc_ids)
+            posting_offsets[position + 1] = total
+
+        sections = [
+            (
+                "embeddings",
+                np.ascontiguousarray(index.vectors.matrix, dtype=np.float32),
+            ),
+            ("doc_lengths", np.frombuffer(index.lexical.doc_lengths, dtype=np.int32)),
+            ("chunk_offsets", chunk_offsets),
+            ("chunk_blob", bytes(chunk_blob)),
+            ("term_blob", "\n".join(terms).encode("utf-8")),
+            ("posting_offsets", posting_offsets),
+            (
+                "posting_ids",
+                (
+                    np.concatenate(posting_ids)
+                    if posting_ids
+                    else np.zeros(0, dtype=np.int32)
+                ),
+            ),
+            (
+                "posting_tfs",
+                (
+                    np.concatenate(posting_tfs)
+                    if posting_tfs
+                    else np.zeros(0, dtype=np.int32)
+                ),
+            ),
+            ("item_ids", "\n".join(sorted(index.item_ids)).encode("utf-8")),
+        ]
+
+        directory: Dict[str, List[int]] = {}
+        offset = 0
+        for name, data in sections:
+            nbytes = data.nbytes if isinstance(data, np.ndarray) else len(data)
+            directory[name] = [offset, nbytes]
+            offset = _align(offset + nbytes)
+
+        header = json.dumps(
+            {
+                "embedder": index.embedder_name,
+                "dim": dim,
+                "n_chunks": n_chunks,
+                "n_terms": len(terms),
+                "total_length": index.lexical.total_length,
+                "sections": directory,
+            }
+        ).encode("utf-8")
+
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.directory, prefix=".tmp-", suffix=".idx"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_PRELUDE.pack(MAGIC, FORMAT_VERSION, len(header)))
+                f.write(header)
+                data_start = _align(_PRELUDE.size + len(header))
+                for name, data in sections:
+                    f.seek(data_start + directory[name][0])
+                    f.write(data.tobytes() if isinstance(data, np.ndarray) else data)
+                f.truncate(data_start + offset)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path(chatbot_id))
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def load(self, chatbot_id: str) -> Optional[IndexSnapshot]:
+        """Map a chatbot's index file; None if missing, unreadable or from another format version"""
+        path = self.path(chatbot_id)
+        try:
+            with open(path, "rb") as f:
+                mtime = os.fstat(f.fileno()).st_mtime
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None  # missing or empty file
+
+        try:
+            magic, version, header_length = _PRELUDE.unpack_from(mapped, 0)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                logger.info(f"Ignoring index file {path} (format version {version})")
+                return None
+
+            header = json.loads(
+                mapped[_PRELUDE.size : _PRELUDE.size + header_length].decode("utf-8")
+            )
+            data_start = _align(_PRELUDE.size + header_length)
+            buffer = memoryview(mapped)
+
+            def section(name: str) -> memoryview:
+                offset, nbytes = header["sections"][name]
+                return buffer[data_start + offset : data_start + offset + nbytes]
+
+            def array(name: str, dtype) -> np.ndarray:
+                return np.frombuffer(section(name), dtype=dtype)
+
+            n_chunks, dim = header["n_chunks"], header["dim"]
+            terms_blob = bytes(section("term_blob")).decode("utf-8")
+            items_blob = bytes(section("item_ids")).decode("utf-8")
+
+            return IndexSnapshot(
+                header,
+                embeddings=array("embeddings", np.float32).reshape(n_chunks, dim),
+                doc_lengths=array("doc_lengths", np.int32),
+                postings=PersistedPostings(
+                    terms_blob.split("\n") if terms_blob else [],
+                    array("posting_offsets", np.int64),
+                    array("posting_ids", np.int32),
+                    array("posting_tfs", np.int32),
+                ),
+                chunks=PersistedChunks(
+                    section("chunk_blob"), array("chunk_offsets", np.int64)
+                ),
+                item_ids=set(items_blob.split("\n")) if items_blob else set(),
+                mtime=mtime,
+            )
+        except Exception as e:
+            logger.error(f"Failed to load index file {path}: {str(e)}")
+            return None
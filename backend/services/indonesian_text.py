@@ -0,0 +1,58 @@
+import re
+from typing import List
+
+# Common Indonesian function words and chat fillers that carry no retrieval signal
+STOPWORDS = frozenset("""
+ada adalah agar akan aku anda apa apakah atau bagaimana bahwa banyak begitu beberapa belum berapa
+bisa boleh buat dalam dan dapat dari demikian dengan di dia dong gan harus hal ia ingin ini itu
+jadi jika juga kak kakak kalau kami kamu kan ke kenapa ketika kita lagi lah lain maka mana masih
+mau mereka min mohon nah nya oleh pada para per pun saat saja sama sangat saya sebagai sebuah
+secara sedang sih siapa sudah supaya tapi telah tentang tersebut tolong untuk yaitu yang ya yah
+""".split())
+
+# Enclitic particles / possessives stripped from word ends ("harganya" -> "harga")
+_SUFFIXES = ("nya", "lah", "kah", "pun", "ku", "mu")
+
+# Words, numbers with grouping separators and SKU-like codes (ABC-123, 12/A)
+_TOKEN_RE = re.compile(r"[0-9a-z]+(?:[.,\-/_][0-9a-z]+)*", re.UNICODE)
+_GROUPED_NUMBER_RE = re.compile(r"^\d{1,3}(?:[.,]\d{3})+$")
+
+
+def _strip_suffix(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if (
+            word.endswith(suffix)
+            and len(word) - len(suffix) >= 3
+            and not word.isdigit()
+        ):
+            return word[: -len(suffix)]
+    return word
+
+
+def tokenize(text: str, remove_stopwords: bool = True) -> List[str]:
+    """Tokenize Indonesian text for lexical retrieval.
+
+    - Prices and grouped numbers are normalized ("Rp 18.000" -> "18000").
+    - Codes like SKUs keep their full form and also emit their parts
+      ("KP-250ML" -> "kp-250ml", "kp", "250ml").
+    - Enclitic particles are stripped and stopwords removed.
+    """
+    tokens: List[str] = []
+    for raw in _TOKEN_RE.findall(text.lower()):
+        if _GROUPED_NUMBER_RE.match(raw):
+            tokens.append(re.sub(r"[.,]", "", raw))
+            continue
+
+        parts = re.split(r"[.,\-/_]", raw)
+        if len(parts) > 1:
+            tokens.append(raw)
+        for part in parts:
+            if not part:
+                continue
+            if remove_stopwords and part in STOPWORDS:
+                continue
+            part = _strip_suffix(part)
+            if remove_stopwords and part in STOPWORDS:
+                continue
+            tokens.append(part)
+    return tokens
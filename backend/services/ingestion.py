@@ -0,0 +1,443 @@
+import asyncio
+import codecs
+import csv
+import io
+import logging
+import os
+import tempfile
+import uuid
+import zipfile
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+from xml.etree import ElementTree
+
+from config import settings
+from services.bulkhead import detached
+from services.knowledge_index import knowledge_index
+from services.supabase_service import supabase_service
+from services.text_chunker import iter_chunks
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+logger = logging.getLogger(__name__)
+
+_READ_BLOCK_SIZE = 64 * 1024
+_DOCX_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+class UploadTooLarge(Exception):
+    """The upload exceeded max_upload_size"""
+
+
+class UnsupportedFileType(Exception):
+    """The file extension is not in allowed_file_types"""
+
+
+class ReceivedUpload:
+    """A file part spooled from a multipart request body"""
+
+    def __init__(self, filename: str, file: BinaryIO, size: int):
+        self.filename = filename
+        self.file = file
+        self.size = size
+
+    @property
+    def file_type(self) -> str:
+        return os.path.splitext(self.filename)[1].lstrip(".").lower()
+
+
+async def receive_upload(
+    request, max_bytes: int, field_name: str = "file"
+) -> ReceivedUpload:
+    """Stream a multipart body, spooling the `field_name` file part to a temp file.
+
+    The size limit is checked against Content-Length up front and against the
+    bytes actually received while reading, so an oversized upload is rejected
+    without buffering it.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise ValueError("Expected a multipart/form-data upload")
+
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + _READ_BLOCK_SIZE:
+        raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.upload_spool_max_memory)
+    state: Dict[str, Any] = {
+        "headers": {},
+        "field": b"",
+        "value": b"",
+        "in_file": False,
+        "filename": None,
+        "size": 0,
+    }
+
+    def on_header_field(data, start, end):
+        state["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["field"].lower()] = state["value"]
+        state["field"], state["value"] = b"", b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(
+            state["headers"].get(b"content-disposition", b"")
+        )
+        is_file = (
+            disposition.get(b"name") == field_name.encode()
+            and b"filename" in disposition
+        )
+        if is_file and state["filename"] is None:
+            filename = disposition[b"filename"].decode("utf-8", "replace")
+            file_type = os.path.splitext(filename)[1].lstrip(".").lower()
+            if file_type not in settings.allowed_file_types:
+                # Reject before reading the file body
+                raise UnsupportedFileType(
+                    f"File type '{file_type}' not allowed (allowed: {', '.join(settings.allowed_file_types)})"
+                )
+            state["in_file"] = True
+            state["filename"] = filename
+
+    def on_part_data(data, start, end):
+        if state["in_file"]:
+            state["size"] += end - start
+            if state["size"] > max_bytes:
+                raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+            spool.write(data[start:end])
+
+    def on_part_end():
+        state["headers"] = {}
+        state["in_file"] = False
+
+    parser = MultipartParser(
+        params[b"boundary"],
+        {
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+
+    try:
+        async for block in request.stream():
+            parser.write(block)
+        parser.finalize()
+    except Exception:
+        spool.close()
+        raise
+
+    if state["filename"] is None:
+        spool.close()
+        raise ValueError(f"No file field '{field_name}' in upload")
+
+    spool.seek(0)
+    return ReceivedUpload(state["filename"], spool, state["size"])
+
+
+def iter_text(file: BinaryIO, file_type: str) -> Iterator[str]:
+    """Extract text from an uploaded file incrementally"""
+    if file_type == "txt":
+        return _iter_plain_text(file)
+    if file_type == "csv":
+        return _iter_csv_text(file)
+    if file_type == "pdf":
+        return _iter_pdf_text(file)
+    if file_type == "docx":
+        return _iter_docx_text(file)
+    raise UnsupportedFileType(f"Unsupported file type: {file_type}")
+
+
+def _iter_plain_text(file: BinaryIO) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    while True:
+        block = file.read(_READ_BLOCK_SIZE)
+        if not block:
+            break
+        yield decoder.decode(block)
+    yield decoder.decode(b"", final=True)
+
+
+def _iter_csv_text(file: BinaryIO) -> Iterator[str]:
+    """One "column: value; ..." line per row so each row stays a retrievable fact"""
+    reader = csv.reader(
+        io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace", newline="")
+    )
+    header = next(reader, None)
+    if header is None:
+        return
+    header = [column.strip() for column in header]
+    for row in reader:
+        fields = [
+            f"{header[i] if i < len(header) and header[i] else f'kolom {i + 1}'}: {value.strip()}"
+            for i, value in enumerate(row)
+            if value.strip()
+        ]
+        if fields:
+            yield "; ".join(fields) + ".\n"
+
+
+def _iter_pdf_text(file: BinaryIO) -> Iterator[str]:
+    if PdfReader is None:
+        raise UnsupportedFileType("PDF uploads require the pypdf package")
+    reader = PdfReader(file)
+    for page in reader.pages:
+        text = page.extract_text() or ""
+        if text.strip():
+            yield text + "\n\n"
+
+
+def _iter_docx_text(file: BinaryIO) -> Iterator[str]:
+    """Paragraph text from word/document.xml, parsed without loading the whole tree"""
+    with zipfile.ZipFile(file) as archive:
+        with archive.open("word/document.xml") as document:
+            for _, element in ElementTree.iterparse(document, events=("end",)):
+                if element.tag == f"{_DOCX_NAMESPACE}p":
+                    text = "".join(
+                        node.text or "" for node in element.iter(f"{_DOCX_NAMESPACE}t")
+                    )
+                    if text.strip():
+                        yield text + "\n\n"
+                    element.clear()
+
+
+class IngestionJob:
+    """Status of one upload being processed (a row of the file_uploads table)"""
+
+    def __init__(
+        self, chatbot_id: str, user_id: str, filename: str, file_type: str, size: int
+    ):
+        self.id = str(uuid.uuid4())
+        self.chatbot_id = chatbot_id
+        self.user_id = user_id
+        self.filename = filename
+        self.file_type = file_type
+        self.size = size
+        self.status = "pending"
+        self.chunks_created = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.finished_at: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "IngestionJob":
+        job = cls(
+            row["chatbot_id"],
+            row["user_id"],
+            row["filename"],
+            row.get("file_type"),
+            row.get("file_size") or 0,
+        )
+        job.id = row["id"]
+        job.status = row.get("processing_status") or "pending"
+        job.chunks_created = row.get("chunks_created") or 0
+        job.error = row.get("error")
+        job.created_at = row.get("created_at")
+        job.finished_at = row.get("processed_at")
+        return job
+
+    def to_row(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "chatbot_id": self.chatbot_id,
+            "filename": self.filename,
+            "file_size": self.size,
+            "file_type": self.file_type,
+            "processing_status": self.status,
+            "chunks_created": self.chunks_created,
+            "error": self.error,
+            "created_at": self.created_at,
+            "processed_at": self.finished_at,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "chatbot_id": self.chatbot_id,
+            "filename": self.filename,
+            "file_type": self.file_type,
+            "size": self.size,
+            "status": self.status,
+            "chunks_created": self.chunks_created,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestionManager:
+    """Background processing of knowledge uploads.
+
+    A job extracts text incrementally, chunks it, and inserts the chunks as
+    knowledge items in batches. Each batch is embedded into the chatbot's
+    index straight away, so memory stays bounded by one batch. Job status is
+    written to the file_uploads table so any worker can answer a poll; this
+    worker also keeps its most recent `max_jobs` jobs in memory.
+    """
+
+    def __init__(
+        self,
+        database_service,
+        index_manager,
+        batch_size: int = 64,
+        max_concurrent_jobs: int = 2,
+        max_jobs: int = 500,
+    ):
+        self.database_service = database_service
+        self.index_manager = index_manager
+        self.batch_size = batch_size
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.max_jobs = max_jobs
+
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def submit(
+        self, chatbot_id: str, user_id: str, upload: ReceivedUpload
+    ) -> IngestionJob:
+        """Queue an upload for processing; returns the job to poll"""
+        job = IngestionJob(
+            chatbot_id, user_id, upload.filename, upload.file_type, upload.size
+        )
+        result = await self.database_service.create_file_upload(job.to_row())
+        if not result["success"]:
+            raise Exception(result["error"])
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+        # The job outlives the upload request, so it must not inherit its provider deadline
+        task = asyncio.get_running_loop().create_task(detached(self._run(job, upload)))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        """A job started by this worker, else its last saved state"""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        result = await self.database_service.get_file_upload(job_id)
+        return IngestionJob.from_row(result["data"]) if result["success"] else None
+
+    async def _save(self, job: IngestionJob) -> None:
+        # Best effort: a missed status write must not fail the ingestion itself
+        await self.database_service.update_file_upload(
+            job.id,
+            {
+                "processing_status": job.status,
+                "chunks_created": job.chunks_created,
+                "error": job.error,
+                "processed_at": job.finished_at,
+            },
+        )
+
+    async def _run(self, job: IngestionJob, upload: ReceivedUpload) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_jobs)
+
+        try:
+            async with self._semaphore:
+                job.status = "processing"
+                await self._save(job)
+                await self._process(job, upload)
+            job.status = "completed"
+            logger.info(
+                f"Ingested {job.filename} for {job.chatbot_id}: {job.chunks_created} chunks"
+            )
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = (
+                "Cancelled: the worker shut down before the upload was processed"
+            )
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.error(f"Error ingesting {job.filename}: {str(e)}")
+        finally:
+            job.finished_at = datetime.now(timezone.utc).isoformat()
+            upload.file.close()
+            await asyncio.shield(self._save(job))
+
+    async def _process(self, job: IngestionJob, upload: ReceivedUpload) -> None:
+        # Load (or map) the index first so batches are embedded as they are inserted
+        await self.index_manager.get_index(job.chatbot_id)
+
+        chunks = iter_chunks(
+            iter_text(upload.file, job.file_type),
+            settings.knowledge_chunk_tokens,
+            settings.knowledge_chunk_overlap,
+        )
+
+        while True:
+            # Extraction and chunking are blocking (PDF parsing in particular)
+            batch = await asyncio.to_thread(self._next_batch, chunks)
+            if not batch:
+                break
+
+            result = await self.database_service.add_knowledge_items(
+                job.chatbot_id,
+                [
+                    {"content": text, "source": job.filename, "category": job.file_type}
+                    for text in batch
+                ],
+            )
+            if not result["success"]:
+                raise Exception(result["error"])
+
+            await self.index_manager.add_rows(job.chatbot_id, result["data"] or [])
+            job.chunks_created += len(batch)
+            await self._save(job)
+
+        # Sync the version stamp, finish embedding and persist the index file
+        await self.index_manager.sync(job.chatbot_id)
+
+    def _next_batch(self, chunks: Iterator[str]) -> List[str]:
+        batch = []
+        for text in chunks:
+            batch.append(text)
+            if len(batch) >= self.batch_size:
+                break
+        return batch
+
+    async def stop(self) -> None:
+        """Cancel jobs still running on shutdown"""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get ingestion statistics"""
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {"jobs": statuses, "running": len(self._tasks)}
+
+
+# Global instance
+ingestion_manager = IngestionManager(
+    supabase_service,
+    knowledge_index,
+    batch_size=settings.ingestion_batch_size,
+    max_concurrent_jobs=settings.ingestion_max_concurrent_jobs,
+    max_jobs=settings.ingestion_max_jobs,
+)
@@ -0,0 +1,180 @@
+import logging
+import os
+import re
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Words (keeping "100%" together) and the punctuation that ends a negation's scope
+_TOKEN_RE = re.compile(r"[^\W_]+%?|[.!?,;:]")
+_CLAUSE_BREAKS = frozenset(".!?,;:")
+
+
+def keyword_tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.casefold())
+
+
+def load_lexicon(path: str) -> List[str]:
+    """Phrases of a lexicon file: one per line, blank lines and "#" comments ignored"""
+    with open(path, encoding="utf-8") as f:
+        return [
+            line.strip()
+            for line in f
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+
+
+class KeywordMatch(NamedTuple):
+    lexicon: str
+    phrase: str
+    start: int  # token positions
+    end: int
+    negated: bool
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over word tokens for several keyword lexicons.
+
+    Phrases are compiled once into a trie with failure links, so a text is
+    scanned in a single pass whatever the number of phrases. Matching works
+    on whole tokens, so "suka" never matches inside "sukarela". Overlapping
+    matches resolve leftmost-longest ("tidak suka" wins over "suka"), and a
+    match preceded by a negation word within `negation_window` tokens of the
+    same clause is flagged `negated`.
+    """
+
+    def __init__(
+        self,
+        lexicons: Dict[str, Iterable[str]],
+        negations: Iterable[str] = (),
+        negation_window: int = 2,
+    ):
+        self.negations = frozenset(word.casefold() for word in negations)
+        self.negation_window = negation_window
+        self.lexicons: Dict[str, int] = {}
+
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[Tuple[str, str, int]]] = [
+            []
+        ]  # (lexicon, phrase, token count)
+
+        for lexicon, phrases in lexicons.items():
+            count = 0
+            for phrase in phrases:
+                tokens = keyword_tokens(phrase)
+                if tokens:
+                    self._insert(lexicon, " ".join(tokens), tokens)
+                    count += 1
+            self.lexicons[lexicon] = count
+        self._link()
+
+    def _insert(self, lexicon: str, phrase: str, tokens: List[str]) -> None:
+        state = 0
+        for token in tokens:
+            following = self._goto[state].get(token)
+            if following is None:
+                following = len(self._goto)
+                self._goto[state][token] = following
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = following
+        if (lexicon, phrase, len(tokens)) not in self._outputs[state]:
+            self._outputs[state].append((lexicon, phrase, len(tokens)))
+
+    def _link(self) -> None:
+        # Breadth-first, so every failure target is complete before it is used
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[following] = self._goto[fallback].get(token, 0)
+                self._outputs[following].extend(self._outputs[self._fail[following]])
+
+    def find(self, text: str, lexicons: Sequence[str]) -> List[KeywordMatch]:
+        """Non-overlapping matches from the given lexicons, in text order"""
+        wanted = set(lexicons)
+        tokens = keyword_tokens(text)
+
+        candidates = []
+        state = 0
+        for position, token in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for lexicon, phrase, length in self._outputs[state]:
+                if lexicon in wanted:
+                    candidates.append(
+                        (position + 1 - length, position + 1, lexicon, phrase)
+                    )
+
+        matches = []
+        covered = 0
+        for start, end, lexicon, phrase in sorted(
+            candidates, key=lambda c: (c[0], c[0] - c[1])
+        ):
+            if start < covered:
+                continue
+            matches.append(
+                KeywordMatch(
+                    lexicon, phrase, start, end, self._is_negated(tokens, start)
+                )
+            )
+            covered = end
+        return matches
+
+    def _is_negated(self, tokens: List[str], start: int) -> bool:
+        for position in range(start - 1, max(start - 1 - self.negation_window, -1), -1):
+            if tokens[position] in _CLAUSE_BREAKS:
+                return False
+            if tokens[position] in self.negations:
+                return True
+        return False
+
+    def phrases(self, text: str, lexicon: str) -> List[str]:
+        """Distinct phrases of one lexicon found in the text, ignoring negated ones"""
+        found = []
+        for match in self.find(text, [lexicon]):
+            if not match.negated and match.phrase not in found:
+                found.append(match.phrase)
+        return found
+
+
+def load_keyword_matcher(directory: str) -> KeywordMatcher:
+    """Matcher over every *.txt lexicon in a directory (named by file stem; "negations" lists negation words)"""
+    lexicons: Dict[str, List[str]] = {}
+    negations: List[str] = []
+    if not os.path.isabs(directory):
+        directory = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), directory
+        )
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith(".txt"))
+    except OSError as e:
+        logger.error(f"Cannot read keyword lexicons from {directory}: {str(e)}")
+        names = []
+
+    for name in names:
+        phrases = load_lexicon(os.path.join(directory, name))
+        if name == "negations.txt":
+            negations = phrases
+        else:
+            lexicons[name[: -len(".txt")]] = phrases
+
+    matcher = KeywordMatcher(lexicons, negations, settings.keyword_negation_window)
+    logger.info(
+        f"Keyword matcher loaded {matcher.lexicons} and {len(negations)} negation words"
+    )
+    return matcher
+
+
+# Global instance (built once at startup)
+keyword_matcher = load_keyword_matcher(settings.lexicon_dir)
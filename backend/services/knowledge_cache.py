@@ -0,0 +1,117 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _CacheEntry:
+    __slots__ = ("rows", "size", "version", "expires_at")
+
+    def __init__(
+        self, rows: List[Dict[str, Any]], size: int, version: int, expires_at: float
+    ):
+        self.rows = rows
+        self.size = size
+        self.version = version
+        self.expires_at = expires_at
+
+
+class KnowledgeBaseCache:
+    """Read-through LRU cache of per-chatbot knowledge base rows.
+
+    Entries are bounded by an approximate memory budget and a TTL. Every
+    chatbot has a version stamp that writes bump via `invalidate()`; an entry
+    is only served while its stamp matches, and a fetch that raced with a
+    write is not stored.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._total_bytes = 0
+
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def version(self, chatbot_id: str) -> int:
+        """Current knowledge version stamp for a chatbot"""
+        return self._versions.get(chatbot_id, 0)
+
+    def get(self, chatbot_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Return cached rows, or None on miss/expiry/stale version"""
+        entry = self._entries.get(chatbot_id)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+
+        if (
+            entry.version != self.version(chatbot_id)
+            or entry.expires_at < time.monotonic()
+        ):
+            self._remove(chatbot_id)
+            self.stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(chatbot_id)
+        self.stats["hits"] += 1
+        return entry.rows
+
+    def put(self, chatbot_id: str, rows: List[Dict[str, Any]], version: int) -> None:
+        """Store rows fetched at `version`"""
+        if version != self.version(chatbot_id):
+            # Knowledge base changed while these rows were being fetched
+            return
+
+        size = self._estimate_size(rows)
+        if size > self.max_bytes:
+            logger.info(
+                f"Knowledge base for {chatbot_id} ({size} bytes) exceeds cache budget, not cached"
+            )
+            return
+
+        self._remove(chatbot_id)
+        while self._entries and self._total_bytes + size > self.max_bytes:
+            evicted, _ = next(iter(self._entries.items()))
+            self._remove(evicted)
+            self.stats["evictions"] += 1
+
+        self._entries[chatbot_id] = _CacheEntry(
+            rows, size, version, time.monotonic() + self.ttl
+        )
+        self._total_bytes += size
+
+    def invalidate(self, chatbot_id: str) -> int:
+        """Bump the chatbot's version stamp and drop its cached rows"""
+        self._versions[chatbot_id] = self.version(chatbot_id) + 1
+        self._remove(chatbot_id)
+        self.stats["invalidations"] += 1
+        return self._versions[chatbot_id]
+
+    def _remove(self, chatbot_id: str) -> None:
+        entry = self._entries.pop(chatbot_id, None)
+        if entry is not None:
+            self._total_bytes -= entry.size
+
+    def _estimate_size(self, rows: List[Dict[str, Any]]) -> int:
+        """Approximate memory footprint of a list of rows"""
+        size = 0
+        for row in rows:
+            size += 64  # per-row dict overhead
+            for value in row.values():
+                size += len(value) if isinstance(value, str) else 16
+        return size
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,483 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+from config import settings
+from services.bm25_index import BM25Index
+from services.bulkhead import detached
+from services.embeddings import embedder
+from services.index_store import IndexSnapshot, KnowledgeIndexStore
+from services.indonesian_text import tokenize
+from services.retrieval_fusion import reciprocal_rank_fusion, select_passages
+from services.supabase_service import supabase_service
+from services.text_chunker import iter_chunks
+from services.vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+
+class ChatbotIndex:
+    """Retrieval state for one chatbot: chunk records, their embeddings and a BM25 index.
+
+    Document `i` of `lexical` refers to `chunks[i]`, and so does row `i` of
+    `vectors`. Chunks are searchable by BM25 as soon as they are added, while
+    their embeddings catch up in the background, so `vectors` may cover only
+    a prefix of `chunks` (see `pending`).
+    """
+
+    def __init__(self, embedder_name: str, dim: int):
+        self.embedder_name = embedder_name
+        self.vectors = VectorIndex(dim)
+        self.lexical = BM25Index()
+        self.chunks: List[Dict[str, Any]] = []
+        self.item_ids: Set[str] = set()
+        self.version = -1
+        self.synced_at = 0.0
+        self.dirty = False  # has rows not yet written to disk
+
+    @classmethod
+    def from_snapshot(cls, snapshot: IndexSnapshot) -> "ChatbotIndex":
+        """Index backed by a memory-mapped file; copied on write when new rows arrive"""
+        index = cls.__new__(cls)
+        index.embedder_name = snapshot.embedder_name
+        index.vectors = VectorIndex.from_matrix(snapshot.embeddings)
+        index.lexical = BM25Index.from_snapshot(
+            snapshot.doc_lengths, snapshot.total_length, snapshot.postings
+        )
+        index.chunks = snapshot.chunks
+        index.item_ids = snapshot.item_ids
+        index.version = -1
+        index.synced_at = 0.0
+        index.dirty = False
+        return index
+
+    @property
+    def pending(self) -> int:
+        """Chunks not embedded yet"""
+        return len(self.chunks) - len(self.vectors)
+
+
+class KnowledgeIndexManager:
+    """Per-chatbot in-process retrieval indexes.
+
+    Indexes are built lazily on the first search and kept in sync with the
+    knowledge base version stamp: new rows are chunked and embedded
+    incrementally, and a full rebuild only happens when rows disappear or the
+    embedder changes. The least recently used chatbots are evicted beyond
+    `max_chatbots`.
+
+    Syncing runs in a background task per chatbot, so a request deadline
+    never cancels it. New chunks join the BM25 index (and the served index)
+    first and are embedded afterwards, batch by batch; until then searches
+    use the stale index, or BM25 alone for chunks without a vector. A request
+    only waits when the chatbot has no index at all, and then only for the
+    chunking step.
+
+    With a `store`, indexes are persisted after they change and a worker that
+    does not hold a chatbot yet maps its file on the first request, so only
+    rows added since the file was written need embedding. Indexes are also
+    re-checked against the database every `resync_interval` seconds, which is
+    how a worker picks up rows another worker added.
+    """
+
+    def __init__(
+        self,
+        database_service,
+        embedder,
+        max_chatbots: int = 256,
+        store: Optional[KnowledgeIndexStore] = None,
+        resync_interval: float = 300.0,
+    ):
+        self.database_service = database_service
+        self.embedder = embedder
+        self.max_chatbots = max_chatbots
+        self.store = store
+        self.resync_interval = resync_interval
+
+        self._indexes: "OrderedDict[str, ChatbotIndex]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._builds: Dict[str, asyncio.Task] = {}
+        self._ready: Dict[str, asyncio.Future] = {}
+
+    def _is_fresh(self, index: Optional[ChatbotIndex], version: int) -> bool:
+        return (
+            index is not None
+            and index.version == version
+            and time.monotonic() - index.synced_at < self.resync_interval
+        )
+
+    async def get_index(self, chatbot_id: str) -> ChatbotIndex:
+        """Return the chatbot's index, starting a background sync if it is stale"""
+        version = self.database_service.knowledge_cache.version(chatbot_id)
+        index = self._indexes.get(chatbot_id)
+        if self._is_fresh(index, version) and not index.pending:
+            self._indexes.move_to_end(chatbot_id)
+            return index
+
+        self._start_build(chatbot_id)
+        if index is not None:
+            return index  # stale or partly embedded; the build catches it up
+
+        # Nothing to serve yet: wait for the build to chunk the knowledge base.
+        # Shielded, so a caller's timeout leaves the build running.
+        return await asyncio.shield(self._ready[chatbot_id])
+
+    async def sync(self, chatbot_id: str) -> ChatbotIndex:
+        """Wait until the chatbot's index is fully embedded and current (uploads)"""
+        while True:
+            try:
+                await asyncio.shield(self._start_build(chatbot_id))
+            except Exception:
+                if chatbot_id in self._indexes:
+                    return self._indexes[
+                        chatbot_id
+                    ]  # knowledge base unavailable; keep the stale index
+                raise
+            index = self._indexes.get(chatbot_id)
+            version = self.database_service.knowledge_cache.version(chatbot_id)
+            if index is None or (self._is_fresh(index, version) and not index.pending):
+                return await self.get_index(chatbot_id)
+
+    async def add_rows(self, chatbot_id: str, rows: List[Dict[str, Any]]) -> None:
+        """Embed freshly inserted knowledge rows into the chatbot's loaded index (upload batches)"""
+        async with self._locks.setdefault(chatbot_id, asyncio.Lock()):
+            index = self._indexes.get(chatbot_id)
+            if index is None or index.embedder_name != self.embedder.name:
+                return  # picked up by the next sync instead
+
+            new_rows = [row for row in rows if self._item_id(row) not in index.item_ids]
+            if new_rows:
+                self._index_rows(index, new_rows)
+                index.dirty = True
+            await self._embed_pending(index)
+
+    def schedule_refresh(self, chatbot_id: str) -> None:
+        """Re-sync (and persist) a chatbot's index in the background after its knowledge changed"""
+        self._start_build(chatbot_id)
+
+    def _start_build(self, chatbot_id: str) -> asyncio.Task:
+        """The chatbot's running sync task, started if there is none"""
+        task = self._builds.get(chatbot_id)
+        if task is not None:
+            return task
+
+        ready = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting for a refresh, so always retrieve its outcome
+        ready.add_done_callback(lambda future: future.cancelled() or future.exception())
+        self._ready[chatbot_id] = ready
+
+        task = self._spawn(self._build(chatbot_id, ready))
+        self._builds[chatbot_id] = task
+        task.add_done_callback(lambda _: self._build_done(chatbot_id, task, ready))
+        return task
+
+    def _build_done(
+        self, chatbot_id: str, task: asyncio.Task, ready: asyncio.Future
+    ) -> None:
+        if self._builds.get(chatbot_id) is task:
+            del self._builds[chatbot_id]
+            del self._ready[chatbot_id]
+        if not ready.done():
+            ready.cancel()
+
+    async def _build(self, chatbot_id: str, ready: asyncio.Future) -> None:
+        """Sync one chatbot's index: chunk new rows, publish the index, then embed and persist it"""
+        async with self._locks.setdefault(chatbot_id, asyncio.Lock()):
+            index = self._indexes.get(chatbot_id)
+            try:
+                if index is None and self.store is not None and self.store.enabled:
+                    snapshot = await asyncio.to_thread(self.store.load, chatbot_id)
+                    if snapshot is not None:
+                        index = ChatbotIndex.from_snapshot(snapshot)
+                        self._store(chatbot_id, index)
+                        logger.info(
+                            f"Mapped knowledge index for {chatbot_id} ({len(index.chunks)} chunks)"
+                        )
+
+                version = self.database_service.knowledge_cache.version(chatbot_id)
+                knowledge = await self.database_service.get_knowledge_base(chatbot_id)
+                if not knowledge.get("success"):
+                    raise Exception(
+                        knowledge.get("error", "Failed to load knowledge base")
+                    )
+
+                index = await self._sync(index, knowledge["data"] or [], version)
+                self._store(chatbot_id, index)
+            except Exception as e:
+                if index is not None:
+                    ready.set_result(index)  # serve the stale index rather than nothing
+                else:
+                    ready.set_exception(e)
+                raise
+            ready.set_result(index)
+
+            await self._embed_pending(index)
+
+        if index.dirty and self.store is not None and self.store.enabled:
+            await self._persist(chatbot_id, index)
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        # Builds outlive the request that started them, so they must not inherit its provider deadline
+        task = asyncio.get_running_loop().create_task(detached(coroutine))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(
+                f"Knowledge index background task failed: {str(task.exception())}"
+            )
+
+    async def _persist(self, chatbot_id: str, index: ChatbotIndex) -> None:
+        """Write an index to disk, then swap in the mapped copy so workers share its pages"""
+        async with self._locks.setdefault(chatbot_id, asyncio.Lock()):
+            if (
+                self._indexes.get(chatbot_id) is not index
+                or not index.dirty
+                or index.pending
+            ):
+                return  # superseded, already written or still embedding
+
+            await asyncio.to_thread(self.store.save, chatbot_id, index)
+            index.dirty = False
+
+            snapshot = await asyncio.to_thread(self.store.load, chatbot_id)
+            if snapshot is not None and len(snapshot.chunks) == len(index.chunks):
+                mapped = ChatbotIndex.from_snapshot(snapshot)
+                mapped.version = index.version
+                mapped.synced_at = index.synced_at
+                self._indexes[chatbot_id] = mapped
+
+    async def wait_for_background_tasks(self) -> None:
+        """Let pending refresh/persist tasks finish (used on shutdown)"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def search(
+        self, query: str, chatbot_id: str, limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """Top `limit` knowledge chunks for a query using the configured retrieval mode"""
+        mode = settings.knowledge_retrieval_mode
+        if mode == "lexical":
+            return await self.lexical_search(query, chatbot_id, limit)
+        if mode == "hybrid":
+            return await self.hybrid_search(query, chatbot_id, limit)
+
+        try:
+            return await self.vector_search(query, chatbot_id, limit)
+        except Exception as e:
+            # Remote embedder unavailable: lexical retrieval needs no provider call
+            logger.warning(
+                f"Vector search failed for {chatbot_id}, using BM25: {str(e)}"
+            )
+            return await self.lexical_search(query, chatbot_id, limit)
+
+    async def hybrid_search(
+        self, query: str, chatbot_id: str, limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """Fuse BM25 and vector candidates with reciprocal-rank fusion, then dedupe and rerank"""
+        index = await self.get_index(chatbot_id)
+        if not index.chunks:
+            return []
+
+        pool = max(settings.knowledge_candidate_pool, limit)
+        lexical_hits = index.lexical.search(tokenize(query), pool)
+
+        vector_hits = []
+        try:
+            query_vector = await self.embedder.embed([query])
+            vector_hits = [
+                (row, score)
+                for row, score in index.vectors.search(query_vector, pool)[0]
+                if score >= settings.knowledge_min_score
+            ]
+        except Exception as e:
+            logger.warning(f"Vector candidates unavailable for {chatbot_id}: {str(e)}")
+
+        fused = reciprocal_rank_fusion(
+            [[doc_id for doc_id, _ in lexical_hits], [row for row, _ in vector_hits]],
+            k=settings.knowledge_rrf_k,
+        )
+        selected = select_passages(
+            query,
+            fused,
+            index.chunks,
+            limit,
+            rerank=settings.knowledge_rerank_enabled,
+            budget_ms=settings.knowledge_rerank_budget_ms,
+        )
+
+        # Confidence: best 0..1 component score the chunk received
+        component_scores: Dict[int, float] = {row: score for row, score in vector_hits}
+        for doc_id, score in lexical_hits:
+            component_scores[doc_id] = max(
+                component_scores.get(doc_id, 0.0), score / (score + 1.0)
+            )
+
+        return [
+            {
+                **index.chunks[doc_id],
+                "confidence": round(component_scores.get(doc_id, 0.0), 4),
+                "retrieval_score": round(score, 4),
+            }
+            for doc_id, score in selected
+        ]
+
+    async def vector_search(
+        self, query: str, chatbot_id: str, limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """Top `limit` chunks by embedding cosine similarity"""
+        index = await self.get_index(chatbot_id)
+        if not len(index.vectors):
+            return []
+
+        query_vector = await self.embedder.embed([query])
+        hits = index.vectors.search(query_vector, limit)[0]
+
+        return [
+            {**index.chunks[row], "confidence": round(score, 4)}
+            for row, score in hits
+            if score >= settings.knowledge_min_score
+        ]
+
+    async def lexical_search(
+        self, query: str, chatbot_id: str, limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """Top `limit` chunks by BM25 over Indonesian tokens (exact terms, SKUs, prices)"""
+        index = await self.get_index(chatbot_id)
+        hits = index.lexical.search(tokenize(query), limit)
+
+        # BM25 scores are unbounded; squash into 0..1 for the confidence field
+        return [
+            {**index.chunks[doc_id], "confidence": round(score / (score + 1.0), 4)}
+            for doc_id, score in hits
+        ]
+
+    async def _sync(
+        self, index: Optional[ChatbotIndex], rows: List[Dict[str, Any]], version: int
+    ) -> ChatbotIndex:
+        """Bring an index up to date with the given knowledge rows (embedding happens separately)"""
+        row_ids = {self._item_id(row) for row in rows}
+
+        if (
+            index is None
+            or index.embedder_name != self.embedder.name
+            or not index.item_ids <= row_ids
+        ):
+            index = ChatbotIndex(self.embedder.name, await self._dim())
+            index.dirty = True
+
+        new_rows = [row for row in rows if self._item_id(row) not in index.item_ids]
+        if new_rows:
+            # Chunking a large knowledge base is CPU-bound; keep the event loop free
+            chunks = await asyncio.to_thread(self._chunk_rows, new_rows)
+            self._add_chunks(index, new_rows, chunks)
+            index.dirty = True
+
+        index.version = version
+        index.synced_at = time.monotonic()
+        return index
+
+    def _index_rows(self, index: ChatbotIndex, rows: List[Dict[str, Any]]) -> None:
+        """Chunk knowledge rows into the index, leaving them to `_embed_pending`"""
+        self._add_chunks(index, rows, self._chunk_rows(rows))
+
+    def _chunk_rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        chunks = []
+        for row in rows:
+            item_id = self._item_id(row)
+            chunks_of_row = iter_chunks(
+                row.get("content") or "",
+                settings.knowledge_chunk_tokens,
+                settings.knowledge_chunk_overlap,
+            )
+            for position, text in enumerate(chunks_of_row):
+                chunks.append(
+                    {
+                        "chunk_id": f"{item_id}:{position}",
+                        "item_id": item_id,
+                        "content": text,
+                        "source": row.get("source"),
+                        "category": row.get("category"),
+                    }
+                )
+        return chunks
+
+    def _add_chunks(
+        self,
+        index: ChatbotIndex,
+        rows: List[Dict[str, Any]],
+        chunks: List[Dict[str, Any]],
+    ) -> None:
+        for chunk in chunks:
+            index.lexical.add(tokenize(chunk["content"]))
+        index.chunks.extend(chunks)
+        index.item_ids.update(self._item_id(row) for row in rows)
+
+    async def _embed_pending(self, index: ChatbotIndex) -> None:
+        """Embed chunks that have no vector yet, batch by batch.
+
+        Each batch is searchable as soon as it is added, and a failure keeps
+        what was embedded so far; the next sync resumes from there.
+        """
+        batch_size = max(settings.embedding_batch_size, 1) * 8
+        while index.pending:
+            start = len(index.vectors)
+            batch = [
+                index.chunks[row]
+                for row in range(start, min(start + batch_size, len(index.chunks)))
+            ]
+            vectors = await self.embedder.embed([chunk["content"] for chunk in batch])
+            index.vectors.add(vectors)
+
+    def _store(self, chatbot_id: str, index: ChatbotIndex) -> None:
+        self._indexes[chatbot_id] = index
+        self._indexes.move_to_end(chatbot_id)
+        while len(self._indexes) > self.max_chatbots:
+            evicted, _ = self._indexes.popitem(last=False)
+            self._locks.pop(evicted, None)
+
+    async def _dim(self) -> int:
+        dim = getattr(self.embedder, "dim", None)
+        if dim is None:
+            # Remote embedders report their size on first use
+            dim = self.embedder.dim = (await self.embedder.embed(["dim"])).shape[1]
+        return dim
+
+    def _item_id(self, row: Dict[str, Any]) -> str:
+        if row.get("id"):
+            return str(row["id"])
+        return hashlib.sha1((row.get("content") or "").encode("utf-8")).hexdigest()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get index statistics"""
+        return {
+            "embedder": self.embedder.name,
+            "chatbots": len(self._indexes),
+            "chunks": sum(len(index.chunks) for index in self._indexes.values()),
+            "pending_embeddings": sum(
+                index.pending for index in self._indexes.values()
+            ),
+            "builds": len(self._builds),
+            "persistence": (
+                self.store.directory
+                if self.store is not None and self.store.enabled
+                else None
+            ),
+        }
+
+
+# Global instance
+knowledge_index = KnowledgeIndexManager(
+    supabase_service,
+    embedder,
+    settings.knowledge_index_max_chatbots,
+    store=KnowledgeIndexStore(settings.knowledge_index_dir),
+    resync_interval=settings.knowledge_cache_ttl,
+)
@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from services.keyword_matcher import KeywordMatcher, keyword_matcher, keyword_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class LinearTextClassifier:
+    """Multinomial linear model over sparse text features, loaded from JSON.
+
+    The model file holds "labels", a "bias" per label and "weights"
+    (feature -> one weight per label). Features are the lowercased words and
+    word bigrams of the text, "?" when it asks something, "has_link", and one
+    "lex:<lexicon>" (or "lex:<lexicon>:negated") per keyword-matcher hit for
+    each lexicon the weights mention.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        labels: List[str],
+        bias: List[float],
+        weights: Dict[str, List[float]],
+        matcher: KeywordMatcher = keyword_matcher,
+    ):
+        self.name = name
+        self.labels = labels
+        self.bias = np.asarray(bias, dtype=np.float64)
+        self.weights = {
+            feature: np.asarray(values, dtype=np.float64)
+            for feature, values in weights.items()
+        }
+        self.matcher = matcher
+        self.lexicons = sorted(
+            {
+                feature.split(":")[1]
+                for feature in self.weights
+                if feature.startswith("lex:")
+            }
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> "LinearTextClassifier":
+        with open(path, encoding="utf-8") as f:
+            model = json.load(f)
+        return cls(
+            model.get("name", os.path.basename(path)),
+            model["labels"],
+            model["bias"],
+            model["weights"],
+        )
+
+    def features(self, text: str) -> List[str]:
+        words = [token for token in keyword_tokens(text) if token[0].isalnum()]
+        features = words + [
+            f"{first} {second}" for first, second in zip(words, words[1:])
+        ]
+        if "?" in text:
+            features.append("?")
+        if "http" in text.lower() or "www." in text.lower():
+            features.append("has_link")
+        if self.lexicons:
+            for match in self.matcher.find(text, self.lexicons):
+                features.append(
+                    f"lex:{match.lexicon}:negated"
+                    if match.negated
+                    else f"lex:{match.lexicon}"
+                )
+        return features
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Most likely label and its probability"""
+        scores = self.bias.copy()
+        for feature in self.features(text):
+            weight = self.weights.get(feature)
+            if weight is not None:
+                scores += weight
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        best = int(probabilities.argmax())
+        return self.labels[best], float(probabilities[best])
+
+
+def _load_model(path: str) -> Optional[LinearTextClassifier]:
+    if not os.path.isabs(path):
+        path = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), path
+        )
+    try:
+        model = LinearTextClassifier.from_file(path)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(
+            f"Local classifier model {path} unavailable, using remote providers only: {str(e)}"
+        )
+        return None
+    logger.info(f"Loaded local classifier {model.name} ({len(model.weights)} features)")
+    return model
+
+
+class ClassificationCascade:
+    """Local-first sentiment and hoax classification.
+
+    A local linear model answers when its top probability reaches the task's
+    threshold; otherwise the caller goes on to the remote providers. Counts
+    of both outcomes are kept per task.
+    """
+
+    def __init__(
+        self,
+        models: Dict[str, Optional[LinearTextClassifier]],
+        thresholds: Dict[str, float],
+        enabled: bool = True,
+    ):
+        self.models = models
+        self.thresholds = thresholds
+        self.enabled = enabled
+        self.stats = {task: {"local": 0, "remote": 0} for task in models}
+
+    def _classify(self, task: str, text: str) -> Optional[Tuple[str, float]]:
+        model = self.models.get(task)
+        if self.enabled and model is not None:
+            try:
+                label, confidence = model.predict(text)
+                if confidence >= self.thresholds[task]:
+                    self.stats[task]["local"] += 1
+                    return label, confidence
+            except Exception as e:
+                logger.error(f"Local {task} classification failed: {str(e)}")
+        self.stats[task]["remote"] += 1
+        return None
+
+    def sentiment(self, text: str) -> Optional[Dict[str, Any]]:
+        """Local sentiment result, or None if the text needs a remote model"""
+        prediction = self._classify("sentiment", text)
+        if prediction is None:
+            return None
+        sentiment, confidence = prediction
+        return {
+            "sentiment": sentiment,
+            "confidence": confidence,
+            "emotions": {
+                "joy": 0.7 if sentiment == "positive" else 0.2,
+                "trust": 0.6 if sentiment == "positive" else 0.3,
+                "anticipation": 0.4,
+                "surprise": 0.3,
+                "fear": 0.2 if sentiment == "positive" else 0.6,
+                "sadness": 0.1 if sentiment == "positive" else 0.7,
+                "disgust": 0.1 if sentiment == "positive" else 0.5,
+                "anger": 0.1 if sentiment == "positive" else 0.6,
+            },
+            "model_used": self.models["sentiment"].name,
+            "ai_tier": "local",
+            "ai_provider": "Local classifier",
+        }
+
+    def hoax(self, text: str) -> Optional[Dict[str, Any]]:
+        """Local hoax verdict, or None if the text needs a remote model"""
+        prediction = self._classify("hoax", text)
+        if prediction is None:
+            return None
+        label, confidence = prediction
+        is_hoax = label == "hoax"
+        return {
+            "is_hoax": is_hoax,
+            "confidence": confidence,
+            "explanation": (
+                f"Klasifikasi lokal menunjukkan tingkat kepercayaan {confidence:.2%} bahwa teks ini mengandung misinformasi."
+                if is_hoax
+                else "Teks ini tampaknya tidak mengandung misinformasi berdasarkan klasifikasi lokal."
+            ),
+            "indicators": keyword_matcher.phrases(text, "hoax_indicators"),
+            "model_used": self.models["hoax"].name,
+            "ai_tier": "local",
+            "ai_provider": "Local classifier",
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get local vs remote routing per task"""
+        stats = {"enabled": self.enabled}
+        for task, counts in self.stats.items():
+            total = counts["local"] + counts["remote"]
+            model = self.models.get(task)
+            stats[task] = {
+                **counts,
+                "local_ratio": round(counts["local"] / total, 3) if total else 0.0,
+                "threshold": self.thresholds[task],
+                "model": model.name if model else None,
+            }
+        return stats
+
+
+# Global instance
+local_classifier = ClassificationCascade(
+    models={
+        "sentiment": _load_model(settings.local_sentiment_model),
+        "hoax": _load_model(settings.local_hoax_model),
+    },
+    thresholds={
+        "sentiment": settings.local_sentiment_threshold,
+        "hoax": settings.local_hoax_threshold,
+    },
+    enabled=settings.local_classifier_enabled,
+)
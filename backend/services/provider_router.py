@@ -0,0 +1,151 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+
+def is_configured(*values: Optional[str]) -> bool:
+    """True if every credential is set and not a `your_..._here` placeholder from the env template"""
+    for value in values:
+        if not value or not value.strip():
+            return False
+        lowered = value.strip().lower()
+        if lowered.startswith(("your_", "your-")) or lowered.endswith("_here"):
+            return False
+    return True
+
+
+class _ProviderStats:
+    __slots__ = ("outcomes", "ewma_latency", "calls", "last_sample_at")
+
+    def __init__(self, window: int):
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.ewma_latency: Optional[float] = None
+        self.calls = 0
+        self.last_sample_at = 0.0
+
+
+class ProviderRouter:
+    """Orders providers per operation by expected cost instead of a fixed chain.
+
+    Each (operation, provider) pair keeps an EWMA of successful-call latency
+    and a rolling success rate over the last `window` calls. The expected
+    cost is latency / success rate. Providers without recent samples (none
+    yet, or none for `recovery_after` seconds) are scored with their prior
+    latency, so a provider that recovered is eventually tried again, and
+    the registration order decides while there is no data.
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.3,
+        window: int = 50,
+        recovery_after: float = 120.0,
+        min_success_rate: float = 0.05,
+    ):
+        self.alpha = alpha
+        self.window = window
+        self.recovery_after = recovery_after
+        self.min_success_rate = min_success_rate
+
+        self._providers: Dict[str, Dict[str, Any]] = {}
+        self._stats: Dict[Tuple[str, str], _ProviderStats] = {}
+
+    def register(
+        self,
+        name: str,
+        configured: bool,
+        prior_latency: float,
+        label: Optional[str] = None,
+    ) -> None:
+        """Declare a provider; unconfigured ones are never routed to"""
+        self._providers[name] = {
+            "configured": configured,
+            "prior_latency": prior_latency,
+            "label": label or name,
+        }
+
+    def is_available(self, name: str) -> bool:
+        provider = self._providers.get(name)
+        return bool(provider and provider["configured"])
+
+    def order(
+        self, operation: str, candidates: Optional[Sequence[str]] = None
+    ) -> List[str]:
+        """Configured providers for an operation, cheapest expected cost first"""
+        names = [
+            name
+            for name in (candidates if candidates is not None else self._providers)
+            if self.is_available(name)
+        ]
+        position = {name: i for i, name in enumerate(self._providers)}
+        return sorted(
+            names,
+            key=lambda name: (self.expected_cost(operation, name), position[name]),
+        )
+
+    def expected_cost(self, operation: str, name: str) -> float:
+        stats = self._stats.get((operation, name))
+        prior = self._providers[name]["prior_latency"]
+        if (
+            stats is None
+            or not stats.outcomes
+            or time.monotonic() - stats.last_sample_at > self.recovery_after
+        ):
+            return prior
+
+        latency = stats.ewma_latency if stats.ewma_latency is not None else prior
+        return latency / max(self.success_rate(operation, name), self.min_success_rate)
+
+    def success_rate(self, operation: str, name: str) -> float:
+        stats = self._stats.get((operation, name))
+        if stats is None or not stats.outcomes:
+            return 1.0
+        return sum(stats.outcomes) / len(stats.outcomes)
+
+    def record(self, operation: str, name: str, latency: float, success: bool) -> None:
+        """Record the outcome of one provider call"""
+        stats = self._stats.get((operation, name))
+        if stats is None:
+            stats = self._stats[(operation, name)] = _ProviderStats(self.window)
+
+        stats.outcomes.append(success)
+        stats.calls += 1
+        stats.last_sample_at = time.monotonic()
+        if success:
+            if stats.ewma_latency is None:
+                stats.ewma_latency = latency
+            else:
+                stats.ewma_latency = (
+                    self.alpha * latency + (1 - self.alpha) * stats.ewma_latency
+                )
+
+    def ranking(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Current order and statistics per operation (for /ai/status)"""
+        operations = sorted({operation for operation, _ in self._stats} | {"chat"})
+        result = {}
+        for operation in operations:
+            entries = []
+            for name in self.order(operation):
+                stats = self._stats.get((operation, name))
+                entries.append(
+                    {
+                        "provider": self._providers[name]["label"],
+                        "expected_cost": round(self.expected_cost(operation, name), 3),
+                        "ewma_latency": (
+                            round(stats.ewma_latency, 3)
+                            if stats and stats.ewma_latency is not None
+                            else None
+                        ),
+                        "success_rate": round(self.success_rate(operation, name), 3),
+                        "calls": stats.calls if stats else 0,
+                    }
+                )
+            result[operation] = entries
+        return result
+
+    def unconfigured(self) -> List[str]:
+        return [
+            provider["label"]
+            for provider in self._providers.values()
+            if not provider["configured"]
+        ]
@@ -0,0 +1,296 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from config import settings
+from services.single_flight import normalize_input
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryResponseBackend:
+    """In-process LRU store bounded by the encoded size of its values"""
+
+    blocking = False
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[str, str, float]]" = (
+            OrderedDict()
+        )  # key -> (chatbot_id, value, expires_at)
+        self._total_bytes = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] < time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, chatbot_id: str, value: str, ttl: float) -> None:
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        while self._entries and self._total_bytes + size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        self._entries[key] = (chatbot_id, value, time.time() + ttl)
+        self._total_bytes += size
+
+    def invalidate(self, chatbot_id: str) -> int:
+        keys = [key for key, entry in self._entries.items() if entry[0] == chatbot_id]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= len(entry[1])
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+class SQLiteResponseBackend:
+    """Store in a local SQLite file, shared by every worker on the host.
+
+    Recency is tracked in an `accessed_at` column; when the stored values
+    exceed the byte budget the least recently used rows are deleted.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, max_bytes: int = 32 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, chatbot_id TEXT NOT NULL, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_chatbot ON responses (chatbot_id)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread; calls arrive via asyncio.to_thread
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key: str) -> Optional[str]:
+        db = self._connection()
+        now = time.time()
+        row = db.execute(
+            "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, chatbot_id: str, value: str, ttl: float) -> None:
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        db = self._connection()
+        now = time.time()
+        db.execute(
+            "INSERT OR REPLACE INTO responses (key, chatbot_id, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, chatbot_id, value, size, now + ttl, now),
+        )
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            db.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+            total = db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+            for old_key, old_size in db.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                total -= old_size
+                self.evictions += 1
+
+    def invalidate(self, chatbot_id: str) -> int:
+        return (
+            self._connection()
+            .execute("DELETE FROM responses WHERE chatbot_id = ?", (chatbot_id,))
+            .rowcount
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        entries, total = (
+            self._connection()
+            .execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses")
+            .fetchone()
+        )
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+class ResponseCache:
+    """Exact-match cache of chat answers.
+
+    The key covers the chatbot, the normalized message, the knowledge-base
+    version the answer was grounded on (a digest of the retrieved context,
+    which is the same in every worker) and the chat model configuration.
+    Entries live for the chatbot's TTL (`ttl_overrides`, else `default_ttl`;
+    0 disables caching for that chatbot) and are dropped when the chatbot's
+    knowledge base changes.
+    """
+
+    def __init__(
+        self,
+        backend,
+        default_ttl: float = 3600.0,
+        ttl_overrides: Optional[Dict[str, float]] = None,
+    ):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.ttl_overrides = dict(ttl_overrides or {})
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "invalidations": 0,
+            "errors": 0,
+        }
+
+    def ttl(self, chatbot_id: str) -> float:
+        return self.ttl_overrides.get(chatbot_id, self.default_ttl)
+
+    def set_ttl(self, chatbot_id: str, ttl: float) -> None:
+        """Per-chatbot TTL in seconds (0 disables caching for the chatbot)"""
+        self.ttl_overrides[chatbot_id] = ttl
+
+    def key(
+        self, chatbot_id: str, message: str, context: Optional[str], model: str
+    ) -> str:
+        kb_version = (
+            hashlib.sha1(context.encode("utf-8")).hexdigest() if context else ""
+        )
+        raw = json.dumps([chatbot_id, normalize_input(message), kb_version, model])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def _call(self, method, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def get(self, chatbot_id: str, key: str) -> Optional[Dict[str, Any]]:
+        """Cached answer, or None on miss/expiry"""
+        if self.ttl(chatbot_id) <= 0:
+            return None
+        try:
+            value = await self._call(self.backend.get, key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Response cache read failed: {str(e)}")
+            return None
+        if value is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return json.loads(value)
+
+    async def put(self, chatbot_id: str, key: str, response: Dict[str, Any]) -> None:
+        """Store a good answer for the chatbot's TTL"""
+        ttl = self.ttl(chatbot_id)
+        if ttl <= 0:
+            return
+        try:
+            await self._call(
+                self.backend.set,
+                key,
+                chatbot_id,
+                json.dumps(response, ensure_ascii=False),
+                ttl,
+            )
+            self.stats["stores"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Response cache write failed: {str(e)}")
+
+    async def invalidate(self, chatbot_id: str) -> None:
+        """Drop every cached answer for a chatbot (its knowledge base changed)"""
+        try:
+            await self._call(self.backend.invalidate, chatbot_id)
+            self.stats["invalidations"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"Response cache invalidation failed: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        try:
+            backend_stats = self.backend.get_stats()
+        except Exception as e:
+            backend_stats = {"error": str(e)}
+        return {
+            **self.stats,
+            "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "default_ttl": self.default_ttl,
+            **backend_stats,
+        }
+
+
+def _create_backend():
+    if settings.response_cache_backend == "sqlite":
+        return SQLiteResponseBackend(
+            settings.response_cache_path, settings.response_cache_max_bytes
+        )
+    return MemoryResponseBackend(settings.response_cache_max_bytes)
+
+
+# Global instance
+response_cache = ResponseCache(
+    _create_backend(),
+    default_ttl=settings.response_cache_ttl,
+    ttl_overrides=settings.response_cache_chatbot_ttls,
+)
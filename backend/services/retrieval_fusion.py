@@ -0,0 +1,88 @@
+import hashlib
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from services.indonesian_text import tokenize
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[int]], k: int = 60
+) -> List[Tuple[int, float]]:
+    """Merge ranked id lists: score(d) = sum over lists of 1 / (k + rank(d))"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).hexdigest()
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def select_passages(
+    query: str,
+    fused: List[Tuple[int, float]],
+    chunks: List[Dict[str, Any]],
+    limit: int,
+    rerank: bool = True,
+    budget_ms: float = 5.0,
+    near_duplicate_threshold: float = 0.8,
+    coverage_weight: float = 0.3,
+) -> List[Tuple[int, float]]:
+    """Pick the final `limit` chunks from fused candidates.
+
+    Exact duplicates (same normalized text) are always dropped. Within the
+    time budget, candidates are also tokenized once to drop near-duplicates
+    (e.g. overlapping windows) and to rerank by how many distinct query terms
+    they cover. Candidates not reached before the budget runs out keep their
+    fusion order.
+    """
+    if not fused:
+        return []
+
+    deadline = time.perf_counter() + budget_ms / 1000.0
+    query_terms = frozenset(tokenize(query))
+    top_score = fused[0][1] or 1.0
+
+    scored: List[Tuple[int, float, Optional[FrozenSet[str]]]] = []
+    for doc_id, score in fused:
+        base = score / top_score
+        terms: Optional[FrozenSet[str]] = None
+        if rerank and time.perf_counter() < deadline:
+            terms = frozenset(tokenize(chunks[doc_id]["content"]))
+            if query_terms:
+                coverage = len(query_terms & terms) / len(query_terms)
+                base = (1 - coverage_weight) * base + coverage_weight * coverage
+        scored.append((doc_id, base, terms))
+
+    if rerank:
+        scored.sort(key=lambda item: item[1], reverse=True)
+
+    selected: List[Tuple[int, float]] = []
+    seen_fingerprints = set()
+    selected_terms: List[FrozenSet[str]] = []
+    for doc_id, score, terms in scored:
+        fingerprint = _fingerprint(chunks[doc_id]["content"])
+        if fingerprint in seen_fingerprints:
+            continue
+        if terms is not None and any(
+            _jaccard(terms, other) >= near_duplicate_threshold
+            for other in selected_terms
+        ):
+            continue
+
+        seen_fingerprints.add(fingerprint)
+        if terms is not None:
+            selected_terms.append(terms)
+        selected.append((doc_id, score))
+        if len(selected) >= limit:
+            break
+
+    return selected
@@ -0,0 +1,223 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional
+
+import numpy as np
+
+from config import settings
+from services.embeddings import embedder
+from services.indonesian_text import STOPWORDS, tokenize
+from services.keyword_matcher import keyword_matcher
+from services.vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+# Stopwords that change what is being asked, kept when comparing questions
+_QUESTION_WORDS = frozenset(
+    "bagaimana belum berapa bisa boleh kapan kenapa mana siapa".split()
+)
+_IGNORED = STOPWORDS - _QUESTION_WORDS
+
+# Clothing sizes; with numbers, codes and negations these must match exactly
+_SIZES = frozenset("xxs xs s m l xl xxl xxxl".split())
+
+
+def question_text(message: str) -> str:
+    """Content words of a question ("Berapa harganya kak?" -> "berapa harga")"""
+    return " ".join(
+        token
+        for token in tokenize(message, remove_stopwords=False)
+        if token not in _IGNORED
+    )
+
+
+def question_guard(message: str) -> FrozenSet[str]:
+    """Tokens two questions must share to get the same answer.
+
+    Numbers and dates, SKU-like codes, sizes and negation words barely move
+    an embedding ("tanggal 17" / "tanggal 25", "ukuran xl" / "ukuran s",
+    "barang rusak" / "barang tidak rusak") but change the answer.
+    """
+    return frozenset(
+        token
+        for token in tokenize(message, remove_stopwords=False)
+        if token in _SIZES
+        or token in keyword_matcher.negations
+        or any(char.isdigit() for char in token)
+    )
+
+
+class _ChatbotAnswers:
+    __slots__ = ("index", "answers", "guards", "created_at", "version")
+
+    def __init__(self, dim: int, version: Hashable):
+        self.index = VectorIndex(dim, initial_capacity=32)
+        self.answers: List[Dict[str, Any]] = []
+        self.guards: List[FrozenSet[str]] = []
+        self.created_at: List[float] = []
+        self.version = version
+
+
+class SemanticCache:
+    """Per-chatbot cache of answered questions, matched by embedding similarity.
+
+    Each chatbot keeps a matrix of question embeddings; a lookup is one
+    matrix-vector product over it. The stored answer is returned when the
+    best cosine score reaches `threshold` and the two questions have the same
+    numbers, codes, sizes and negations (`question_guard`). Questions are
+    reduced to their content words before embedding, so rephrasings
+    ("berapa harganya" / "harga berapa ya") collide while different intents
+    do not. Entries are tied to the chatbot's knowledge version and dropped
+    when it changes.
+    """
+
+    # Nearest questions checked against the guard before giving up
+    candidates = 5
+
+    def __init__(
+        self,
+        embedder,
+        enabled: bool = True,
+        threshold: float = 0.95,
+        ttl: float = 3600.0,
+        max_entries: int = 500,
+        max_chatbots: int = 256,
+    ):
+        self.embedder = embedder
+        self.enabled = enabled
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_chatbots = max_chatbots
+
+        self._chatbots: "OrderedDict[str, _ChatbotAnswers]" = OrderedDict()
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "guard_rejections": 0,
+            "stores": 0,
+            "invalidations": 0,
+            "saved_latency": 0.0,
+        }
+
+    async def _embed(self, message: str) -> Optional[np.ndarray]:
+        text = question_text(message)
+        if not text:
+            return None
+        try:
+            return (await self.embedder.embed([text]))[0]
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {str(e)}")
+            return None
+
+    async def lookup(
+        self, chatbot_id: str, message: str, version: Hashable = 0
+    ) -> Optional[Dict[str, Any]]:
+        """Stored answer for a similar earlier question, or None"""
+        if not self.enabled:
+            return None
+        self.stats["lookups"] += 1
+        entries = self._chatbots.get(chatbot_id)
+        if entries is None or not entries.answers:
+            return None
+        if entries.version != version:
+            self.invalidate(chatbot_id)
+            return None
+
+        vector = await self._embed(message)
+        if vector is None or entries is not self._chatbots.get(chatbot_id):
+            return None
+
+        guard = question_guard(message)
+        now = time.time()
+        for row, score in entries.index.search(vector, self.candidates)[0]:
+            if score < self.threshold:
+                return None
+            if entries.created_at[row] + self.ttl < now:
+                continue
+            if entries.guards[row] != guard:
+                self.stats["guard_rejections"] += 1
+                continue
+            break
+        else:
+            return None
+
+        self._chatbots.move_to_end(chatbot_id)
+        answer = entries.answers[row]
+        self.stats["hits"] += 1
+        self.stats["saved_latency"] += answer.get("latency", 0.0)
+        return {**answer["response"], "semantic_score": round(score, 3)}
+
+    async def store(
+        self,
+        chatbot_id: str,
+        message: str,
+        response: Dict[str, Any],
+        latency: float,
+        version: Hashable = 0,
+    ) -> None:
+        """Remember the answer to a question (`latency` is what a later hit saves)"""
+        if not self.enabled:
+            return
+        vector = await self._embed(message)
+        if vector is None:
+            return
+
+        entries = self._chatbots.get(chatbot_id)
+        if entries is None or entries.version != version:
+            entries = self._chatbots[chatbot_id] = _ChatbotAnswers(len(vector), version)
+            while len(self._chatbots) > self.max_chatbots:
+                self._chatbots.popitem(last=False)
+        self._chatbots.move_to_end(chatbot_id)
+
+        if len(entries.answers) >= self.max_entries:
+            self._drop_oldest(entries, len(entries.answers) - self.max_entries // 2)
+
+        entries.index.add(vector[np.newaxis, :])
+        entries.answers.append({"response": response, "latency": latency})
+        entries.guards.append(question_guard(message))
+        entries.created_at.append(time.time())
+        self.stats["stores"] += 1
+
+    def _drop_oldest(self, entries: _ChatbotAnswers, count: int) -> None:
+        kept = entries.index.matrix[count:].copy()
+        entries.index = VectorIndex(
+            entries.index.dim, initial_capacity=max(len(kept) * 2, 32)
+        )
+        entries.index.add(kept)
+        del entries.answers[:count]
+        del entries.guards[:count]
+        del entries.created_at[:count]
+
+    def invalidate(self, chatbot_id: str) -> None:
+        """Forget every answer for a chatbot (its knowledge base changed)"""
+        if self._chatbots.pop(chatbot_id, None) is not None:
+            self.stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit ratio and provider latency saved by hits"""
+        return {
+            **self.stats,
+            "saved_latency": round(self.stats["saved_latency"], 3),
+            "hit_ratio": (
+                round(self.stats["hits"] / self.stats["lookups"], 3)
+                if self.stats["lookups"]
+                else 0.0
+            ),
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "chatbots": len(self._chatbots),
+            "entries": sum(len(entries.answers) for entries in self._chatbots.values()),
+        }
+
+
+# Global instance
+semantic_cache = SemanticCache(
+    embedder,
+    enabled=settings.semantic_cache_enabled,
+    threshold=settings.semantic_cache_threshold,
+    ttl=settings.semantic_cache_ttl,
+    max_entries=settings.semantic_cache_max_entries,
+    max_chatbots=settings.knowledge_index_max_chatbots,
+)
@@ -0,0 +1,88 @@
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_input(text: str) -> str:
+    """Case- and whitespace-insensitive form of a user message"""
+    return " ".join(text.casefold().split())
+
+
+def flight_key(
+    operation: str,
+    text: str,
+    chatbot_id: Optional[str] = None,
+    context: Optional[str] = None,
+) -> str:
+    """Key for (chatbot, operation, normalized input, context digest)"""
+    context_digest = (
+        hashlib.sha1(context.encode("utf-8")).hexdigest() if context else ""
+    )
+    raw = json.dumps(
+        [chatbot_id or "", operation, normalize_input(text), context_digest]
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces identical concurrent AI requests into one upstream call.
+
+    The first caller for a key starts the call; callers arriving while it
+    is in flight await the same task and get a copy of its result (or its
+    exception). The task is shielded from individual callers being
+    cancelled and is only cancelled once every caller has given up.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.stats = {"calls": 0, "upstream": 0, "coalesced": 0}
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of `factory()`, shared with concurrent callers using the same key"""
+        self.stats["calls"] += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(factory()))
+            flight.task.add_done_callback(
+                lambda _, key=key, flight=flight: self._forget(key, flight)
+            )
+            self.stats["upstream"] += 1
+        else:
+            self.stats["coalesced"] += 1
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Every caller gave up; later callers start a fresh call
+                self._forget(key, flight)
+                flight.task.cancel()
+        # Callers annotate their result dicts, so each gets its own copy
+        return copy.copy(result)
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get coalescing statistics"""
+        return {**self.stats, "in_flight": len(self._flights)}
+
+
+# Global instance
+single_flight = SingleFlight()
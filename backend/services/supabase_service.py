@@ -1,106 +1,129 @@
-from supabase import create_client, Client
-from typing import Dict, List, Optional, Any
-from config import settings
+import asyncio
 import logging
-from datetime import datetime, timezone
 import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from supabase import Client, create_client
+
+from config import settings
+from services.counter_aggregator import CounterAggregator
+from services.knowledge_cache import KnowledgeBaseCache
+from services.response_cache import response_cache
+from services.semantic_cache import semantic_cache
 
 logger = logging.getLogger(__name__)
 
+
 class SupabaseService:
     """Service for interacting with Supabase database and auth"""
-    
+
     def __init__(self):
         self.supabase: Client = create_client(
-            settings.supabase_url,
-            settings.supabase_anon_key
+            settings.supabase_url, settings.supabase_anon_key
         )
         self.admin_client: Client = create_client(
-            settings.supabase_url,
-            settings.supabase_service_role_key
+            settings.supabase_url, settings.supabase_service_role_key
         )
-    
+
+        # Counter deltas are aggregated in memory and flushed periodically
+        self.counters = CounterAggregator(
+            self, flush_interval=settings.counter_flush_interval
+        )
+        self._counter_rpc_available = True
+        self._counter_locks: Dict[str, asyncio.Lock] = {}
+
+        # Per-chatbot knowledge rows served from memory for hot chatbots
+        self.knowledge_cache = KnowledgeBaseCache(
+            max_bytes=settings.knowledge_cache_max_bytes,
+            ttl=settings.knowledge_cache_ttl,
+        )
+
     # Authentication Methods
-    async def create_user(self, email: str, password: str, metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+    async def create_user(
+        self, email: str, password: str, metadata: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
         """Create a new user account"""
         try:
-            response = self.supabase.auth.sign_up({
-                "email": email,
-                "password": password,
-                "options": {
-                    "data": metadata or {}
+            response = self.supabase.auth.sign_up(
+                {
+                    "email": email,
+                    "password": password,
+                    "options": {"data": metadata or {}},
                 }
-            })
-            
+            )
+
             if response.user:
                 # Create user profile in custom table
                 profile_data = {
                     "id": response.user.id,
                     "email": email,
                     "full_name": metadata.get("full_name") if metadata else None,
-                    "business_name": metadata.get("business_name") if metadata else None,
+                    "business_name": (
+                        metadata.get("business_name") if metadata else None
+                    ),
                     "industry": metadata.get("industry") if metadata else None,
                     "created_at": datetime.now(timezone.utc).isoformat(),
-                    "updated_at": datetime.now(timezone.utc).isoformat()
+                    "updated_at": datetime.now(timezone.utc).isoformat(),
                 }
-                
+
                 await self.create_user_profile(profile_data)
-                
+
                 return {
                     "success": True,
                     "user": {
                         "id": response.user.id,
                         "email": response.user.email,
-                        "created_at": response.user.created_at
-                    }
+                        "created_at": response.user.created_at,
+                    },
                 }
             else:
-                return {
-                    "success": False,
-                    "error": "Failed to create user account"
-                }
-                
+                return {"success": False, "error": "Failed to create user account"}
+
         except Exception as e:
             logger.error(f"Error creating user: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
-    
+            return {"success": False, "error": str(e)}
+
     async def authenticate_user(self, email: str, password: str) -> Dict[str, Any]:
         """Authenticate user and return session"""
         try:
-            response = self.supabase.auth.sign_in_with_password({
-                "email": email,
-                "password": password
-            })
-            
+            response = self.supabase.auth.sign_in_with_password(
+                {"email": email, "password": password}
+            )
+
             if response.user and response.session:
                 return {
                     "success": True,
-                    "user": {
-                        "id": response.user.id,
-                        "email": response.user.email
-                    },
+                    "user": {"id": response.user.id, "email": response.user.email},
                     "session": {
                         "access_token": response.session.access_token,
                         "refresh_token": response.session.refresh_token,
-                        "expires_at": response.session.expires_at
-                    }
+                        "expires_at": response.session.expires_at,
+                    },
                 }
             else:
+                return {"success": False, "error": "Invalid credentials"}
+
+        except Exception as e:
+            logger.error(f"Error authenticating user: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    async def get_token_user(self, access_token: str) -> Dict[str, Any]:
+        """Verify an access token with Supabase Auth and return its user"""
+        try:
+            response = await asyncio.to_thread(
+                self.supabase.auth.get_user, access_token
+            )
+            if response and response.user:
                 return {
-                    "success": False,
-                    "error": "Invalid credentials"
+                    "success": True,
+                    "user": {"id": response.user.id, "email": response.user.email},
                 }
-                
+            return {"success": False, "error": "Invalid token"}
         except Exception as e:
-            logger.error(f"Error authenticating user: {str(e)}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
-    
+            logger.warning(f"Access token rejected: {str(e)}")
+            return {"success": False, "error": str(e)}
+
     # User Profile Methods
     async def create_user_profile(self, profile_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create user profile in profiles table"""
@@ -110,11 +133,13 @@ class SupabaseService:
         except Exception as e:
             logger.error(f"Error creating user profile: {str(e)}")
             return {"success": False, "error": str(e)}
-    
+
     async def get_user_profile(self, user_id: str) -> Dict[str, Any]:
         """Get user profile by ID"""
         try:
-            response = self.supabase.table("profiles").select("*").eq("id", user_id).execute()
+            response = (
+                self.supabase.table("profiles").select("*").eq("id", user_id).execute()
+            )
             if response.data:
                 return {"success": True, "data": response.data[0]}
             else:
@@ -122,9 +147,11 @@ class SupabaseService:
         except Exception as e:
             logger.error(f"Error getting user profile: {str(e)}")
             return {"success": False, "error": str(e)}
-    
+
     # Chatbot Management Methods
-    async def create_chatbot(self, user_id: str, chatbot_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def create_chatbot(
+        self, user_id: str, chatbot_data: Dict[str, Any]
+    ) -> Dict[str, Any]:
         """Create a new chatbot"""
         try:
             chatbot_id = str(uuid.uuid4())
@@ -138,33 +165,40 @@ class SupabaseService:
                 "knowledge_base_size": 0,
                 "total_conversations": 0,
                 "created_at": datetime.now(timezone.utc).isoformat(),
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "updated_at": datetime.now(timezone.utc).isoformat(),
             }
-            
+
             response = self.supabase.table("chatbots").insert(data).execute()
             return {"success": True, "data": response.data[0]}
         except Exception as e:
             logger.error(f"Error creating chatbot: {str(e)}")
             return {"success": False, "error": str(e)}
-    
+
     async def get_user_chatbots(self, user_id: str) -> Dict[str, Any]:
         """Get all chatbots for a user"""
         try:
-            response = self.supabase.table("chatbots").select("*").eq("user_id", user_id).execute()
+            response = (
+                self.supabase.table("chatbots")
+                .select("*")
+                .eq("user_id", user_id)
+                .execute()
+            )
             return {"success": True, "data": response.data}
         except Exception as e:
             logger.error(f"Error getting user chatbots: {str(e)}")
             return {"success": False, "error": str(e)}
-    
+
     async def get_chatbot(self, chatbot_id: str, user_id: str) -> Dict[str, Any]:
         """Get specific chatbot"""
         try:
-            response = (self.supabase.table("chatbots")
-                       .select("*")
-                       .eq("id", chatbot_id)
-                       .eq("user_id", user_id)
-                       .execute())
-            
+            response = (
+                self.supabase.table("chatbots")
+                .select("*")
+                .eq("id", chatbot_id)
+                .eq("user_id", user_id)
+                .execute()
+            )
+
             if response.data:
                 return {"success": True, "data": response.data[0]}
             else:
@@ -172,25 +206,47 @@ class SupabaseService:
         except Exception as e:
             logger.error(f"Error getting chatbot: {str(e)}")
             return {"success": False, "error": str(e)}
-    
-    async def update_chatbot(self, chatbot_id: str, user_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
+
+    async def update_chatbot(
+        self, chatbot_id: str, user_id: str, updates: Dict[str, Any]
+    ) -> Dict[str, Any]:
         """Update chatbot data"""
         try:
             updates["updated_at"] = datetime.now(timezone.utc).isoformat()
-            
-            response = (self.supabase.table("chatbots")
-                       .update(updates)
-                       .eq("id", chatbot_id)
-                       .eq("user_id", user_id)
-                       .execute())
-            
+
+            response = (
+                self.supabase.table("chatbots")
+                .update(updates)
+                .eq("id", chatbot_id)
+                .eq("user_id", user_id)
+                .execute()
+            )
+
             return {"success": True, "data": response.data}
         except Exception as e:
             logger.error(f"Error updating chatbot: {str(e)}")
             return {"success": False, "error": str(e)}
-    
+
+    async def is_chatbot_owner(self, chatbot_id: str, user_id: str) -> bool:
+        """Whether a chatbot exists and belongs to the user (checked before writes made with server privileges)"""
+        try:
+            response = await asyncio.to_thread(
+                lambda: self.admin_client.table("chatbots")
+                .select("id")
+                .eq("id", chatbot_id)
+                .eq("user_id", user_id)
+                .limit(1)
+                .execute()
+            )
+            return bool(response.data)
+        except Exception as e:
+            logger.error(f"Error checking chatbot owner: {str(e)}")
+            return False
+
     # Knowledge Base Methods
-    async def add_knowledge_item(self, chatbot_id: str, content: str, source: str = None, category: str = None) -> Dict[str, Any]:
+    async def add_knowledge_item(
+        self, chatbot_id: str, content: str, source: str = None, category: str = None
+    ) -> Dict[str, Any]:
         """Add item to chatbot knowledge base"""
         try:
             data = {
@@ -199,123 +255,337 @@ class SupabaseService:
                 "content": content,
                 "source": source,
                 "category": category,
-                "created_at": datetime.now(timezone.utc).isoformat()
+                "created_at": datetime.now(timezone.utc).isoformat(),
             }
-            
+
             response = self.supabase.table("knowledge_base").insert(data).execute()
-            
-            # Update chatbot knowledge base size
-            await self.update_knowledge_base_size(chatbot_id)
-            
+            self.knowledge_cache.invalidate(chatbot_id)
+            # Cached chat answers may contradict the new knowledge
+            await response_cache.invalidate(chatbot_id)
+            semantic_cache.invalidate(chatbot_id)
+
+            # Update chatbot knowledge base size (flushed by the counter aggregator)
+            self.counters.add(chatbot_id, "knowledge_base_size", 1)
+
             return {"success": True, "data": response.data[0]}
         except Exception as e:
             logger.error(f"Error adding knowledge item: {str(e)}")
             return {"success": False, "error": str(e)}
-    
+
+    async def add_knowledge_items(
+        self, chatbot_id: str, items: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Bulk insert knowledge base items (used by file uploads)"""
+        try:
+            created_at = datetime.now(timezone.utc).isoformat()
+            rows = [
+                {
+                    "id": str(uuid.uuid4()),
+                    "chatbot_id": chatbot_id,
+                    "content": item["content"],
+                    "source": item.get("source"),
+                    "category": item.get("category"),
+                    "created_at": created_at,
+                }
+                for item in items
+            ]
+
+            response = await asyncio.to_thread(
+                lambda: self.supabase.table("knowledge_base").insert(rows).execute()
+            )
+            self.knowledge_cache.invalidate(chatbot_id)
+            # Cached chat answers may contradict the new knowledge
+            await response_cache.invalidate(chatbot_id)
+            semantic_cache.invalidate(chatbot_id)
+
+            self.counters.add(chatbot_id, "knowledge_base_size", len(rows))
+
+            return {"success": True, "data": response.data}
+        except Exception as e:
+            logger.error(f"Error adding knowledge items: {str(e)}")
+            return {"success": False, "error": str(e)}
+
     async def get_knowledge_base(self, chatbot_id: str) -> Dict[str, Any]:
-        """Get all knowledge base items for a chatbot"""
+        """Get all knowledge base items for a chatbot (served from cache when fresh)"""
+        cached = self.knowledge_cache.get(chatbot_id)
+        if cached is not None:
+            return {"success": True, "data": cached, "cached": True}
+
         try:
-            response = self.supabase.table("knowledge_base").select("*").eq("chatbot_id", chatbot_id).execute()
+            version = self.knowledge_cache.version(chatbot_id)
+            response = await asyncio.to_thread(
+                lambda: self.supabase.table("knowledge_base")
+                .select("*")
+                .eq("chatbot_id", chatbot_id)
+                .execute()
+            )
+            self.knowledge_cache.put(chatbot_id, response.data, version)
             return {"success": True, "data": response.data}
         except Exception as e:
             logger.error(f"Error getting knowledge base: {str(e)}")
             return {"success": False, "error": str(e)}
-    
+
+    async def get_knowledge_stamp(self, chatbot_id: str) -> Optional[str]:
+        """Knowledge version every worker agrees on, or None if the knowledge base is unavailable.
+
+        Combines the local write stamp with the row count and newest row, so
+        rows another worker added change it once this worker's knowledge
+        cache refreshes (within `knowledge_cache_ttl`).
+        """
+        version = self.knowledge_cache.version(chatbot_id)
+        knowledge = await self.get_knowledge_base(chatbot_id)
+        if not knowledge["success"]:
+            return None
+        rows = knowledge["data"] or []
+        latest = max((row.get("created_at") or "" for row in rows), default="")
+        return f"{version}:{len(rows)}:{latest}"
+
     async def update_knowledge_base_size(self, chatbot_id: str) -> None:
-        """Update the knowledge base size count for a chatbot"""
+        """Recount the knowledge base size for a chatbot (full reconciliation)"""
         try:
             # Count knowledge base items
-            response = self.supabase.table("knowledge_base").select("id", count="exact").eq("chatbot_id", chatbot_id).execute()
+            response = (
+                self.supabase.table("knowledge_base")
+                .select("id", count="exact")
+                .eq("chatbot_id", chatbot_id)
+                .execute()
+            )
             count = response.count or 0
-            
+
             # Update chatbot record
-            self.supabase.table("chatbots").update({"knowledge_base_size": count}).eq("id", chatbot_id).execute()
+            self.supabase.table("chatbots").update({"knowledge_base_size": count}).eq(
+                "id", chatbot_id
+            ).execute()
         except Exception as e:
             logger.error(f"Error updating knowledge base size: {str(e)}")
-    
+
+    # File Upload Methods (processing status shared by all workers)
+    async def create_file_upload(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert a file_uploads row"""
+        try:
+            response = await asyncio.to_thread(
+                lambda: self.admin_client.table("file_uploads").insert(row).execute()
+            )
+            return {"success": True, "data": response.data[0] if response.data else row}
+        except Exception as e:
+            logger.error(f"Error creating file upload: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    async def update_file_upload(
+        self, upload_id: str, updates: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Update a file_uploads row"""
+        try:
+            await asyncio.to_thread(
+                lambda: self.admin_client.table("file_uploads")
+                .update(updates)
+                .eq("id", upload_id)
+                .execute()
+            )
+            return {"success": True}
+        except Exception as e:
+            logger.error(f"Error updating file upload: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    async def get_file_upload(self, upload_id: str) -> Dict[str, Any]:
+        """Get a file_uploads row by ID"""
+        try:
+            response = await asyncio.to_thread(
+                lambda: self.admin_client.table("file_uploads")
+                .select("*")
+                .eq("id", upload_id)
+                .execute()
+            )
+            if response.data:
+                return {"success": True, "data": response.data[0]}
+            return {"success": False, "error": "File upload not found"}
+        except Exception as e:
+            logger.error(f"Error getting file upload: {str(e)}")
+            return {"success": False, "error": str(e)}
+
     # Conversation Methods
-    async def log_conversation(self, chatbot_id: str, user_message: str, bot_response: str, metadata: Dict[str, Any] = None) -> Dict[str, Any]:
+    def build_conversation_row(
+        self,
+        chatbot_id: str,
+        user_message: str,
+        bot_response: str,
+        metadata: Dict[str, Any] = None,
+    ) -> Dict[str, Any]:
+        """Build a conversations table row"""
+        return {
+            "id": str(uuid.uuid4()),
+            "chatbot_id": chatbot_id,
+            "user_message": user_message,
+            "bot_response": bot_response,
+            "sentiment": metadata.get("sentiment") if metadata else None,
+            "confidence": metadata.get("confidence") if metadata else None,
+            "is_hoax_detected": metadata.get("is_hoax_detected") if metadata else None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    async def log_conversation(
+        self,
+        chatbot_id: str,
+        user_message: str,
+        bot_response: str,
+        metadata: Dict[str, Any] = None,
+    ) -> Dict[str, Any]:
         """Log a conversation between user and chatbot"""
         try:
-            data = {
-                "id": str(uuid.uuid4()),
-                "chatbot_id": chatbot_id,
-                "user_message": user_message,
-                "bot_response": bot_response,
-                "sentiment": metadata.get("sentiment") if metadata else None,
-                "confidence": metadata.get("confidence") if metadata else None,
-                "is_hoax_detected": metadata.get("is_hoax_detected") if metadata else None,
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            
+            data = self.build_conversation_row(
+                chatbot_id, user_message, bot_response, metadata
+            )
+
             response = self.supabase.table("conversations").insert(data).execute()
-            
-            # Update chatbot conversation count
-            await self.increment_conversation_count(chatbot_id)
-            
+
+            # Update chatbot conversation count (flushed by the counter aggregator)
+            self.counters.add(chatbot_id, "total_conversations", 1)
+
             return {"success": True, "data": response.data[0]}
         except Exception as e:
             logger.error(f"Error logging conversation: {str(e)}")
             return {"success": False, "error": str(e)}
-    
-    async def increment_conversation_count(self, chatbot_id: str) -> None:
-        """Increment the total conversation count for a chatbot"""
+
+    async def log_conversations_bulk(
+        self, rows: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Insert many conversation rows in one request"""
         try:
-            # Get current count
-            response = self.supabase.table("chatbots").select("total_conversations").eq("id", chatbot_id).execute()
-            if response.data:
-                current_count = response.data[0].get("total_conversations", 0)
-                new_count = current_count + 1
-                
-                # Update count
-                self.supabase.table("chatbots").update({"total_conversations": new_count}).eq("id", chatbot_id).execute()
+            # Run the blocking client call off the event loop
+            response = await asyncio.to_thread(
+                lambda: self.supabase.table("conversations").insert(rows).execute()
+            )
+
+            # Update chatbot conversation counts (flushed by the counter aggregator)
+            for row in rows:
+                self.counters.add(row["chatbot_id"], "total_conversations", 1)
+
+            return {"success": True, "data": response.data}
         except Exception as e:
-            logger.error(f"Error incrementing conversation count: {str(e)}")
-    
-    async def get_chatbot_analytics(self, chatbot_id: str, days: int = 30) -> Dict[str, Any]:
+            logger.error(f"Error logging conversations in bulk: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    async def increment_conversation_count(
+        self, chatbot_id: str, amount: int = 1
+    ) -> None:
+        """Increment the total conversation count for a chatbot"""
+        await self.apply_counter_deltas(chatbot_id, {"total_conversations": amount})
+
+    # Counter Methods
+    async def apply_counter_deltas(
+        self, chatbot_id: str, deltas: Dict[str, int]
+    ) -> Dict[str, Any]:
+        """Atomically add deltas to a chatbot's counters"""
+        if self._counter_rpc_available:
+            try:
+                params = {
+                    "p_chatbot_id": chatbot_id,
+                    "p_conversations": deltas.get("total_conversations", 0),
+                    "p_knowledge_items": deltas.get("knowledge_base_size", 0),
+                }
+                await asyncio.to_thread(
+                    lambda: self.admin_client.rpc(
+                        "increment_chatbot_counters", params
+                    ).execute()
+                )
+                return {"success": True}
+            except Exception as e:
+                if "increment_chatbot_counters" not in str(e) and "PGRST202" not in str(
+                    e
+                ):
+                    logger.error(f"Error applying counter deltas: {str(e)}")
+                    return {"success": False, "error": str(e)}
+                # Function not installed yet (see database/schema.sql)
+                logger.warning(
+                    "increment_chatbot_counters RPC unavailable, using local read-modify-write"
+                )
+                self._counter_rpc_available = False
+
+        return await self._apply_counter_deltas_locally(chatbot_id, deltas)
+
+    async def _apply_counter_deltas_locally(
+        self, chatbot_id: str, deltas: Dict[str, int]
+    ) -> Dict[str, Any]:
+        """Stand-in for the RPC: read-modify-write serialized per chatbot in this process"""
+        lock = self._counter_locks.setdefault(chatbot_id, asyncio.Lock())
+        async with lock:
+            try:
+                columns = ",".join(deltas.keys())
+                response = await asyncio.to_thread(
+                    lambda: self.supabase.table("chatbots")
+                    .select(columns)
+                    .eq("id", chatbot_id)
+                    .execute()
+                )
+                if not response.data:
+                    return {"success": True}
+
+                current = response.data[0]
+                updates = {
+                    counter: max((current.get(counter) or 0) + amount, 0)
+                    for counter, amount in deltas.items()
+                }
+                await asyncio.to_thread(
+                    lambda: self.supabase.table("chatbots")
+                    .update(updates)
+                    .eq("id", chatbot_id)
+                    .execute()
+                )
+                return {"success": True}
+            except Exception as e:
+                logger.error(f"Error applying counter deltas locally: {str(e)}")
+                return {"success": False, "error": str(e)}
+
+    async def get_chatbot_analytics(
+        self, chatbot_id: str, days: int = 30
+    ) -> Dict[str, Any]:
         """Get analytics data for a chatbot"""
         try:
             # Get conversation data from the last N days
             from datetime import timedelta
+
             start_date = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
-            
-            response = (self.supabase.table("conversations")
-                       .select("*")
-                       .eq("chatbot_id", chatbot_id)
-                       .gte("created_at", start_date)
-                       .execute())
-            
+
+            response = (
+                self.supabase.table("conversations")
+                .select("*")
+                .eq("chatbot_id", chatbot_id)
+                .gte("created_at", start_date)
+                .execute()
+            )
+
             conversations = response.data
-            
+
             # Calculate analytics
             total_conversations = len(conversations)
             sentiment_counts = {"positive": 0, "negative": 0, "neutral": 0}
-            
+
             for conv in conversations:
                 sentiment = conv.get("sentiment", "neutral")
                 if sentiment in sentiment_counts:
                     sentiment_counts[sentiment] += 1
-            
+
             # Calculate percentages
             if total_conversations > 0:
                 sentiment_distribution = {
-                    k: round((v / total_conversations) * 100, 1) 
+                    k: round((v / total_conversations) * 100, 1)
                     for k, v in sentiment_counts.items()
                 }
             else:
                 sentiment_distribution = {"positive": 0, "negative": 0, "neutral": 0}
-            
+
             return {
                 "success": True,
                 "data": {
                     "total_conversations": total_conversations,
                     "sentiment_distribution": sentiment_distribution,
-                    "period_days": days
-                }
+                    "period_days": days,
+                },
             }
         except Exception as e:
             logger.error(f"Error getting chatbot analytics: {str(e)}")
             return {"success": False, "error": str(e)}
 
+
 # Global instance
 supabase_service = SupabaseService()
@@ -0,0 +1,170 @@
+import re
+from typing import Iterable, Iterator, List, Tuple, Union
+
+# Sentence ends: terminal punctuation (plus closing quotes/brackets) followed by
+# whitespace, or a line break. Blank lines end a paragraph.
+_SENTENCE_END_RE = re.compile(r"[.!?…]+[\"'”’)\]]*\s+|\n")
+_PARAGRAPH_RE = re.compile(r"\n[ \t\r\f\v]*\n\s*")
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+# Abbreviations whose trailing period does not end a sentence
+_ABBREVIATIONS = frozenset("""
+a.n bpk dll dkk dr drs dsb dst hlm ibu ir jl kab kec kel mis no prof rp sdr st tel tgl u.p vs yth
+""".split())
+
+# A sentence still unterminated after this many characters is cut at a space
+_MAX_PENDING_CHARS = 20000
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate subword token count: words and punctuation marks, long words count extra"""
+    return sum(1 + (len(piece) - 1) // 6 for piece in _TOKEN_RE.findall(text))
+
+
+def _is_abbreviation(sentence: str) -> bool:
+    tail = sentence.rstrip()
+    if not tail.endswith("."):
+        return False
+    words = tail[-32:].rstrip(".").split()
+    if not words:
+        return False
+    word = words[-1].lower()
+    return word in _ABBREVIATIONS or (len(word) == 1 and word.isalpha())
+
+
+def _split_sentences(text: str, final: bool) -> Tuple[List[str], str]:
+    """Complete sentences in `text` and the unterminated remainder"""
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        if match.end() == len(text) and not final:
+            break  # the next piece may continue this sentence (e.g. "3." + "5")
+        candidate = text[start : match.end()]
+        if match.group() != "\n" and _is_abbreviation(candidate):
+            continue
+        sentences.append(candidate.strip())
+        start = match.end()
+
+    remainder = text[start:]
+    if final:
+        if remainder.strip():
+            sentences.append(remainder.strip())
+        remainder = ""
+    elif len(remainder) > _MAX_PENDING_CHARS:
+        cut = remainder.rfind(" ", 0, _MAX_PENDING_CHARS) + 1 or _MAX_PENDING_CHARS
+        sentences.append(remainder[:cut].strip())
+        remainder = remainder[cut:]
+    return [sentence for sentence in sentences if sentence], remainder
+
+
+def iter_sentences(stream: Iterable[str]) -> Iterator[Tuple[str, bool]]:
+    """Yield (sentence, ends_paragraph) from a stream of text pieces as soon as each is complete"""
+    buffer = ""
+    for piece in stream:
+        buffer += piece
+        paragraphs = _PARAGRAPH_RE.split(buffer)
+        buffer = paragraphs.pop()
+        for paragraph in paragraphs:
+            sentences, _ = _split_sentences(paragraph, final=True)
+            for position, sentence in enumerate(sentences):
+                yield sentence, position == len(sentences) - 1
+
+        sentences, buffer = _split_sentences(buffer, final=False)
+        for sentence in sentences:
+            yield sentence, False
+
+    sentences, _ = _split_sentences(buffer, final=True)
+    for position, sentence in enumerate(sentences):
+        yield sentence, position == len(sentences) - 1
+
+
+def _split_long(sentence: str, target_tokens: int) -> List[Tuple[str, int]]:
+    """Break a sentence longer than the target into word runs that fit"""
+    tokens = estimate_tokens(sentence)
+    if tokens <= target_tokens:
+        return [(sentence, tokens)]
+
+    pieces = []
+    words: List[str] = []
+    count = 0
+    for word in sentence.split():
+        word_tokens = estimate_tokens(word)
+        if words and count + word_tokens > target_tokens:
+            pieces.append((" ".join(words), count))
+            words, count = [], 0
+        words.append(word)
+        count += word_tokens
+    if words:
+        pieces.append((" ".join(words), count))
+    return pieces
+
+
+def _join(sentences: List[Tuple[str, int, bool]]) -> str:
+    parts = []
+    for position, (text, _, ends_paragraph) in enumerate(sentences):
+        parts.append(text)
+        if position < len(sentences) - 1:
+            parts.append("\n\n" if ends_paragraph else " ")
+    return "".join(parts)
+
+
+def iter_chunks(
+    stream: Union[str, Iterable[str]],
+    target_tokens: int = 400,
+    overlap_tokens: int = 50,
+) -> Iterator[str]:
+    """Yield chunks of about `target_tokens` tokens from text or a stream of text pieces.
+
+    Chunks are built from whole sentences; a chunk also ends at a paragraph
+    break once it is at least half full. Consecutive chunks within a
+    paragraph share up to `overlap_tokens` tokens of trailing sentences.
+    Only the current chunk and the unfinished sentence are held in memory.
+    """
+    if isinstance(stream, str):
+        stream = (stream,)
+    target_tokens = max(target_tokens, 1)
+    overlap_tokens = min(max(overlap_tokens, 0), target_tokens // 2)
+
+    current: List[Tuple[str, int, bool]] = []
+    current_tokens = 0
+    pending = False  # current holds text not yet yielded
+
+    for sentence, ends_paragraph in iter_sentences(stream):
+        pieces = _split_long(sentence, target_tokens)
+        for position, (text, tokens) in enumerate(pieces):
+            if pending and current_tokens + tokens > target_tokens:
+                yield _join(current)
+                pending = False
+
+                # Carry trailing sentences over as overlap
+                carried: List[Tuple[str, int, bool]] = []
+                carried_tokens = 0
+                for previous in reversed(current):
+                    if carried_tokens + previous[1] > overlap_tokens:
+                        break
+                    carried.insert(0, previous)
+                    carried_tokens += previous[1]
+                current, current_tokens = carried, carried_tokens
+
+            while current and current_tokens + tokens > target_tokens:
+                current_tokens -= current.pop(0)[1]
+
+            current.append(
+                (text, tokens, ends_paragraph and position == len(pieces) - 1)
+            )
+            current_tokens += tokens
+            pending = True
+
+        if ends_paragraph and pending and current_tokens >= target_tokens // 2:
+            yield _join(current)
+            current, current_tokens, pending = [], 0, False
+
+    if pending:
+        yield _join(current)
+
+
+def chunk_text(
+    text: str, target_tokens: int = 400, overlap_tokens: int = 50
+) -> List[str]:
+    """Split text into sentence-aligned chunks of about `target_tokens` tokens"""
+    return list(iter_chunks(text, target_tokens, overlap_tokens))
@@ -0,0 +1,81 @@
+from typing import List, Tuple
+
+import numpy as np
+
+
+class VectorIndex:
+    """Dense embedding index searched by batched cosine similarity.
+
+    Vectors are stored L2-normalized in one contiguous float32 matrix that
+    grows by doubling, so a search is a single matrix product over the live
+    rows followed by an `argpartition` top-k.
+    """
+
+    def __init__(self, dim: int, initial_capacity: int = 256):
+        self.dim = dim
+        self._matrix = np.zeros((initial_capacity, dim), dtype=np.float32)
+        self._count = 0
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray) -> "VectorIndex":
+        """Wrap existing normalized vectors (e.g. a read-only memory-mapped view).
+
+        The matrix is used as-is until the first `add()`, which copies it into
+        a new growable buffer.
+        """
+        index = cls.__new__(cls)
+        index.dim = matrix.shape[1]
+        index._matrix = matrix
+        index._count = matrix.shape[0]
+        return index
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """View of the live (normalized) vectors"""
+        return self._matrix[: self._count]
+
+    def add(self, vectors: np.ndarray) -> range:
+        """Append normalized vectors; returns the row ids assigned to them"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"Expected vectors of shape (n, {self.dim}), got {vectors.shape}"
+            )
+
+        needed = self._count + len(vectors)
+        if needed > len(self._matrix):
+            capacity = max(needed, len(self._matrix) * 2)
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+            grown[: self._count] = self._matrix[: self._count]
+            self._matrix = grown
+
+        start = self._count
+        self._matrix[start:needed] = vectors
+        self._count = needed
+        return range(start, needed)
+
+    def search(self, queries: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """Top-k (row id, cosine score) for each query row, best first"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self._count == 0 or k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        k = min(k, self._count)
+        scores = queries @ self.matrix.T  # (n_queries, n_rows)
+
+        if k < self._count:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(self._count), (len(queries), 1))
+
+        results = []
+        for row, candidates in enumerate(top):
+            candidate_scores = scores[row, candidates]
+            order = np.argsort(-candidate_scores)
+            results.append(
+                [(int(candidates[i]), float(candidate_scores[i])) for i in order]
+            )
+        return results
@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import pytest
+
+from ai_models.huggingface_client import HuggingFaceClient
+from config import settings
+from services.ai_service import AIService
+from services.batch_analysis import (
+    BatchInputError,
+    BatchTooLarge,
+    micro_batches,
+    parse_batch_items,
+)
+
+
+def test_json_array_items_keep_their_ids():
+    body = json.dumps(["halo", {"id": 7, "text": "barang rusak"}]).encode("utf-8")
+
+    assert parse_batch_items(body, "application/json", 10) == [
+        (None, "halo"),
+        (7, "barang rusak"),
+    ]
+
+
+def test_ndjson_items_and_line_numbers_in_errors():
+    body = b'"halo"\n\n{"id": "a", "text": "mantap"}\n'
+    assert parse_batch_items(body, "application/x-ndjson", 10) == [
+        (None, "halo"),
+        ("a", "mantap"),
+    ]
+
+    with pytest.raises(BatchInputError, match="line 2"):
+        parse_batch_items(b'"halo"\n{broken\n', "application/x-ndjson", 10)
+    with pytest.raises(BatchInputError, match="item 1"):
+        parse_batch_items(b'["halo", {"text": "  "}]', "application/json", 10)
+
+
+def test_batch_limits():
+    with pytest.raises(BatchTooLarge):
+        parse_batch_items(
+            json.dumps(["a", "b", "c"]).encode("utf-8"), "application/json", 2
+        )
+    with pytest.raises(BatchInputError):
+        parse_batch_items(b"[]", "application/json", 10)
+    with pytest.raises(BatchInputError):
+        parse_batch_items(b"\xff\xfe", "application/json", 10)
+
+
+def test_micro_batches_keep_order():
+    assert micro_batches(list(range(5)), 2) == [[0, 1], [2, 3], [4]]
+    assert micro_batches([1, 2], 0) == [[1], [2]]
+
+
+def client_returning(monkeypatch, result):
+    client = HuggingFaceClient()
+
+    async def query_model(model_name, payload):
+        return result
+
+    monkeypatch.setattr(client, "query_model", query_model)
+    return client
+
+
+def test_sentiment_batch_parses_one_result_per_text(monkeypatch):
+    client = client_returning(
+        monkeypatch,
+        [
+            [{"label": "5 stars", "score": 0.9}, {"label": "1 star", "score": 0.1}],
+            [{"label": "1 star", "score": 0.7}, {"label": "3 stars", "score": 0.3}],
+        ],
+    )
+
+    results = asyncio.run(client.analyze_sentiment_batch(["bagus", "jelek"]))["results"]
+
+    assert [r["sentiment"] for r in results] == ["positive", "negative"]
+    assert results[0]["confidence"] == 0.9
+
+
+def test_sentiment_batch_length_mismatch_is_an_error(monkeypatch):
+    client = client_returning(monkeypatch, [[{"label": "5 stars", "score": 0.9}]])
+
+    result = asyncio.run(client.analyze_sentiment_batch(["bagus", "jelek"]))
+
+    assert result["error"] == "Expected 2 results, got 1"
+
+
+def test_per_text_fallback_is_bounded(monkeypatch):
+    service = AIService()
+    for name in ("replicate", "huggingface", "ibm"):
+        service.router.register(name, False, prior_latency=1.0)
+    monkeypatch.setattr(settings, "batch_fallback_concurrency", 2)
+    running = {"now": 0, "peak": 0}
+
+    async def analyze_one(text):
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+        await asyncio.sleep(0.01)
+        running["now"] -= 1
+        return {"sentiment": "neutral", "confidence": 0.5, "text": text}
+
+    monkeypatch.setattr(service, "_analyze_sentiment_remote", analyze_one)
+
+    texts = [f"teks {i}" for i in range(10)]
+    results = asyncio.run(service._analyze_sentiment_batch_remote(texts))
+
+    assert [r["text"] for r in results] == texts
+    assert running["peak"] == 2
+    # Refusals stay with the batch operation, like the other AI operations
+    assert hasattr(AIService._analyze_sentiment_batch_remote, "__wrapped__")
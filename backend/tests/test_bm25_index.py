@@ -0,0 +1,48 @@
+from services.bm25_index import BM25Index
+from services.indonesian_text import tokenize
+
+DOCS = [
+    "Kaos polos hitam harga Rp 50.000, tersedia ukuran S sampai XL.",
+    "Jam buka toko setiap hari pukul 09.00 sampai 21.00.",
+    "Pengiriman ke luar kota memakai kurir JNE atau SiCepat.",
+    "Produk KP-250ML adalah kopi susu botol 250 ml.",
+]
+
+
+def build_index(docs=DOCS):
+    index = BM25Index()
+    for doc in docs:
+        index.add(tokenize(doc))
+    return index
+
+
+def test_bm25_ranks_the_matching_document_first():
+    index = build_index()
+
+    assert index.search(tokenize("jam buka toko"), 3)[0][0] == 1
+    assert index.search(tokenize("kurir pengiriman"), 3)[0][0] == 2
+
+
+def test_bm25_matches_codes_and_prices_exactly():
+    index = build_index()
+
+    assert index.search(tokenize("stok KP-250ML"), 1)[0][0] == 3
+    assert index.search(tokenize("yang 50.000"), 1)[0][0] == 0
+
+
+def test_bm25_skips_documents_without_query_terms():
+    index = build_index()
+
+    assert [doc_id for doc_id, _ in index.search(tokenize("kurir"), 10)] == [2]
+    assert index.search(tokenize("tidakadasamasekali"), 10) == []
+    assert BM25Index().search(["kaos"], 5) == []
+
+
+def test_bm25_rare_terms_weigh_more_and_long_documents_less():
+    index = build_index(["kopi susu", "kopi gula", "kopi " + "aren " * 20])
+
+    top = index.search(["kopi", "susu"], 3)
+    assert top[0][0] == 0
+    # "kopi" alone: the short document beats the long one
+    scores = dict(index.search(["kopi"], 3))
+    assert scores[1] > scores[2]
@@ -0,0 +1,208 @@
+import asyncio
+import time
+
+import pytest
+
+from services.bulkhead import (
+    Bulkhead,
+    ProviderOverloaded,
+    begin_request,
+    detached,
+    overload_scope,
+    parse_retry_after,
+    raise_if_overloaded,
+)
+
+
+class FakeResponse:
+    def __init__(self, status_code, retry_after=None):
+        self.status_code = status_code
+        self.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+
+
+def cooling_down(name="provider", seconds=60.0):
+    """Bulkhead told by its provider to back off longer than a call may wait"""
+    bulkhead = Bulkhead(name, queue_timeout=1.0)
+    bulkhead._cooldown_until = time.monotonic() + seconds
+    return bulkhead
+
+
+async def call(bulkhead):
+    async with bulkhead.slot("key"):
+        return "ok"
+
+
+def test_refusal_only_counts_for_its_own_operation():
+    refused = cooling_down()
+
+    @overload_scope
+    async def analysis():
+        try:
+            await call(refused)
+        except ProviderOverloaded:
+            pass
+        raise_if_overloaded()
+
+    @overload_scope
+    async def generation():
+        await asyncio.sleep(0.01)  # finishes after the analysis was refused
+        raise_if_overloaded()
+        return "generation failed for another reason"
+
+    async def request():
+        begin_request(30.0)
+        return await asyncio.gather(analysis(), generation(), return_exceptions=True)
+
+    analysis_result, generation_result = asyncio.run(request())
+
+    assert isinstance(analysis_result, ProviderOverloaded)
+    assert generation_result == "generation failed for another reason"
+
+
+def test_nested_operation_refusal_counts_for_outer():
+    refused = cooling_down()
+
+    @overload_scope
+    async def inner():
+        try:
+            await call(refused)
+        except ProviderOverloaded:
+            return None
+
+    @overload_scope
+    async def outer():
+        await inner()
+        raise_if_overloaded()
+
+    with pytest.raises(ProviderOverloaded) as refusal:
+        asyncio.run(outer())
+    assert refusal.value.retry_after >= 1.0
+
+
+def test_wait_timeout_refunds_rate_limit_token():
+    bulkhead = Bulkhead(
+        "provider",
+        max_concurrent=1,
+        queue_timeout=0.1,
+        rate_per_key=1.0,
+        burst_per_key=2,
+    )
+    bulkhead._avg_hold = 0.05  # expected wait fits the budget, so the caller queues
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def holder():
+            async with bulkhead.slot("key"):
+                await release.wait()
+
+        holding = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        with pytest.raises(ProviderOverloaded):
+            await call(bulkhead)
+        release.set()
+        await holding
+
+    asyncio.run(scenario())
+
+    bucket = bulkhead._bucket("key")
+    # Only the holder's token is spent (plus a little refill)
+    assert bucket.tokens > 0.9
+    assert bulkhead.stats["rejected"] == 1
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("2.5") == 2.5
+    assert parse_retry_after("-3") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    http_date = "Wed, 21 Oct 2015 07:28:00 GMT"  # in the past
+    assert parse_retry_after(http_date) == 0.0
+
+
+def test_full_queue_sheds_immediately():
+    bulkhead = Bulkhead("provider", max_concurrent=1, max_queue=1, queue_timeout=5.0)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def holder():
+            async with bulkhead.slot():
+                await release.wait()
+
+        holding = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(call(bulkhead))
+        await asyncio.sleep(0)
+
+        started = time.monotonic()
+        with pytest.raises(ProviderOverloaded) as refusal:
+            await call(bulkhead)
+        shed_after = time.monotonic() - started
+
+        release.set()
+        await holding
+        return shed_after, refusal.value, await queued
+
+    shed_after, refusal, queued_result = asyncio.run(scenario())
+
+    assert shed_after < 0.1
+    assert "queue full" in str(refusal)
+    assert refusal.retry_after >= 1.0
+    assert queued_result == "ok"
+    assert bulkhead.stats["queued"] == 1
+
+
+def test_retry_after_pauses_new_calls():
+    bulkhead = Bulkhead("provider", queue_timeout=1.0)
+
+    bulkhead.note_response(FakeResponse(200, "120"))
+    assert bulkhead.get_stats()["cooldown"] == 0.0
+
+    bulkhead.note_response(FakeResponse(503, "120"))
+    assert bulkhead.stats["throttled"] == 1
+    assert bulkhead.get_stats()["cooldown"] > 100
+
+    with pytest.raises(ProviderOverloaded) as refusal:
+        asyncio.run(call(bulkhead))
+    assert refusal.value.retry_after > 100
+
+
+def test_short_retry_after_is_waited_out():
+    bulkhead = Bulkhead("provider", queue_timeout=1.0)
+    bulkhead.note_response(FakeResponse(429, "0.05"))
+
+    started = time.monotonic()
+    assert asyncio.run(call(bulkhead)) == "ok"
+    assert time.monotonic() - started >= 0.04
+
+
+def test_request_deadline_bounds_the_wait():
+    bulkhead = Bulkhead("provider", queue_timeout=10.0)
+    bulkhead.note_response(FakeResponse(503, "2"))
+
+    async def request():
+        begin_request(0.5)  # less time left than the provider asked for
+        return await call(bulkhead)
+
+    with pytest.raises(ProviderOverloaded):
+        asyncio.run(request())
+
+
+def test_background_work_outlives_the_request_deadline():
+    bulkhead = Bulkhead("provider", queue_timeout=1.0)
+
+    async def later():
+        await asyncio.sleep(0.1)
+        return await call(bulkhead)
+
+    async def request():
+        begin_request(0.05)
+        inherited = asyncio.create_task(later())
+        background = asyncio.create_task(detached(later()))
+        return await asyncio.gather(inherited, background, return_exceptions=True)
+
+    inherited, background = asyncio.run(request())
+
+    assert isinstance(inherited, ProviderOverloaded)
+    assert background == "ok"
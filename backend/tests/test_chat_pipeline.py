@@ -0,0 +1,193 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+from config import settings
+from services.chat_pipeline import ChatPipeline
+from services.semantic_cache import semantic_cache
+
+ANSWER = "Toko buka setiap hari pukul 09.00 sampai 21.00."
+
+
+class AIService:
+    chat_model_signature = "test-model"
+
+    def __init__(self, delay=0.1, generation_delay=None):
+        self.delay = delay
+        self.generation_delay = delay if generation_delay is None else generation_delay
+        self.generated = 0
+        self.contexts = []
+
+    async def search_knowledge_base(self, message, chatbot_id, limit):
+        return [{"content": "Jam buka 09.00-21.00."}]
+
+    async def generate_chat_response(self, message, context, chatbot_id):
+        self.generated += 1
+        self.contexts.append(context)
+        await asyncio.sleep(self.generation_delay)
+        return {"response": ANSWER, "confidence": 0.9, "ai_provider": "Test"}
+
+    async def stream_chat_response(self, message, context, chatbot_id):
+        self.generated += 1
+        self.contexts.append(context)
+        for word in ANSWER.split(" "):
+            await asyncio.sleep(self.generation_delay / 10)
+            yield {"type": "token", "text": word + " "}
+        yield {
+            "type": "done",
+            "response": ANSWER,
+            "confidence": 0.9,
+            "ai_provider": "Test",
+        }
+
+    async def analyze_sentiment(self, message):
+        await asyncio.sleep(self.delay)
+        return {"sentiment": "positive", "confidence": 0.8}
+
+    async def detect_hoax(self, message):
+        await asyncio.sleep(self.delay)
+        return {"is_hoax": True, "confidence": 0.9}
+
+
+class KnowledgeCache:
+    def version(self, chatbot_id):
+        return 0
+
+
+class Database:
+    knowledge_cache = KnowledgeCache()
+
+
+class ConversationLogger:
+    def __init__(self):
+        self.logged = []
+
+    async def log_conversation(self, chatbot_id, message, response, metadata):
+        self.logged.append((chatbot_id, message, response, metadata))
+
+
+def make_pipeline(ai_service):
+    return ChatPipeline(ai_service, Database(), ConversationLogger())
+
+
+def new_chatbot():
+    return f"bot-{uuid.uuid4()}"
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+def test_analysis_runs_alongside_generation():
+    ai_service = AIService(delay=0.1)
+    pipeline = make_pipeline(ai_service)
+
+    started = time.perf_counter()
+    result = asyncio.run(
+        pipeline.run("jam buka? klik http://promo.example", new_chatbot())
+    )
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.25  # generation, sentiment and hoax each take 0.1s
+    assert result["response"] == ANSWER
+    assert result["sentiment"] == "positive"
+    assert result["is_hoax_detected"] is True
+    assert set(result["stage_timings"]) >= {
+        "knowledge",
+        "generation",
+        "sentiment",
+        "hoax",
+    }
+    assert pipeline.conversation_logger.logged[0][2] == ANSWER
+
+
+def test_slow_analysis_only_degrades_its_own_stage(monkeypatch):
+    monkeypatch.setattr(settings, "chat_analysis_timeout", 0.05)
+    pipeline = make_pipeline(AIService(delay=0.5, generation_delay=0.01))
+
+    result = asyncio.run(pipeline.run("jam buka toko?", new_chatbot()))
+
+    assert result["response"] == ANSWER
+    assert result["sentiment"] == "neutral"
+
+
+def test_generation_deadline_returns_the_timeout_answer(monkeypatch):
+    monkeypatch.setattr(settings, "chat_generation_timeout", 0.05)
+    ai_service = AIService(delay=0.01, generation_delay=0.5)
+
+    result = asyncio.run(make_pipeline(ai_service).run("jam buka toko?", new_chatbot()))
+    events = asyncio.run(
+        collect(make_pipeline(ai_service).stream("jam buka toko?", new_chatbot()))
+    )
+
+    assert result["confidence"] == 0.0
+    assert "terlalu lama" in result["response"]
+    assert "terlalu lama" in events[-1]["data"]["response"]
+
+
+@pytest.mark.parametrize("first", ["run", "stream"])
+def test_chat_and_stream_share_the_answer_caches(first):
+    ai_service = AIService(delay=0.01)
+    pipeline = make_pipeline(ai_service)
+    chatbot_id = new_chatbot()
+
+    async def ask(mode, message):
+        if mode == "run":
+            return (await pipeline.run(message, chatbot_id))["response"]
+        events = await collect(pipeline.stream(message, chatbot_id))
+        return events[-1]["data"]["response"]
+
+    second = "stream" if first == "run" else "run"
+    answers = [
+        asyncio.run(ask(first, "jam berapa toko buka?")),
+        asyncio.run(ask(second, "jam berapa toko buka?")),  # exact repeat
+        asyncio.run(ask(second, "toko buka jam berapa?")),  # rephrasing
+    ]
+
+    assert [answer.strip() for answer in answers] == [ANSWER] * 3
+    assert ai_service.generated == 1
+    assert ai_service.contexts == ["Jam buka 09.00-21.00."]
+
+
+def test_slow_semantic_lookup_counts_as_a_miss(monkeypatch):
+    monkeypatch.setattr(settings, "semantic_cache_timeout", 0.05)
+
+    async def slow_lookup(chatbot_id, message, version=0):
+        await asyncio.sleep(1.0)
+
+    monkeypatch.setattr(semantic_cache, "lookup", slow_lookup)
+    ai_service = AIService(delay=0.01)
+
+    started = time.perf_counter()
+    result = asyncio.run(make_pipeline(ai_service).run("jam buka toko?", new_chatbot()))
+
+    assert time.perf_counter() - started < 0.5
+    assert result["response"] == ANSWER
+    assert ai_service.generated == 1
+
+
+class SharedDatabase(Database):
+    """Knowledge stamp as every worker reads it from Supabase"""
+
+    def __init__(self):
+        self.stamp = "0:1:2024-01-01T00:00:00"
+
+    async def get_knowledge_stamp(self, chatbot_id):
+        return self.stamp
+
+
+def test_knowledge_added_by_another_worker_retires_rephrasing_hits():
+    ai_service = AIService(delay=0.01)
+    database = SharedDatabase()
+    pipeline = ChatPipeline(ai_service, database, ConversationLogger())
+    chatbot_id = new_chatbot()
+
+    asyncio.run(pipeline.run("jam berapa toko buka?", chatbot_id))
+    asyncio.run(pipeline.run("toko buka jam berapa?", chatbot_id))
+    assert ai_service.generated == 1
+
+    database.stamp = "0:2:2024-02-01T00:00:00"  # a row inserted through another worker
+    asyncio.run(pipeline.run("buka jam berapa tokonya?", chatbot_id))
+    assert ai_service.generated == 2
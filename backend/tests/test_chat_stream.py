@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from ai_models.sse import iter_sse_events
+
+
+async def parse(body: bytes):
+    return [event async for event in iter_sse_events(httpx.Response(200, content=body))]
+
+
+class Pipeline:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    async def stream(self, message, chatbot_id):
+        yield {"event": "token", "data": {"text": "Harga "}}
+        yield {"event": "token", "data": {"text": "Rp 50.000\n\nukuran: M–XL"}}
+        if self.fail:
+            raise RuntimeError("provider exploded")
+        yield {"event": "metadata", "data": {"confidence": 0.9, "sentiment": "neutral"}}
+        yield {"event": "done", "data": {"response": "Harga Rp 50.000\n\nukuran: M–XL"}}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    def make(fail=False):
+        monkeypatch.setattr(main, "chat_pipeline", Pipeline(fail))
+        return TestClient(main.app)
+
+    return make
+
+
+def post_stream(client):
+    return client.post(
+        "/chat/stream", json={"message": "harga kaos?", "chatbot_id": "bot-1"}
+    )
+
+
+def test_stream_frames_one_event_per_pipeline_event(client):
+    response = post_stream(client())
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.headers["x-accel-buffering"] == "no"
+
+    # Every event is exactly two lines plus the blank separator, even when
+    # the text itself contains newlines
+    frames = response.text.split("\n\n")
+    assert frames[-1] == ""
+    assert [frame.split("\n")[0] for frame in frames[:-1]] == [
+        "event: token",
+        "event: token",
+        "event: metadata",
+        "event: done",
+    ]
+    assert all(len(frame.split("\n")) == 2 for frame in frames[:-1])
+
+    events = asyncio.run(parse(response.content))
+    assert [event for event, _ in events] == ["token", "token", "metadata", "done"]
+    tokens = "".join(
+        json.loads(data)["text"] for event, data in events if event == "token"
+    )
+    assert (
+        tokens
+        == json.loads(events[-1][1])["response"]
+        == "Harga Rp 50.000\n\nukuran: M–XL"
+    )
+
+
+def test_stream_failure_ends_with_an_error_event(client):
+    response = post_stream(client(fail=True))
+
+    events = asyncio.run(parse(response.content))
+    assert [event for event, _ in events] == ["token", "token", "error"]
+    assert "kesalahan" in json.loads(events[-1][1])["response"]
+
+
+def test_sse_parser_handles_comments_multiline_data_and_a_missing_final_blank_line():
+    body = b": keep-alive\n\ndata: first\ndata: second\n\nevent: done\ndata:{}"
+
+    assert asyncio.run(parse(body)) == [("message", "first\nsecond"), ("done", "{}")]
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from services.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+
+def tripped(**kwargs):
+    breaker = CircuitBreaker("provider", failure_threshold=3, **kwargs)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    return breaker
+
+
+def expire_recovery(breaker):
+    breaker._opened_at -= breaker.recovery_timeout
+
+
+def test_consecutive_failures_open_the_circuit():
+    breaker = CircuitBreaker("provider", failure_threshold=3)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # resets the streak
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.trips == 1
+
+
+def test_open_circuit_rejects_until_recovery_timeout():
+    breaker = tripped(recovery_timeout=30.0)
+
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+    assert breaker.get_status()["retry_in"] > 0
+
+    expire_recovery(breaker)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+
+
+def test_half_open_limits_concurrent_probes():
+    breaker = tripped(half_open_max_calls=1)
+    expire_recovery(breaker)
+
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.release()  # probe cancelled without a verdict
+    assert breaker.allow()
+
+
+def test_successful_probes_close_the_circuit():
+    breaker = tripped(half_open_max_calls=2, success_threshold=2)
+    expire_recovery(breaker)
+
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.consecutive_failures == 0
+
+
+def test_failed_probe_reopens_the_circuit():
+    breaker = tripped()
+    expire_recovery(breaker)
+
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.trips == 2
+    assert not breaker.allow()
+
+
+def test_guard_records_outcomes_and_raises_when_open():
+    breaker = CircuitBreaker("provider", failure_threshold=1)
+
+    async def failing_call():
+        async with breaker.guard():
+            raise ValueError("provider error")
+
+    async def any_call():
+        async with breaker.guard():
+            return "ok"
+
+    with pytest.raises(ValueError):
+        asyncio.run(failing_call())
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(any_call())
+
+
+def test_guard_releases_probe_on_cancellation():
+    breaker = tripped()
+    expire_recovery(breaker)
+
+    async def cancelled_probe():
+        async with breaker.guard():
+            raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancelled_probe())
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
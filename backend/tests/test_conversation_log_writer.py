@@ -0,0 +1,125 @@
+import asyncio
+
+from services.conversation_log_writer import ConversationLogWriter
+
+
+class Database:
+    def __init__(self, failures=0, delay=0.0):
+        self.batches = []
+        self.failures = failures
+        self.delay = delay
+
+    def build_conversation_row(self, chatbot_id, user_message, bot_response, metadata):
+        return {
+            "chatbot_id": chatbot_id,
+            "user_message": user_message,
+            "bot_response": bot_response,
+        }
+
+    async def log_conversations_bulk(self, rows):
+        await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            return {"success": False, "error": "insert failed"}
+        self.batches.append(list(rows))
+        return {"success": True}
+
+
+async def log(writer, count, start=0):
+    await asyncio.gather(
+        *[
+            writer.log_conversation("bot-1", f"pesan {i}", "jawaban")
+            for i in range(start, start + count)
+        ]
+    )
+
+
+def test_full_batches_flush_without_waiting_for_the_interval():
+    database = Database()
+    writer = ConversationLogWriter(database, batch_size=3, flush_interval=60.0)
+
+    async def scenario():
+        await writer.start()
+        await log(writer, 6)
+        for _ in range(100):
+            if len(database.batches) == 2:
+                break
+            await asyncio.sleep(0.01)
+        flushed = [len(batch) for batch in database.batches]
+        await writer.stop()
+        return flushed
+
+    assert asyncio.run(scenario()) == [3, 3]
+    assert writer.stats["direct_writes"] == 0
+
+
+def test_partial_batch_flushes_after_the_interval():
+    database = Database()
+    writer = ConversationLogWriter(database, batch_size=100, flush_interval=0.05)
+
+    async def scenario():
+        await writer.start()
+        await log(writer, 2)
+        await asyncio.sleep(0.2)
+        flushed = list(database.batches)
+        await writer.stop()
+        return flushed
+
+    assert [len(batch) for batch in asyncio.run(scenario())] == [2]
+
+
+def test_shutdown_drains_everything_still_queued():
+    database = Database()
+    writer = ConversationLogWriter(database, batch_size=4, flush_interval=60.0)
+
+    async def scenario():
+        await writer.start()
+        await log(writer, 10)
+        await writer.stop()
+
+    asyncio.run(scenario())
+
+    messages = [row["user_message"] for batch in database.batches for row in batch]
+    assert sorted(messages) == sorted(f"pesan {i}" for i in range(10))
+    assert all(len(batch) <= 4 for batch in database.batches)
+    assert writer.stats["flushed"] == 10
+    assert not writer.running
+
+
+def test_rows_are_written_directly_when_not_running_or_when_the_queue_is_full():
+    database = Database(delay=0.2)
+    writer = ConversationLogWriter(
+        database,
+        max_queue_size=1,
+        batch_size=1,
+        flush_interval=60.0,
+        enqueue_timeout=0.01,
+    )
+
+    asyncio.run(log(writer, 1))
+    assert writer.stats["direct_writes"] == 1
+
+    async def scenario():
+        await writer.start()
+        await log(writer, 4, start=1)  # the flusher is busy with a slow insert
+        await writer.stop()
+
+    asyncio.run(scenario())
+
+    assert writer.stats["direct_writes"] > 1
+    assert writer.stats["flushed"] == 5
+
+
+def test_failed_insert_is_retried_once():
+    database = Database(failures=1)
+    writer = ConversationLogWriter(database, batch_size=2, flush_interval=60.0)
+
+    async def scenario():
+        await writer.start()
+        await log(writer, 2)
+        await writer.stop()
+
+    asyncio.run(scenario())
+
+    assert writer.stats["flushed"] == 2
+    assert writer.stats["failed"] == 0
@@ -0,0 +1,156 @@
+import asyncio
+import time
+
+from services.counter_aggregator import CounterAggregator
+from services.supabase_service import SupabaseService
+
+
+class Query:
+    def __init__(self, client, action, payload=None):
+        self.client = client
+        self.action = action
+        self.payload = payload
+
+    def eq(self, column, value):
+        return self
+
+    def execute(self):
+        row = self.client.chatbots["bot-1"]
+        if self.action == "select":
+            time.sleep(0.01)  # wide read-modify-write window
+            return type(
+                "Response",
+                (),
+                {"data": [{column: row[column] for column in self.payload.split(",")}]},
+            )
+        row.update(self.payload)
+        return type("Response", (), {"data": [row]})
+
+
+class Table:
+    def __init__(self, client):
+        self.client = client
+
+    def select(self, columns):
+        return Query(self.client, "select", columns)
+
+    def update(self, updates):
+        return Query(self.client, "update", updates)
+
+
+class RPC:
+    def __init__(self, client, params):
+        self.client = client
+        self.params = params
+
+    def execute(self):
+        self.client.rpc_calls.append(self.params)
+        if self.client.rpc_error:
+            raise Exception(self.client.rpc_error)
+
+
+class Client:
+    """Just enough of the Supabase client for the counter paths"""
+
+    def __init__(self, rpc_error=None):
+        self.chatbots = {"bot-1": {"total_conversations": 5, "knowledge_base_size": 2}}
+        self.rpc_error = rpc_error
+        self.rpc_calls = []
+
+    def table(self, name):
+        return Table(self)
+
+    def rpc(self, name, params):
+        return RPC(self, params)
+
+
+def make_service(rpc_error=None):
+    service = SupabaseService()
+    service.supabase = service.admin_client = Client(rpc_error)
+    return service
+
+
+def test_counters_use_the_atomic_rpc():
+    service = make_service()
+
+    result = asyncio.run(
+        service.apply_counter_deltas("bot-1", {"total_conversations": 3})
+    )
+
+    assert result["success"]
+    assert service.admin_client.rpc_calls == [
+        {"p_chatbot_id": "bot-1", "p_conversations": 3, "p_knowledge_items": 0}
+    ]
+
+
+def test_missing_rpc_falls_back_to_a_serialized_read_modify_write():
+    service = make_service(
+        "Could not find the function public.increment_chatbot_counters (PGRST202)"
+    )
+
+    async def scenario():
+        await asyncio.gather(
+            *[
+                service.apply_counter_deltas("bot-1", {"total_conversations": 1})
+                for _ in range(10)
+            ]
+        )
+        attempts = len(service.admin_client.rpc_calls)
+        await service.apply_counter_deltas("bot-1", {"knowledge_base_size": -5})
+        return attempts
+
+    attempts = asyncio.run(scenario())
+
+    assert service.supabase.chatbots["bot-1"] == {
+        "total_conversations": 15,
+        "knowledge_base_size": 0,
+    }
+    assert (
+        len(service.admin_client.rpc_calls) == attempts
+    )  # not retried once known missing
+
+
+def test_other_rpc_errors_fail_without_disabling_the_rpc():
+    service = make_service("connection reset")
+
+    result = asyncio.run(
+        service.apply_counter_deltas("bot-1", {"total_conversations": 1})
+    )
+
+    assert not result["success"]
+    assert service._counter_rpc_available
+    assert service.supabase.chatbots["bot-1"]["total_conversations"] == 5
+
+
+class Database:
+    def __init__(self, fail=False):
+        self.applied = []
+        self.fail = fail
+
+    async def apply_counter_deltas(self, chatbot_id, deltas):
+        if self.fail:
+            return {"success": False, "error": "database down"}
+        self.applied.append((chatbot_id, deltas))
+        return {"success": True}
+
+
+def test_aggregator_sends_one_update_per_chatbot_and_keeps_failed_deltas():
+    database = Database(fail=True)
+    counters = CounterAggregator(database)
+    for _ in range(3):
+        counters.add("bot-1", "total_conversations")
+    counters.add("bot-1", "knowledge_base_size", 2)
+    counters.add("bot-2", "knowledge_base_size", 1)
+    counters.add("bot-2", "knowledge_base_size", -1)
+
+    asyncio.run(counters.flush())
+    assert counters.pending("bot-1", "total_conversations") == 3
+    assert counters.stats["failed_flushes"] == 1
+
+    database.fail = False
+    asyncio.run(counters.stop())
+
+    assert database.applied == [
+        ("bot-1", {"total_conversations": 3, "knowledge_base_size": 2})
+    ]
+    assert counters.pending("bot-1", "total_conversations") == 0
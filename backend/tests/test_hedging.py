@@ -0,0 +1,99 @@
+import asyncio
+
+from services.hedging import Hedger
+
+
+def answer(value, delay=0.0, error=None, started=None):
+    async def attempt():
+        if started is not None:
+            started.append(value)
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return value
+
+    return attempt
+
+
+def test_failed_attempts_fall_back_in_order_without_hedging():
+    hedger = Hedger(enabled=False)
+    started = []
+
+    result = asyncio.run(
+        hedger.run(
+            [
+                ("replicate", answer("a", 0.05, RuntimeError("boom"), started)),
+                ("huggingface", answer(None, started=started)),  # rejected by is_good
+                ("ibm", answer("c", started=started)),
+            ]
+        )
+    )
+
+    assert result == ("ibm", "c")
+    assert started == ["a", None, "c"]
+    assert hedger.stats["hedged"] == 0
+
+
+def test_every_attempt_failing_returns_none():
+    hedger = Hedger()
+
+    assert (
+        asyncio.run(
+            hedger.run([("replicate", answer("a", error=RuntimeError("boom")))])
+        )
+        is None
+    )
+
+
+def test_slow_attempt_is_hedged_and_the_loser_cancelled():
+    hedger = Hedger(enabled=True, initial_delay=0.05)
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(1.0)
+        except asyncio.CancelledError:
+            cancelled.append("replicate")
+            raise
+
+    result = asyncio.run(
+        hedger.run([("replicate", slow), ("huggingface", answer("b", 0.01))])
+    )
+
+    assert result == ("huggingface", "b")
+    assert cancelled == ["replicate"]
+    assert hedger.stats["hedged"] == hedger.stats["hedge_wins"] == 1
+    assert hedger.stats["cancelled"] == 1
+
+
+def test_hedge_budget_limits_extra_requests():
+    hedger = Hedger(enabled=True, initial_delay=0.01, budget_ratio=0.25)
+    started = []
+
+    async def scenario():
+        for _ in range(8):
+            await hedger.run(
+                [
+                    ("replicate", answer("a", 0.05, started=started)),
+                    ("huggingface", answer("b", 0.05, started=started)),
+                ]
+            )
+
+    asyncio.run(scenario())
+
+    # One hedge up front, then at most a quarter of the runs
+    assert hedger.stats["hedged"] <= 0.25 * hedger.stats["runs"] + 1
+    assert hedger.stats["hedged"] < 8
+    assert hedger.stats["budget_exhausted"] > 0
+    assert started.count("b") == hedger.stats["hedged"]
+
+
+def test_hedge_delay_tracks_the_latency_percentile():
+    hedger = Hedger(percentile=90.0, min_samples=10, initial_delay=8.0)
+    assert hedger.delay("replicate") == 8.0
+
+    for latency in range(1, 11):
+        hedger.record("replicate", latency / 10)
+
+    assert hedger.delay("replicate") == 1.0
+    assert hedger.get_stats()["delays"] == {"replicate": 1.0}
@@ -0,0 +1,65 @@
+import asyncio
+
+from ai_models.huggingface_client import HuggingFaceClient
+from services.batch_analysis import parse_batch_items
+from services.hoax_screening import zero_shot_verdict
+
+WHATSAPP_EXPORT = """\
+31/12/23 21.41 - Budi: Selamat tahun baru semua!
+31/12/23 21.42 - Sari: Promo terbatas, klik link ini
+untuk hadiah gratis
+31/12/23 21.43 - Andi joined using this group's invite link
+31/12/23 21.44 - Andi: <Media omitted>
+[01/01/24 08.00.05] Budi: Pagi!
+"""
+
+
+def test_whatsapp_export():
+    items = parse_batch_items(WHATSAPP_EXPORT.encode("utf-8"), "text/plain", 10)
+
+    assert [text for _, text in items] == [
+        "Selamat tahun baru semua!",
+        "Promo terbatas, klik link ini\nuntuk hadiah gratis",
+        "Pagi!",
+    ]
+    assert items[0][0] == {"timestamp": "31/12/23 21.41", "sender": "Budi"}
+
+
+def client_returning(monkeypatch, result):
+    client = HuggingFaceClient()
+
+    async def query_model(model_name, payload):
+        return result
+
+    monkeypatch.setattr(client, "query_model", query_model)
+    return client
+
+
+def test_hoax_batch_parses_zero_shot_results(monkeypatch):
+    client = client_returning(
+        monkeypatch,
+        [
+            {"labels": ["hoax", "factual"], "scores": [0.8, 0.2]},
+            {"labels": ["factual", "hoax"], "scores": [0.9, 0.1]},
+        ],
+    )
+
+    results = asyncio.run(client.detect_hoax_batch(["a", "b"]))["results"]
+
+    assert [r["is_hoax"] for r in results] == [True, False]
+    assert results[0]["confidence"] == 0.8
+
+
+def test_single_zero_shot_dict_counts_as_one_result(monkeypatch):
+    client = client_returning(monkeypatch, {"labels": ["hoax"], "scores": [0.7]})
+
+    results = asyncio.run(client.detect_hoax_batch(["a"]))["results"]
+
+    assert results[0]["is_hoax"] is True
+
+
+def test_malformed_zero_shot_result_is_unsure():
+    verdict = zero_shot_verdict({"error": "Model is loading"})
+
+    assert verdict["is_hoax"] is False
+    assert verdict["confidence"] == 0.5
@@ -0,0 +1,60 @@
+import asyncio
+
+from ai_models.http_transport import HTTPTransport
+
+
+def test_each_provider_reuses_one_pool_per_event_loop():
+    transport = HTTPTransport(connect_timeout=2.0, read_timeout=30.0, max_connections=7)
+
+    async def scenario():
+        first = transport.client("replicate")
+        reused = []
+        for _ in range(3):
+            await asyncio.sleep(0)
+            reused.append(transport.client("replicate"))
+        return first, reused, transport.client("ibm")
+
+    replicate, reused, ibm = asyncio.run(scenario())
+
+    assert all(client is replicate for client in reused)
+    assert ibm is not replicate
+    assert replicate.timeout.connect == 2.0
+    assert replicate.timeout.read == 30.0
+    assert transport.get_stats()["pools"] == ["ibm", "replicate"]
+    assert transport.get_stats()["max_connections"] == 7
+
+
+def test_pool_is_rebuilt_for_a_new_event_loop_or_after_closing():
+    transport = HTTPTransport()
+
+    async def open_pool():
+        return transport.client("huggingface")
+
+    first = asyncio.run(open_pool())
+    second = asyncio.run(open_pool())
+    assert second is not first
+
+    async def close_and_reopen():
+        client = transport.client("huggingface")
+        await client.aclose()
+        return client, transport.client("huggingface")
+
+    closed, reopened = asyncio.run(close_and_reopen())
+    assert reopened is not closed
+
+
+def test_close_shuts_every_pool():
+    transport = HTTPTransport()
+
+    async def scenario():
+        clients = [
+            transport.client(provider)
+            for provider in ("replicate", "huggingface", "ibm")
+        ]
+        await transport.close()
+        return clients
+
+    clients = asyncio.run(scenario())
+
+    assert all(client.is_closed for client in clients)
+    assert transport.get_stats()["pools"] == []
@@ -0,0 +1,51 @@
+import asyncio
+import gc
+import time
+
+from ai_models.ibm_token_manager import IAMTokenManager
+
+
+def test_background_refresh_failure_is_counted(monkeypatch, caplog):
+    manager = IAMTokenManager("api-key", refresh_margin=300.0)
+
+    async def missing_access_token():
+        raise KeyError("access_token")
+
+    monkeypatch.setattr(manager, "_fetch", missing_access_token)
+
+    async def scenario():
+        # Valid, but inside the refresh margin: served while refreshing behind the caller
+        manager._token = "old-token"
+        manager._expires_at = time.time() + 60
+        token = await manager.get_token()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return token
+
+    assert asyncio.run(scenario()) == "old-token"
+    gc.collect()
+
+    assert manager.stats["failures"] == 1
+    assert "Error getting IBM access token" in caplog.text
+    assert "exception was never retrieved" not in caplog.text
+
+
+def test_concurrent_refreshes_share_one_request(monkeypatch):
+    manager = IAMTokenManager("api-key")
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        await asyncio.sleep(0.01)
+        manager._token = "new-token"
+        manager._expires_at = time.time() + 3600
+        return manager._token
+
+    monkeypatch.setattr(manager, "_fetch", fetch)
+
+    async def scenario():
+        return await asyncio.gather(*(manager.get_token() for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["new-token"] * 5
+    assert len(fetches) == 1
+    assert manager.stats["coalesced"] == 4
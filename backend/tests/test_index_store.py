@@ -0,0 +1,109 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from services.embeddings import HashingEmbedder
+from services.index_store import KnowledgeIndexStore
+from services.knowledge_index import ChatbotIndex, KnowledgeIndexManager
+
+ROWS = [
+    {"id": "1", "content": "Jam buka toko pukul 09.00 sampai 21.00.", "source": "faq"},
+    {"id": "2", "content": "Kaos polos hitam harga Rp 50.000.", "source": "katalog"},
+    {
+        "id": "3",
+        "content": "Produk KP-250ML adalah kopi susu botol.",
+        "source": "katalog",
+    },
+]
+
+
+class KnowledgeCache:
+    def __init__(self):
+        self.versions = {}
+
+    def version(self, chatbot_id):
+        return self.versions.get(chatbot_id, 0)
+
+
+class Database:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.knowledge_cache = KnowledgeCache()
+        self.fetches = 0
+
+    async def get_knowledge_base(self, chatbot_id):
+        self.fetches += 1
+        return {"success": True, "data": list(self.rows)}
+
+
+class SlowEmbedder(HashingEmbedder):
+    """Local embedder that takes `delay` seconds per batch"""
+
+    def __init__(self, delay):
+        super().__init__(dim=64)
+        self.delay = delay
+        self.batches = 0
+
+    async def embed(self, texts):
+        await asyncio.sleep(self.delay)
+        self.batches += 1
+        return self.embed_sync(texts)
+
+
+def test_index_file_round_trip(tmp_path):
+    async def build():
+        manager = KnowledgeIndexManager(Database(ROWS), HashingEmbedder(dim=64))
+        return await manager.sync("bot")
+
+    index = asyncio.run(build())
+    store = KnowledgeIndexStore(str(tmp_path))
+    store.save("bot", index)
+
+    snapshot = store.load("bot")
+    mapped = ChatbotIndex.from_snapshot(snapshot)
+
+    assert snapshot.embedder_name == index.embedder_name
+    assert mapped.item_ids == {"1", "2", "3"}
+    assert [mapped.chunks[i] for i in range(len(mapped.chunks))] == index.chunks
+    np.testing.assert_array_equal(mapped.vectors.matrix, index.vectors.matrix)
+    assert mapped.lexical.search(["kaos"], 3) == index.lexical.search(["kaos"], 3)
+
+    # Copy on write: a new chunk leaves the mapped file untouched
+    mapped.vectors.add(HashingEmbedder(dim=64).embed_sync(["baru"]))
+    mapped.lexical.add(["kaos", "baru"])
+    mapped.chunks.append({"chunk_id": "4:0", "item_id": "4", "content": "kaos baru"})
+    assert len(mapped.chunks) == 4
+    assert len(store.load("bot").chunks) == 3
+
+
+def test_missing_or_foreign_index_file_is_ignored(tmp_path):
+    store = KnowledgeIndexStore(str(tmp_path))
+    assert store.load("nobody") is None
+
+    (tmp_path / "bot.idx").write_bytes(b"not an index file at all")
+    assert store.load("bot") is None
+
+
+def test_persisted_index_is_mapped_by_a_new_worker(tmp_path):
+    store = KnowledgeIndexStore(str(tmp_path))
+    embedder = HashingEmbedder(dim=64)
+
+    async def first_worker():
+        manager = KnowledgeIndexManager(Database(ROWS), embedder, store=store)
+        await manager.sync("bot")
+        await manager.wait_for_background_tasks()
+
+    async def second_worker():
+        manager = KnowledgeIndexManager(
+            Database(ROWS), SlowEmbedder(delay=0.05), store=store
+        )
+        manager.embedder.name = embedder.name
+        index = await manager.sync("bot")
+        return index, manager.embedder.batches
+
+    asyncio.run(first_worker())
+    index, batches = asyncio.run(second_worker())
+
+    assert len(index.chunks) == 3
+    assert batches == 0  # every chunk came from the file
@@ -0,0 +1,204 @@
+import asyncio
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from services.ingestion import IngestionJob, IngestionManager, ReceivedUpload
+from services.supabase_service import supabase_service
+
+TEXT = "Jam buka toko pukul 09.00 sampai 21.00.\n\nKaos polos hitam harga Rp 50.000.\n"
+
+
+class Database:
+    """file_uploads and knowledge_base tables shared by every worker"""
+
+    def __init__(self, fail_inserts=False):
+        self.uploads = {}
+        self.items = []
+        self.fail_inserts = fail_inserts
+
+    async def create_file_upload(self, row):
+        self.uploads[row["id"]] = dict(row)
+        return {"success": True, "data": row}
+
+    async def update_file_upload(self, upload_id, updates):
+        self.uploads[upload_id].update(updates)
+        return {"success": True}
+
+    async def get_file_upload(self, upload_id):
+        if upload_id not in self.uploads:
+            return {"success": False, "error": "File upload not found"}
+        return {"success": True, "data": dict(self.uploads[upload_id])}
+
+    async def add_knowledge_items(self, chatbot_id, items):
+        if self.fail_inserts:
+            return {"success": False, "error": "insert failed"}
+        self.items.extend(items)
+        return {"success": True, "data": items}
+
+
+class IndexManager:
+    async def get_index(self, chatbot_id):
+        return None
+
+    async def add_rows(self, chatbot_id, rows):
+        pass
+
+    async def sync(self, chatbot_id):
+        pass
+
+
+def upload(text=TEXT, filename="faq.txt"):
+    data = text.encode("utf-8")
+    return ReceivedUpload(filename, io.BytesIO(data), len(data))
+
+
+def run_job(manager, chatbot_id="bot-1"):
+    async def scenario():
+        job = await manager.submit(chatbot_id, "user-1", upload())
+        await asyncio.gather(*list(manager._tasks.values()))
+        return job
+
+    return asyncio.run(scenario())
+
+
+def test_job_status_is_visible_to_other_workers():
+    database = Database()
+    job = run_job(IngestionManager(database, IndexManager(), batch_size=1))
+
+    other_worker = IngestionManager(database, IndexManager())
+    polled = asyncio.run(other_worker.get_job(job.id))
+
+    assert polled.status == "completed"
+    assert polled.chunks_created == job.chunks_created == len(database.items) > 0
+    assert polled.finished_at is not None
+    assert database.uploads[job.id]["user_id"] == "user-1"
+    assert asyncio.run(other_worker.get_job("unknown")) is None
+
+
+def test_failed_job_records_its_error():
+    database = Database(fail_inserts=True)
+    job = run_job(IngestionManager(database, IndexManager()))
+
+    row = database.uploads[job.id]
+    assert row["processing_status"] == "failed"
+    assert row["error"] == "insert failed"
+
+
+@pytest.fixture
+def api(monkeypatch):
+    calls = {"submitted": [], "items": [], "jobs": {}}
+
+    async def get_token_user(access_token):
+        if access_token != "valid-token":
+            return {"success": False, "error": "Invalid token"}
+        return {"success": True, "user": {"id": "user-1", "email": "a@example.com"}}
+
+    async def is_chatbot_owner(chatbot_id, user_id):
+        return (chatbot_id, user_id) == ("bot-1", "user-1")
+
+    async def add_knowledge_item(chatbot_id, content, source=None, category=None):
+        calls["items"].append(chatbot_id)
+        return {"success": True, "data": {"id": "item-1", "content": content}}
+
+    class Manager:
+        async def submit(self, chatbot_id, user_id, received):
+            calls["submitted"].append((chatbot_id, user_id, received.file.read()))
+            received.file.close()
+            job = IngestionJob(
+                chatbot_id,
+                user_id,
+                received.filename,
+                received.file_type,
+                received.size,
+            )
+            calls["jobs"][job.id] = job
+            return job
+
+        async def get_job(self, job_id):
+            return calls["jobs"].get(job_id)
+
+    monkeypatch.setattr(supabase_service, "get_token_user", get_token_user)
+    monkeypatch.setattr(supabase_service, "is_chatbot_owner", is_chatbot_owner)
+    monkeypatch.setattr(supabase_service, "add_knowledge_item", add_knowledge_item)
+    monkeypatch.setattr(
+        main.knowledge_index, "schedule_refresh", lambda chatbot_id: None
+    )
+    monkeypatch.setattr(main, "ingestion_manager", Manager())
+    return TestClient(main.app), calls
+
+
+def post_file(
+    client, chatbot_id="bot-1", token="valid-token", filename="faq.txt", data=b"halo"
+):
+    return client.post(
+        f"/chatbots/{chatbot_id}/knowledge/upload",
+        files={"file": (filename, data, "text/plain")},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+
+
+def test_upload_is_accepted_for_the_owner(api):
+    client, calls = api
+
+    response = post_file(client)
+
+    assert response.status_code == 202
+    body = response.json()
+    assert body["status"] == "pending"
+    assert body["status_url"] == f"/chatbots/bot-1/knowledge/jobs/{body['job_id']}"
+    assert calls["submitted"] == [("bot-1", "user-1", b"halo")]
+
+    polled = client.get(
+        body["status_url"], headers={"Authorization": "Bearer valid-token"}
+    )
+    assert polled.status_code == 200
+    assert polled.json()["filename"] == "faq.txt"
+    missing = client.get(
+        "/chatbots/bot-1/knowledge/jobs/unknown",
+        headers={"Authorization": "Bearer valid-token"},
+    )
+    assert missing.status_code == 404
+
+
+def test_unverified_token_or_foreign_chatbot_writes_nothing(api):
+    client, calls = api
+
+    assert post_file(client, token="forged-token").status_code == 401
+    assert post_file(client, chatbot_id="bot-2").status_code == 404
+    response = client.post(
+        "/chatbots/bot-2/knowledge",
+        json={"content": "Jam buka toko"},
+        headers={"Authorization": "Bearer valid-token"},
+    )
+    assert response.status_code == 404
+    assert client.post(
+        "/chatbots/bot-1/knowledge", json={"content": "x"}
+    ).status_code in (401, 403)
+
+    assert calls["submitted"] == []
+    assert calls["items"] == []
+
+
+def test_owner_can_add_a_knowledge_item(api):
+    client, calls = api
+
+    response = client.post(
+        "/chatbots/bot-1/knowledge",
+        json={"content": "Jam buka toko"},
+        headers={"Authorization": "Bearer valid-token"},
+    )
+
+    assert response.status_code == 200
+    assert calls["items"] == ["bot-1"]
+
+
+def test_upload_limits(api, monkeypatch):
+    client, calls = api
+    monkeypatch.setattr(main.settings, "max_upload_size", 10)
+
+    assert post_file(client, data=b"x" * 100).status_code == 413
+    assert post_file(client, filename="virus.exe").status_code == 415
+    assert calls["submitted"] == []
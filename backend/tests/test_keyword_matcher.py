@@ -0,0 +1,78 @@
+import pytest
+
+from services.keyword_matcher import KeywordMatcher, keyword_matcher, keyword_tokens
+
+
+@pytest.fixture
+def matcher():
+    return KeywordMatcher(
+        {
+            "positive": ["suka", "sangat bagus", "bagus"],
+            "negative": ["tidak suka", "jelek"],
+            "hoax": ["promo terbatas", "terbatas", "100% gratis", "klik link"],
+        },
+        negations=["tidak", "bukan", "belum"],
+        negation_window=2,
+    )
+
+
+def phrases(matches):
+    return [match.phrase for match in matches]
+
+
+def test_tokens_keep_percentages_and_clause_punctuation():
+    assert keyword_tokens("GRATIS 100%! Klik-link") == [
+        "gratis",
+        "100%",
+        "!",
+        "klik",
+        "link",
+    ]
+
+
+def test_matches_whole_words_only(matcher):
+    assert matcher.find("Saya ikut sukarela", ["positive"]) == []
+    assert phrases(matcher.find("Saya suka, sukanya banyak", ["positive"])) == ["suka"]
+
+
+def test_leftmost_longest_match_wins(matcher):
+    assert phrases(matcher.find("Ada promo terbatas hari ini", ["hoax"])) == [
+        "promo terbatas"
+    ]
+    assert phrases(matcher.find("Hasilnya sangat bagus", ["positive"])) == [
+        "sangat bagus"
+    ]
+    # A longer phrase from another lexicon wins over a shorter one inside it
+    found = matcher.find("Aku tidak suka", ["positive", "negative"])
+    assert [(m.lexicon, m.phrase) for m in found] == [("negative", "tidak suka")]
+
+
+def test_only_requested_lexicons_are_reported(matcher):
+    text = "Bagus sekali, klik link ini"
+
+    assert phrases(matcher.find(text, ["hoax"])) == ["klik link"]
+    assert phrases(matcher.find(text, ["positive", "hoax"])) == ["bagus", "klik link"]
+
+
+def test_negation_window(matcher):
+    negated = matcher.find("Barangnya tidak terlalu bagus", ["positive"])
+    assert [m.negated for m in negated] == [True]
+
+    # Three words back is outside the window
+    far = matcher.find("Tidak ada yang bilang bagus", ["positive"])
+    assert [m.negated for m in far] == [False]
+
+    # A clause break ends the negation's scope
+    new_clause = matcher.find("Belum sampai, tapi bagus", ["positive"])
+    assert [m.negated for m in new_clause] == [False]
+
+
+def test_phrases_skip_negated_and_repeated_matches(matcher):
+    text = "Ini bukan promo terbatas. Promo terbatas! 100% gratis, promo terbatas"
+
+    assert matcher.phrases(text, "hoax") == ["promo terbatas", "100% gratis"]
+
+
+def test_bundled_lexicons_load():
+    assert keyword_matcher.lexicons.keys() >= {"hoax_indicators", "hoax_triggers"}
+    assert "tidak" in keyword_matcher.negations
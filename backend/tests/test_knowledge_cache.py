@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+from services.knowledge_cache import KnowledgeBaseCache
+from services.supabase_service import SupabaseService
+
+ROWS = [
+    {"id": "1", "content": "Jam buka 09.00-21.00", "created_at": "2024-01-01T00:00:00"}
+]
+
+
+def test_rows_are_served_until_the_version_changes():
+    cache = KnowledgeBaseCache()
+    cache.put("bot-1", ROWS, cache.version("bot-1"))
+
+    assert cache.get("bot-1") == ROWS
+    assert cache.invalidate("bot-1") == 1
+    assert cache.get("bot-1") is None
+    assert cache.get_stats()["hits"] == 1
+
+
+def test_fetch_that_raced_with_a_write_is_not_stored():
+    cache = KnowledgeBaseCache()
+    version = cache.version("bot-1")
+    cache.invalidate("bot-1")  # write lands while the rows are being fetched
+
+    cache.put("bot-1", ROWS, version)
+
+    assert cache.get("bot-1") is None
+
+
+def test_entries_expire_after_the_ttl():
+    cache = KnowledgeBaseCache(ttl=0.01)
+    cache.put("bot-1", ROWS, 0)
+
+    time.sleep(0.02)
+
+    assert cache.get("bot-1") is None
+
+
+def test_least_recently_used_chatbots_are_evicted_beyond_the_budget():
+    cache = KnowledgeBaseCache(max_bytes=400)
+    for chatbot_id in ("bot-1", "bot-2", "bot-3"):
+        cache.put(chatbot_id, ROWS, 0)
+    cache.get("bot-1")
+
+    cache.put("bot-4", ROWS, 0)
+    cache.put("bot-5", [{"content": "x" * 1000}], 0)  # over budget on its own
+
+    assert cache.get("bot-2") is None
+    assert cache.get("bot-1") == ROWS
+    assert cache.get("bot-5") is None
+    assert cache.get_stats()["bytes"] <= 400
+
+
+class Query:
+    def __init__(self, client, rows=None):
+        self.client = client
+        self.rows = rows
+
+    def eq(self, column, value):
+        return self
+
+    def execute(self):
+        if self.rows is not None:
+            self.client.rows.extend(self.rows)
+            return type("Response", (), {"data": self.rows})
+        self.client.selects += 1
+        return type("Response", (), {"data": list(self.client.rows)})
+
+
+class Client:
+    """knowledge_base table shared by every worker"""
+
+    def __init__(self):
+        self.rows = list(ROWS)
+        self.selects = 0
+
+    def table(self, name):
+        return self
+
+    def select(self, columns):
+        return Query(self)
+
+    def insert(self, rows):
+        return Query(self, rows if isinstance(rows, list) else [rows])
+
+
+def make_service(client):
+    service = SupabaseService()
+    service.supabase = service.admin_client = client
+    return service
+
+
+def test_writes_invalidate_this_workers_cache():
+    client = Client()
+    service = make_service(client)
+
+    async def scenario():
+        await service.get_knowledge_base("bot-1")
+        cached = await service.get_knowledge_base("bot-1")
+        await service.add_knowledge_item("bot-1", "Kaos polos Rp 50.000")
+        return cached, await service.get_knowledge_base("bot-1")
+
+    cached, fresh = asyncio.run(scenario())
+
+    assert cached["cached"]
+    assert len(fresh["data"]) == 2
+    assert client.selects == 2
+
+
+def test_knowledge_stamp_follows_rows_added_by_another_worker():
+    client = Client()
+    service = make_service(client)
+    other_worker = make_service(client)
+    service.knowledge_cache.ttl = 0.05
+
+    before = asyncio.run(service.get_knowledge_stamp("bot-1"))
+    asyncio.run(other_worker.add_knowledge_item("bot-1", "Kaos polos Rp 50.000"))
+    cached = asyncio.run(service.get_knowledge_stamp("bot-1"))
+    time.sleep(0.06)
+    refreshed = asyncio.run(service.get_knowledge_stamp("bot-1"))
+
+    assert cached == before
+    assert refreshed != before
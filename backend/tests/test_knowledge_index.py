@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from services.bulkhead import Bulkhead, begin_request
+from services.embeddings import HashingEmbedder
+from services.knowledge_index import KnowledgeIndexManager
+
+ROWS = [
+    {"id": "1", "content": "Jam buka toko pukul 09.00 sampai 21.00.", "source": "faq"},
+    {"id": "2", "content": "Kaos polos hitam harga Rp 50.000.", "source": "katalog"},
+    {
+        "id": "3",
+        "content": "Produk KP-250ML adalah kopi susu botol.",
+        "source": "katalog",
+    },
+]
+
+
+class KnowledgeCache:
+    def __init__(self):
+        self.versions = {}
+
+    def version(self, chatbot_id):
+        return self.versions.get(chatbot_id, 0)
+
+
+class Database:
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.knowledge_cache = KnowledgeCache()
+        self.fetches = 0
+
+    async def get_knowledge_base(self, chatbot_id):
+        self.fetches += 1
+        return {"success": True, "data": list(self.rows)}
+
+
+class SlowEmbedder(HashingEmbedder):
+    """Local embedder that takes `delay` seconds per batch"""
+
+    def __init__(self, delay):
+        super().__init__(dim=64)
+        self.delay = delay
+        self.batches = 0
+
+    async def embed(self, texts):
+        await asyncio.sleep(self.delay)
+        self.batches += 1
+        return self.embed_sync(texts)
+
+
+class RemoteEmbedder(SlowEmbedder):
+    """Slow embedder whose calls go through a provider bulkhead"""
+
+    def __init__(self, delay):
+        super().__init__(delay)
+        self.bulkhead = Bulkhead("embeddings", queue_timeout=1.0)
+
+    async def embed(self, texts):
+        await asyncio.sleep(self.delay)
+        async with self.bulkhead.slot():
+            self.batches += 1
+            return self.embed_sync(texts)
+
+
+def test_request_timeout_does_not_cancel_the_index_build():
+    database = Database(ROWS)
+    embedder = SlowEmbedder(delay=0.05)
+    manager = KnowledgeIndexManager(database, embedder)
+
+    async def scenario():
+        # The knowledge stage gives up long before the embeddings are done
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(manager.hybrid_search("kaos", "bot"), 0.01)
+
+        # Chunks are searchable by BM25 while their embeddings catch up
+        lexical = await manager.lexical_search("kaos hitam", "bot")
+        pending = manager._indexes["bot"].pending
+
+        await manager.wait_for_background_tasks()
+        return lexical, pending, manager._indexes["bot"]
+
+    lexical, pending, index = asyncio.run(scenario())
+
+    assert lexical[0]["item_id"] == "2"
+    assert pending == 3
+    assert index.pending == 0
+    assert len(index.vectors) == 3
+    assert database.fetches == 1
+
+
+def test_stale_index_is_served_while_it_syncs():
+    database = Database(ROWS[:1])
+    manager = KnowledgeIndexManager(database, SlowEmbedder(delay=0.05))
+
+    async def scenario():
+        first = await manager.sync("bot")
+        database.rows = ROWS
+        database.knowledge_cache.versions["bot"] = 1
+
+        served = await manager.get_index("bot")
+        served_chunks = len(served.chunks)
+        synced = await manager.sync("bot")
+        return first, served, served_chunks, synced
+
+    first, served, served_chunks, synced = asyncio.run(scenario())
+
+    assert served is first
+    assert served_chunks in (1, 3)  # stale, or already chunked by the running build
+    assert len(synced.chunks) == 3
+    assert synced.pending == 0
+    assert synced.version == 1
+
+
+def test_index_build_ignores_the_request_deadline():
+    manager = KnowledgeIndexManager(Database(ROWS), RemoteEmbedder(delay=0.1))
+
+    async def scenario():
+        begin_request(0.05)  # over before the first embedding batch starts
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(manager.hybrid_search("kaos", "bot"), 0.01)
+        await manager.wait_for_background_tasks()
+        return manager._indexes["bot"]
+
+    index = asyncio.run(scenario())
+
+    assert index.pending == 0
+    assert manager.embedder.bulkhead.stats["rejected"] == 0
@@ -0,0 +1,87 @@
+from services.keyword_matcher import KeywordMatcher
+from services.local_classifier import ClassificationCascade, LinearTextClassifier
+
+MATCHER = KeywordMatcher({"good": ["bagus"]}, negations=["tidak"])
+
+
+def sentiment_model():
+    return LinearTextClassifier(
+        "test-sentiment",
+        labels=["negative", "positive"],
+        bias=[0.0, 0.0],
+        weights={
+            "lex:good": [-2.0, 2.0],
+            "lex:good:negated": [2.0, -2.0],
+            "mantap": [-4.0, 4.0],
+            "kecewa": [4.0, -4.0],
+        },
+        matcher=MATCHER,
+    )
+
+
+def hoax_model():
+    return LinearTextClassifier(
+        "test-hoax",
+        labels=["not_hoax", "hoax"],
+        bias=[0.0, 0.0],
+        weights={"has_link": [-1.0, 1.0], "hadiah gratis": [-4.0, 4.0]},
+        matcher=MATCHER,
+    )
+
+
+def cascade(enabled=True):
+    return ClassificationCascade(
+        {"sentiment": sentiment_model(), "hoax": hoax_model()},
+        {"sentiment": 0.85, "hoax": 0.9},
+        enabled=enabled,
+    )
+
+
+def test_features_include_bigrams_and_negated_lexicon_hits():
+    features = sentiment_model().features("Tidak bagus, kecewa? http://x")
+
+    assert "tidak bagus" in features
+    assert "lex:good:negated" in features
+    assert "?" in features
+    assert "has_link" in features
+
+
+def test_confident_prediction_is_answered_locally():
+    classifier = cascade()
+
+    result = classifier.sentiment("Mantap sekali")
+
+    assert result["sentiment"] == "positive"
+    assert result["confidence"] >= 0.85
+    assert result["ai_tier"] == "local"
+    assert classifier.get_stats()["sentiment"]["local"] == 1
+
+
+def test_prediction_below_threshold_goes_remote():
+    classifier = cascade()
+
+    # No known feature: 0.5, below the threshold. A negated "bagus" is 0.98 negative.
+    assert classifier.sentiment("Biasa saja") is None
+    assert classifier.sentiment("Barangnya tidak bagus")["sentiment"] == "negative"
+    # A link alone is 0.88 hoax, short of the 0.9 hoax threshold
+    assert classifier.hoax("cek http://contoh.id") is None
+    assert classifier.hoax("Dapat hadiah gratis di http://contoh.id")["is_hoax"] is True
+
+    stats = classifier.get_stats()
+    assert stats["sentiment"]["remote"] == 1
+    assert stats["hoax"] == {
+        "local": 1,
+        "remote": 1,
+        "local_ratio": 0.5,
+        "threshold": 0.9,
+        "model": "test-hoax",
+    }
+
+
+def test_disabled_or_missing_model_always_goes_remote():
+    disabled = cascade(enabled=False)
+    assert disabled.sentiment("Mantap sekali") is None
+
+    missing = ClassificationCascade({"sentiment": None}, {"sentiment": 0.85})
+    assert missing.sentiment("Mantap sekali") is None
+    assert missing.get_stats()["sentiment"]["remote"] == 1
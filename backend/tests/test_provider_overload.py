@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import pytest
+
+from ai_models.huggingface_client import HuggingFaceClient
+from services.ai_service import AIService
+from services.bulkhead import Bulkhead, ProviderOverloaded, bulkheads
+from services.circuit_breaker import CircuitOpenError, circuit_breakers
+
+
+@pytest.fixture
+def full_bulkhead(monkeypatch):
+    # Provider asked to back off for longer than a call may wait: refused before sending
+    bulkhead = Bulkhead("huggingface", queue_timeout=1.0)
+    bulkhead._cooldown_until = time.monotonic() + 60
+    monkeypatch.setitem(bulkheads._bulkheads, "huggingface", bulkhead)
+    return bulkhead
+
+
+@pytest.mark.parametrize(
+    "call",
+    [
+        lambda client: client.analyze_sentiment("bagus"),
+        lambda client: client.analyze_sentiment_batch(["bagus", "jelek"]),
+        lambda client: client.detect_hoax("klik link ini"),
+        lambda client: client.detect_hoax_batch(["klik link ini"]),
+        lambda client: client.generate_chat_response("halo"),
+    ],
+)
+def test_refusals_are_raised_not_returned_as_errors(full_bulkhead, call):
+    with pytest.raises(ProviderOverloaded):
+        asyncio.run(call(HuggingFaceClient()))
+    assert full_bulkhead.stats["rejected"] >= 1
+
+
+def test_stream_waits_for_a_bulkhead_slot(full_bulkhead):
+    async def first_token():
+        async for token in HuggingFaceClient().stream_chat_response("halo"):
+            return token
+
+    with pytest.raises(ProviderOverloaded):
+        asyncio.run(first_token())
+
+
+def test_open_circuit_on_every_model_is_raised(monkeypatch):
+    async def circuit_open(model_name, payload):
+        raise CircuitOpenError(f"Circuit open for huggingface:{model_name}")
+
+    client = HuggingFaceClient()
+    monkeypatch.setattr(client, "query_model", circuit_open)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client.generate_chat_response("halo"))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client.analyze_sentiment("bagus"))
+
+
+@pytest.fixture
+def ai_service(monkeypatch):
+    """AIService routing to all three providers, with fresh breakers and bulkheads"""
+    monkeypatch.setattr(circuit_breakers, "_breakers", {})
+    monkeypatch.setattr(bulkheads, "_bulkheads", {})
+    service = AIService()
+    for name in ("replicate", "huggingface", "ibm"):
+        service.router.register(name, True, prior_latency=1.0)
+    return service
+
+
+def cool_down_every_provider():
+    for name in ("replicate", "huggingface", "ibm"):
+        bulkheads.get(name)._cooldown_until = time.monotonic() + 60
+
+
+def test_bulkhead_refusals_do_not_trip_provider_breakers(ai_service):
+    cool_down_every_provider()
+
+    for _ in range(6):
+        with pytest.raises(ProviderOverloaded):
+            asyncio.run(ai_service.generate_chat_response("halo"))
+
+    for name in ("replicate", "huggingface", "ibm"):
+        assert circuit_breakers.get(name).state == "closed"
+        assert circuit_breakers.get(name).consecutive_failures == 0
+        assert ("chat", name) not in ai_service.router._stats
+    assert bulkheads.get("ibm").stats["rejected"] == 6
+
+
+def test_open_model_circuits_skip_replicate_without_failing_it(ai_service, monkeypatch):
+    for model in (
+        ai_service.primary_client.default_model,
+        ai_service.primary_client.fallback_model,
+    ):
+        breaker = circuit_breakers.get(f"replicate:{model.split(':', 1)[0]}")
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+    answered = []
+
+    async def other_provider(message, context=None):
+        answered.append(message)
+        return {"response": "Jawaban dari penyedia lain.", "confidence": 0.8}
+
+    monkeypatch.setattr(
+        ai_service.secondary_client, "generate_chat_response", other_provider
+    )
+    ai_service.router.register("ibm", False, prior_latency=1.0)
+
+    for _ in range(6):
+        result = asyncio.run(ai_service.generate_chat_response("halo"))
+        assert result["ai_tier"] == "secondary"
+
+    assert len(answered) == 6
+    assert circuit_breakers.get("replicate").state == "closed"
+    assert circuit_breakers.get("replicate").consecutive_failures == 0
+    assert ("chat", "replicate") not in ai_service.router._stats
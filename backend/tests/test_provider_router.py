@@ -0,0 +1,99 @@
+import pytest
+
+from config import settings
+from services import provider_router as router_module
+from services.ai_service import AIService
+from services.provider_router import ProviderRouter, is_configured
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        (None,),
+        ("",),
+        ("   ",),
+        ("your_replicate_token_here",),
+        ("your-api-key",),
+        ("r8_real", "YOUR_PROJECT_ID_HERE"),
+    ],
+)
+def test_missing_or_placeholder_credentials_are_not_configured(values):
+    assert not is_configured(*values)
+
+
+def test_real_credentials_are_configured():
+    assert is_configured("r8_abc123", "project-42")
+    assert is_configured()
+
+
+def make_router(**kwargs):
+    router = ProviderRouter(**kwargs)
+    router.register("replicate", True, prior_latency=3.0)
+    router.register("huggingface", True, prior_latency=3.0)
+    router.register("ibm", False, prior_latency=1.0)
+    return router
+
+
+def test_registration_order_decides_without_data_and_unconfigured_are_skipped():
+    router = make_router()
+
+    assert router.order("chat") == ["replicate", "huggingface"]
+    assert router.order("chat", ["huggingface", "ibm"]) == ["huggingface"]
+    assert router.unconfigured() == ["ibm"]
+
+
+def test_faster_provider_moves_ahead():
+    router = make_router()
+    router.record("chat", "replicate", 4.0, True)
+    router.record("chat", "huggingface", 1.0, True)
+
+    assert router.order("chat") == ["huggingface", "replicate"]
+    assert router.order("sentiment") == ["replicate", "huggingface"]  # per operation
+
+
+def test_failures_raise_the_expected_cost():
+    router = make_router()
+    router.record("chat", "replicate", 1.0, True)
+    router.record("chat", "huggingface", 2.0, True)
+    for _ in range(3):
+        router.record("chat", "replicate", 0.0, False)
+
+    assert router.success_rate("chat", "replicate") == 0.25
+    assert router.expected_cost("chat", "replicate") == pytest.approx(4.0)
+    assert router.order("chat") == ["huggingface", "replicate"]
+
+
+def test_latency_is_an_ewma_of_successful_calls():
+    router = make_router(alpha=0.5)
+    router.record("chat", "replicate", 2.0, True)
+    router.record("chat", "replicate", 4.0, True)
+
+    assert router.expected_cost("chat", "replicate") == pytest.approx(3.0)
+
+
+def test_provider_without_recent_samples_falls_back_to_its_prior(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(router_module.time, "monotonic", lambda: now[0])
+    router = make_router(recovery_after=60.0)
+    for _ in range(5):
+        router.record("chat", "replicate", 0.0, False)
+    router.record("chat", "huggingface", 5.0, True)
+    assert router.order("chat") == ["huggingface", "replicate"]
+
+    now[0] += 61.0  # replicate may have recovered; so may huggingface's latency
+
+    assert router.expected_cost("chat", "replicate") == 3.0
+    assert router.order("chat") == ["replicate", "huggingface"]
+
+
+def test_ai_service_does_not_route_to_placeholder_credentials(monkeypatch):
+    monkeypatch.setattr(
+        settings, "replicate_api_token", "your_replicate_api_token_here"
+    )
+    monkeypatch.setattr(settings, "huggingface_api_token", "hf_real_token")
+    monkeypatch.setattr(settings, "ibm_orchestrate_api_key", "")
+
+    service = AIService()
+
+    assert service.router.order("chat") == ["huggingface"]
+    assert set(service.router.unconfigured()) == {"Replicate", "IBM Orchestrate"}
@@ -0,0 +1,51 @@
+import base64
+import hashlib
+import hmac
+import time
+
+from ai_models.replicate_predictions import ReplicatePredictionManager
+
+SECRET = "whsec_" + base64.b64encode(b"test-signing-key").decode("utf-8")
+
+
+def signed_headers(body: bytes, secret: str = SECRET, timestamp: int = None):
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    key = base64.b64decode(secret.split("_", 1)[-1])
+    signed = f"msg_1.{timestamp}.".encode("utf-8") + body
+    signature = base64.b64encode(hmac.new(key, signed, hashlib.sha256).digest())
+    return {
+        "webhook-id": "msg_1",
+        "webhook-timestamp": str(timestamp),
+        "webhook-signature": "v1," + signature.decode("utf-8"),
+    }
+
+
+def test_sync_wait_stays_below_call_timeout():
+    manager = ReplicatePredictionManager("token", sync_wait=30, call_timeout=15.0)
+    assert manager.sync_wait < 15.0
+
+
+def test_sync_wait_kept_when_it_fits():
+    manager = ReplicatePredictionManager("token", sync_wait=5, call_timeout=15.0)
+    assert manager.sync_wait == 5
+
+
+def test_webhook_needs_a_secret():
+    manager = ReplicatePredictionManager(
+        "token", webhook_url="https://example.com/hook"
+    )
+    body = b'{"id": "p1", "status": "succeeded"}'
+
+    assert manager.webhook_url == ""
+    assert not manager.verify_webhook({}, body)
+
+
+def test_webhook_signature():
+    manager = ReplicatePredictionManager(
+        "token", webhook_url="https://example.com/hook", webhook_secret=SECRET
+    )
+    body = b'{"id": "p1", "status": "succeeded"}'
+
+    assert manager.verify_webhook(signed_headers(body), body)
+    assert not manager.verify_webhook(signed_headers(body), body + b" ")
+    assert not manager.verify_webhook(signed_headers(body, timestamp=0), body)
@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import pytest
+
+from services.response_cache import (
+    MemoryResponseBackend,
+    ResponseCache,
+    SQLiteResponseBackend,
+)
+
+ANSWER = {"response": "Buka pukul 09.00", "confidence": 0.9}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteResponseBackend(str(tmp_path / "responses.sqlite3"))
+    return MemoryResponseBackend()
+
+
+def test_key_normalizes_the_message_but_separates_everything_else():
+    cache = ResponseCache(MemoryResponseBackend())
+    key = cache.key("bot-1", "Jam buka toko?", "Jam buka 09.00", "model-a")
+
+    assert cache.key("bot-1", "  jam BUKA toko? ", "Jam buka 09.00", "model-a") == key
+    assert cache.key("bot-2", "Jam buka toko?", "Jam buka 09.00", "model-a") != key
+    assert cache.key("bot-1", "Jam tutup toko?", "Jam buka 09.00", "model-a") != key
+    assert cache.key("bot-1", "Jam buka toko?", "Jam buka 10.00", "model-a") != key
+    assert cache.key("bot-1", "Jam buka toko?", "Jam buka 09.00", "model-b") != key
+    assert cache.key("bot-1", "Jam buka toko?", "", "model-a") != key
+
+
+def test_answers_round_trip_and_invalidate_per_chatbot(backend):
+    cache = ResponseCache(backend)
+
+    async def scenario():
+        await cache.put("bot-1", "k1", ANSWER)
+        await cache.put("bot-2", "k2", ANSWER)
+        hit = await cache.get("bot-1", "k1")
+        await cache.invalidate("bot-1")
+        return hit, await cache.get("bot-1", "k1"), await cache.get("bot-2", "k2")
+
+    hit, invalidated, other = asyncio.run(scenario())
+
+    assert hit == ANSWER
+    assert invalidated is None
+    assert other == ANSWER
+    assert cache.get_stats()["hit_ratio"] == pytest.approx(2 / 3, abs=0.001)
+
+
+def test_entries_expire_after_the_chatbot_ttl(backend):
+    cache = ResponseCache(backend, default_ttl=60.0, ttl_overrides={"bot-fast": 0.01})
+
+    async def scenario():
+        await cache.put("bot-fast", "k1", ANSWER)
+        await cache.put("bot-1", "k2", ANSWER)
+        await asyncio.sleep(0.02)
+        return await cache.get("bot-fast", "k1"), await cache.get("bot-1", "k2")
+
+    assert asyncio.run(scenario()) == (None, ANSWER)
+
+
+def test_zero_ttl_disables_caching_for_a_chatbot():
+    cache = ResponseCache(MemoryResponseBackend())
+    cache.set_ttl("bot-1", 0)
+
+    async def scenario():
+        await cache.put("bot-1", "k1", ANSWER)
+        return await cache.get("bot-1", "k1")
+
+    assert asyncio.run(scenario()) is None
+    assert cache.stats["stores"] == 0
+
+
+def test_least_recently_used_answers_are_evicted_beyond_the_budget(backend):
+    backend.max_bytes = 150
+    cache = ResponseCache(backend)
+
+    async def scenario():
+        for key in ("k1", "k2"):
+            await cache.put("bot-1", key, ANSWER)
+            time.sleep(0.001)  # distinct access times for the sqlite backend
+        await cache.get("bot-1", "k1")
+        time.sleep(0.001)
+        await cache.put(
+            "bot-1", "k3", ANSWER
+        )  # over budget: k2 is the least recently used
+        return [await cache.get("bot-1", key) for key in ("k1", "k2", "k3")]
+
+    assert asyncio.run(scenario()) == [ANSWER, None, ANSWER]
+    assert backend.get_stats()["bytes"] <= 150
+
+
+def test_sqlite_backend_is_shared_by_workers_on_the_host(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    worker_a = ResponseCache(SQLiteResponseBackend(path))
+    worker_b = ResponseCache(SQLiteResponseBackend(path))
+
+    asyncio.run(worker_a.put("bot-1", "k1", ANSWER))
+
+    assert asyncio.run(worker_b.get("bot-1", "k1")) == ANSWER
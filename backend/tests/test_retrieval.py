@@ -0,0 +1,25 @@
+from services.retrieval_fusion import reciprocal_rank_fusion, select_passages
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[3, 1, 2], [1, 4]], k=60)
+
+    assert [doc_id for doc_id, _ in fused] == [1, 3, 4, 2]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+
+
+def test_select_passages_drops_duplicates_and_keeps_limit():
+    chunks = [
+        {"content": "Jam buka toko pukul 09.00 sampai 21.00."},
+        {"content": "jam buka  toko pukul 09.00 sampai 21.00."},  # same text
+        {"content": "Jam buka toko pukul 09.00 sampai 21.00 setiap hari."},  # near copy
+        {"content": "Pengiriman memakai kurir JNE."},
+        {"content": "Kaos polos hitam."},
+    ]
+    fused = reciprocal_rank_fusion([[0, 1, 2, 3, 4]])
+
+    selected = select_passages("jam buka toko", fused, chunks, limit=2)
+    assert [doc_id for doc_id, _ in selected] == [0, 3]
+
+    without_rerank = select_passages("jam buka", fused, chunks, limit=5, rerank=False)
+    assert [doc_id for doc_id, _ in without_rerank] == [0, 2, 3, 4]
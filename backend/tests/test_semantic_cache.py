@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from services.embeddings import HashingEmbedder
+from services.semantic_cache import SemanticCache, question_guard
+
+NEAR_MISSES = [
+    (
+        "apakah toko buka hari libur nasional tanggal 17",
+        "apakah toko buka hari libur nasional tanggal 25",
+    ),
+    (
+        "bagaimana cara mengembalikan barang rusak",
+        "bagaimana cara mengembalikan barang tidak rusak",
+    ),
+    ("stok kaos hitam ukuran xl masih ada", "stok kaos hitam ukuran s masih ada"),
+]
+
+
+def make_cache(**kwargs):
+    return SemanticCache(HashingEmbedder(dim=256), **kwargs)
+
+
+def remember(cache, question, answer):
+    response = {"response": answer}
+    asyncio.run(cache.store("bot", question, response, latency=1.0))
+
+
+@pytest.mark.parametrize("stored, asked", NEAR_MISSES)
+def test_near_miss_questions_do_not_share_answers(stored, asked):
+    # Low threshold: only the guard can keep these apart
+    cache = make_cache(threshold=0.5)
+    remember(cache, stored, "jawaban lama")
+
+    assert asyncio.run(cache.lookup("bot", asked)) is None
+    assert cache.get_stats()["guard_rejections"] == 1
+
+
+@pytest.mark.parametrize("stored, asked", NEAR_MISSES)
+def test_guards_differ_for_near_misses(stored, asked):
+    assert question_guard(stored) != question_guard(asked)
+
+
+def test_rephrased_question_hits():
+    cache = make_cache()
+    remember(cache, "Berapa harganya kak?", "Rp 50.000")
+
+    hit = asyncio.run(cache.lookup("bot", "harga berapa ya"))
+
+    assert hit["response"] == "Rp 50.000"
+    assert hit["semantic_score"] >= cache.threshold
+
+
+def test_guard_picks_candidate_with_matching_numbers():
+    cache = make_cache(threshold=0.5)
+    remember(cache, "buka tanggal 17", "tutup")
+    remember(cache, "buka tanggal 25", "buka")
+
+    assert (
+        asyncio.run(cache.lookup("bot", "apakah buka tanggal 25"))["response"] == "buka"
+    )
+
+
+def test_knowledge_version_change_invalidates():
+    cache = make_cache()
+    asyncio.run(
+        cache.store("bot", "jam buka toko", {"response": "09.00"}, 1.0, version=1)
+    )
+
+    assert asyncio.run(cache.lookup("bot", "jam buka toko", version=2)) is None
+    assert cache.get_stats()["invalidations"] == 1
+
+
+def test_question_guard_normalizes_prices():
+    assert question_guard("harga Rp 18.000?") == question_guard("harga 18000")
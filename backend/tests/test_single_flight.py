@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight, flight_key
+
+
+def test_flight_key_normalizes_case_and_whitespace():
+    assert flight_key("chat", "Berapa  Harga?", "bot") == flight_key(
+        "chat", "berapa harga?", "bot"
+    )
+    assert flight_key("chat", "harga", "bot") != flight_key("chat", "harga", "other")
+    assert flight_key("chat", "harga", "bot", "ctx a") != flight_key(
+        "chat", "harga", "bot", "ctx b"
+    )
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"response": "jawaban"}
+
+    async def scenario():
+        return await asyncio.gather(*(flights.do("key", upstream) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert all(result == {"response": "jawaban"} for result in results)
+    # Each caller gets its own copy to annotate
+    assert len({id(result) for result in results}) == 5
+    assert flights.get_stats() == {
+        "calls": 5,
+        "upstream": 1,
+        "coalesced": 4,
+        "in_flight": 0,
+    }
+
+
+def test_exception_is_shared_by_every_caller():
+    flights = SingleFlight()
+
+    async def upstream():
+        await asyncio.sleep(0.01)
+        raise ValueError("provider error")
+
+    async def scenario():
+        return await asyncio.gather(
+            *(flights.do("key", upstream) for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flights.stats["upstream"] == 1
+
+
+def test_one_caller_cancelling_leaves_the_call_running():
+    flights = SingleFlight()
+    finished = []
+
+    async def upstream():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+        return "done"
+
+    async def scenario():
+        impatient = asyncio.create_task(flights.do("key", upstream))
+        patient = asyncio.create_task(flights.do("key", upstream))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(scenario()) == "done"
+    assert finished == [1]
+
+
+def test_call_is_cancelled_once_every_caller_gave_up():
+    flights = SingleFlight()
+    cancelled = []
+
+    async def upstream():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(flights.do("key", upstream), 0.01)
+        await asyncio.sleep(0)
+        return flights.get_stats()["in_flight"]
+
+    assert asyncio.run(scenario()) == 0
+    assert cancelled == [1]
+
+
+def test_later_call_after_completion_starts_fresh():
+    flights = SingleFlight()
+
+    async def upstream():
+        return "value"
+
+    async def scenario():
+        await flights.do("key", upstream)
+        await flights.do("key", upstream)
+
+    asyncio.run(scenario())
+    assert flights.stats["upstream"] == 2
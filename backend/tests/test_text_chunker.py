@@ -0,0 +1,65 @@
+from services.text_chunker import (
+    chunk_text,
+    estimate_tokens,
+    iter_chunks,
+    iter_sentences,
+)
+
+
+def sentences(count):
+    return " ".join(f"Kalimat nomor {i} berisi beberapa kata." for i in range(count))
+
+
+def test_abbreviations_do_not_end_sentences():
+    text = "Hubungi Bpk. Budi di Jl. Merdeka no. 5. Terima kasih!"
+    assert [sentence for sentence, _ in iter_sentences([text])] == [
+        "Hubungi Bpk. Budi di Jl. Merdeka no. 5.",
+        "Terima kasih!",
+    ]
+
+
+def test_sentence_split_across_stream_pieces_is_rejoined():
+    chunks = list(iter_chunks(["Versi 3.", "5 sudah rilis. Kalimat lain."], 400))
+    assert chunks == ["Versi 3.5 sudah rilis. Kalimat lain."]
+
+
+def test_chunks_hold_whole_sentences_within_target():
+    chunks = chunk_text(sentences(30), target_tokens=40, overlap_tokens=0)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert estimate_tokens(chunk) <= 40
+        assert chunk.startswith("Kalimat") and chunk.endswith("kata.")
+
+
+def test_consecutive_chunks_overlap_by_trailing_sentences():
+    chunks = chunk_text(sentences(30), target_tokens=40, overlap_tokens=10)
+
+    for previous, following in zip(chunks, chunks[1:]):
+        last_sentence = previous.rsplit("Kalimat", 1)[1]
+        assert following.startswith("Kalimat" + last_sentence)
+
+
+def test_paragraph_break_ends_a_half_full_chunk():
+    first = "Paragraf satu kalimat pertama. Kalimat kedua."
+    text = first + "\n\nParagraf dua."
+
+    assert chunk_text(text, target_tokens=20, overlap_tokens=0) == [
+        first,
+        "Paragraf dua.",
+    ]
+    # Below half full, short paragraphs are packed together
+    assert chunk_text(text, target_tokens=400) == [first + "\n\nParagraf dua."]
+
+
+def test_overlong_sentence_is_split_at_words():
+    chunks = chunk_text("kata " * 100, target_tokens=30, overlap_tokens=0)
+
+    assert len(chunks) == 4
+    assert all(estimate_tokens(chunk) <= 30 for chunk in chunks)
+    assert " ".join(chunks).split() == ["kata"] * 100
+
+
+def test_empty_text_has_no_chunks():
+    assert chunk_text("") == []
+    assert chunk_text(" \n\n ") == []